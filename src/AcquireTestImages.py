@@ -1,12 +1,14 @@
 import argparse
-import configparser
 import os
 import sys
+import time
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
 import logger
 import numpy as np
 
+from rig_config import load_rig_config
+
 if not __name__ == "__main__":
 	import traceback
 
@@ -22,18 +24,10 @@ def parseConfigFile(config_path):
 	# Outputs:
 	# config_dict - dictionary with new configurations
 
-	# create config parser and read config file
-	config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-	config.read(config_path)
-	p_config = config['ref-calib-images']
-
-	range_min = p_config.getint('RangeMin')
-	zC = p_config.getint('zC')
-	step_dist = p_config.getint('StepDist')
-	range_max = zC + range_min
-	total_steps = int(np.abs(zC / step_dist)) + 1
+	# read the compiled config file
+	p_config = load_rig_config(config_path).calib['ref-calib-images']
 
-	return range_min, range_max, total_steps, np.abs(zC), np.abs(step_dist)
+	return p_config.range_min, p_config.range_max, p_config.total_steps, np.abs(p_config.zc)
 
 
 if __name__ == '__main__':
@@ -43,25 +37,48 @@ if __name__ == '__main__':
 	                    type=str, default="1")
 	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
 	                    default="cpp")
+	parser.add_argument('--legacy', help='initialize the cameras from scratch for every position (for comparing '
+	                    'capture latency with the default persistent camera session)', action='store_true')
 	args = parser.parse_args()
 	config_path = args.config_file
 	log = logger.getLogger(__file__, args.verbosity, args.logType)
 
 	import MultiCamAcq
+	from camera_session import CameraSession
+
+	range_min, range_max, total_steps, zC = parseConfigFile(config_path)
 
-	config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-	config.read(config_path)
-	range_min, range_max, total_steps, zC, step_dist = parseConfigFile(config_path)
+	session = None
+	if not args.legacy:
+		session = CameraSession()
+		if not session.open():
+			sys.exit(1)
 
+	latencies = []
 	digits = np.floor(np.log10(zC) + 1)
-	for position, image_num in zip(np.linspace(range_min, range_max, total_steps), range(0, zC + step_dist, step_dist)):
-		position /= 10
-		print('-------------------------------------------')
-		print('Ready to capture image {:0{}f} at {}cm.'.format(image_num, digits, position))
-		input('Please position your target at {}cm. Then, press Enter to acquire frames.'.format(position))
-		result = MultiCamAcq.main(num_frames=1, folder='{:0{}f}'.format(image_num, digits))
-		print('Captured!' if result else "Couldn't capture images for position {}cm.".format(position))
+	try:
+		for position, image_num in zip(np.linspace(range_min, range_max, total_steps),
+		                               np.rint(np.linspace(0, zC, total_steps)).astype(int)):
+			position /= 10
+			print('-------------------------------------------')
+			print('Ready to capture image {:0{}f} at {}cm.'.format(image_num, digits, position))
+			input('Please position your target at {}cm. Then, press Enter to acquire frames.'.format(position))
+			start = time.perf_counter()
+			if session is None:
+				result = MultiCamAcq.main(num_frames=1, folder='{:0{}f}'.format(image_num, digits))
+			else:
+				result = session.capture(num_frames=1, folder='{:0{}f}'.format(image_num, digits))
+			latencies += [time.perf_counter() - start]
+			print('Captured in {:.3f} s!'.format(latencies[-1]) if result
+			      else "Couldn't capture images for position {}cm.".format(position))
+	finally:
+		if session is not None:
+			session.close()
 	print('-------------------------------------------')
+	if latencies:
+		print('Capture latency ({}): mean {:.3f} s, max {:.3f} s over {} positions'.format(
+			'per-position initialization' if args.legacy else 'persistent session', np.mean(latencies),
+			np.max(latencies), len(latencies)))
 	print('Finished!')
 
 # if main():
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from camera_backend import FakeBackend, PySpinBackend, Recorder, raw_capture_path, FAKE_CAMERAS
+from daemon_client import DEFAULT_SOCKET, daemon_request
+from frame_ring import RING_SLOTS
+from timestamp_file import save_timestamps
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+MAX_FRAMES = 1000  # frames per camera preallocated for recordings without a frame count
+
+
+class Daemon:
+	"""
+	Serializes commands from any number of clients onto one camera backend.
+	Each command is a method named do_<command> returning a dict of results;
+	invalid requests raise ValueError. Any error fails only its request.
+	"""
+
+	def __init__(self, backend, max_frames=MAX_FRAMES):
+		"""
+		:param backend: Opened camera backend
+		:param max_frames: Frames per camera preallocated for recordings without a frame count
+		"""
+		self.backend = backend
+		self.max_frames = max_frames
+		self.lock = threading.Lock()
+		self.recorder = None
+		self.capture_num = -1
+		self.server = None
+		self.started = time.time()
+		self.counts = {'settings': 0, 'captures': 0, 'recordings': 0, 'errors': 0}
+		self.last_recording = None
+
+	def handle(self, request):
+		"""
+		Runs one request.
+
+		:param request: Decoded request, with 'command', the client's 'cwd' and the command's parameters
+		:type request: dict
+		:return: Response
+		:rtype: dict
+		"""
+		params = dict(request)
+		command = params.pop('command', None)
+		cwd = params.pop('cwd', None)
+		handler = getattr(self, 'do_{}'.format(command), None)
+		if handler is None:
+			return {'ok': False, 'error': 'Unknown command {}'.format(command)}
+
+		start = time.perf_counter()
+		try:
+			with self.lock:
+				if cwd is not None:
+					os.chdir(cwd)
+				response = handler(**params)
+		except (TypeError, ValueError, RuntimeError, OSError) as ex:
+			log.error('Error: %s' % ex)
+			self.counts['errors'] += 1
+			return {'ok': False, 'error': str(ex)}
+		except Exception as ex:
+			# e.g. a SpinnakerException from the cameras; the daemon keeps serving
+			log.exception('Unexpected error in {}: {!r}'.format(command, ex))
+			self.counts['errors'] += 1
+			return {'ok': False, 'error': repr(ex)}
+
+		response.setdefault('ok', True)
+		response['elapsed'] = time.perf_counter() - start
+		log.VLOG(2, '{} finished in {:.3f} s'.format(command, response['elapsed']))
+		return response
+
+	def do_ping(self):
+		return {}
+
+	def do_settings(self, config_file, diff=False):
+		if self.recorder is not None:
+			raise RuntimeError('Cannot change settings while recording')
+		self.counts['settings'] += 1
+		return {'ok': self.backend.apply_settings(config_file, diff)}
+
+	def do_capture(self, num_frames=1, folder=None, output='jpg'):
+		if self.recorder is not None:
+			raise RuntimeError('Cannot capture while recording')
+		self.counts['captures'] += 1
+		return {'ok': self.backend.capture(num_frames, folder, output)}
+
+	def do_start(self, num_frames=-1):
+		"""
+		Starts recording every camera to a raw capture. Recordings with a frame
+		count go to MultiCamAcqTest/<num_frames>/, like MultiCamAcqSync's.
+		"""
+		if self.recorder is not None:
+			raise RuntimeError('Already recording')
+		self.capture_num = num_frames
+		folder = str(num_frames) if num_frames > 0 else None
+		self.recorder = Recorder(self.backend, os.path.abspath(raw_capture_path(folder)),
+		                         num_frames if num_frames > 0 else self.max_frames)
+		self.recorder.start()
+		self.counts['recordings'] += 1
+		return {'path': self.recorder.path}
+
+	def do_stop(self, wait=False):
+		"""
+		Stops the recording (after all its frames were recorded, if wait is
+		set) and saves its timestamps.
+		"""
+		if self.recorder is None:
+			raise RuntimeError('Not recording')
+		try:
+			if wait:
+				self.recorder.wait()
+
+			timestamps = self.recorder.stop()
+			self.last_recording = {'path': self.recorder.path,
+			                       'frames': self.recorder.stats['frames'],
+			                       'dropped': self.recorder.stats['dropped'],
+			                       'incomplete': self.recorder.stats['incomplete'],
+			                       'errors': self.recorder.stats['errors']}
+		finally:
+			# a failed stop must not leave the daemon recording for good
+			self.recorder = None
+
+		primary_index = self.backend.serials.index(self.backend.primary_id) \
+			if self.backend.primary_id in self.backend.serials else -1
+		if min(len(times) for times in timestamps) == 0:
+			raise RuntimeError('Could not record any frames from at least one camera')
+
+		self.last_recording['timestamps'] = save_timestamps(timestamps, self.backend.serials, primary_index,
+		                                                  self.capture_num)
+		return dict(self.last_recording)
+
+	def do_stats(self):
+		return {'backend': self.backend.name,
+		        'serials': self.backend.serials,
+		        'layouts': self.backend.layouts,
+		        'uptime': time.time() - self.started,
+		        'counts': self.counts,
+		        'recording': None if self.recorder is None else {'path': self.recorder.path,
+		                                                         'frames': self.recorder.stats['frames'],
+		                                                         'dropped': self.recorder.stats['dropped']},
+		        'last_recording': self.last_recording}
+
+	def do_shutdown(self):
+		if self.recorder is not None:
+			self.recorder.stop()
+			self.recorder = None
+		# shutdown() blocks until serve_forever() returns, so it can't run on a request thread
+		threading.Thread(target=self.server.shutdown).start()
+		return {}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+	"""
+	Answers each line of JSON on a connection with one line of JSON.
+	"""
+
+	def handle(self):
+		for line in self.rfile:
+			try:
+				request = json.loads(line)
+			except ValueError as ex:
+				response = {'ok': False, 'error': 'Invalid request: {}'.format(ex)}
+			else:
+				response = self.server.camera_daemon.handle(request)
+			self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+def main(socket_path=DEFAULT_SOCKET, backend='pyspin', config_path=None, num_cameras=FAKE_CAMERAS, writers=0,
+         ring_slots=RING_SLOTS, overwrite=False, max_frames=MAX_FRAMES):
+	"""
+	Opens the cameras once and serves commands until a shutdown command is received.
+
+	:param socket_path: Path of the Unix socket to listen on
+	:param backend: pyspin or fake
+	:param config_path: Settings config file to apply at startup
+	:param num_cameras: Number of cameras of the fake backend
+	:param writers: Number of image writer processes (0 saves inline)
+	:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+	:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+	:param max_frames: Frames per camera preallocated for recordings without a frame count
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	if backend == 'fake':
+		cameras = FakeBackend(num_cameras)
+	else:
+		cameras = PySpinBackend(writers, ring_slots, overwrite)
+
+	start = time.perf_counter()
+	if not cameras.open():
+		cameras.close()
+		return False
+
+	result = True
+	if config_path is not None:
+		result &= cameras.apply_settings(config_path)
+	log.VLOG(1, 'Cameras ready in {:.3f} s'.format(time.perf_counter() - start))
+
+	if os.path.exists(socket_path):
+		os.remove(socket_path)
+
+	daemon = Daemon(cameras, max_frames)
+	try:
+		with socketserver.ThreadingUnixStreamServer(socket_path, RequestHandler) as server:
+			server.daemon_threads = True
+			server.camera_daemon = daemon
+			daemon.server = server
+			log.VLOG(1, 'Listening on %s' % socket_path)
+			server.serve_forever()
+	finally:
+		if daemon.recorder is not None:
+			daemon.recorder.stop()
+		if os.path.exists(socket_path):
+			os.remove(socket_path)
+		result &= cameras.close()
+
+	log.info('Done!')
+	return result
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-s', '--socket', help='path of the control socket', type=str, default=DEFAULT_SOCKET)
+	parser.add_argument('-b', '--backend', help='pyspin (default): real cameras, fake: synthetic cameras for '
+	                    'testing without hardware', choices=['pyspin', 'fake'], default='pyspin')
+	parser.add_argument('-n', '--num_cameras', help='number of fake cameras', type=int, default=FAKE_CAMERAS)
+	parser.add_argument('-c', '--config_file', help='relative path to a settings config file to apply at startup',
+	                    type=str)
+	parser.add_argument('-w', '--writers', help='number of image writer processes (0 (default) saves inline)', type=int,
+	                    default=0)
+	parser.add_argument('-r', '--ring_slots', help='number of shared-memory frame slots between the grab threads and '
+	                    'the image writers (0 pickles frames instead)', type=int, default=RING_SLOTS)
+	parser.add_argument('-o', '--overwrite', help='overwrite the oldest unsaved frame instead of dropping new frames '
+	                    'when the frame ring is full', action='store_true')
+	parser.add_argument('-m', '--max_frames', help='frames per camera preallocated for recordings without a frame '
+	                    'count', type=int, default=MAX_FRAMES)
+	parser.add_argument('-q', '--query', help='send a command to a running daemon and print its response instead '
+	                    'of starting one', choices=['ping', 'stats', 'shutdown'])
+	parser.add_argument('-v', '--verbosity', help='verbosity level for file prints (1 through 4 or DEBUG, INFO, etc.)',
+	                    type=str, default="1")
+	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
+	                    default="cpp")
+	args = parser.parse_args()
+	log = logger.getLogger(__file__, args.verbosity, args.logType)
+
+	if args.query is not None:
+		response = daemon_request(args.query, args.socket)
+		print(json.dumps(response, indent=2))
+		sys.exit(0 if response['ok'] else 1)
+
+	if main(args.socket, args.backend, args.config_file, args.num_cameras, args.writers, args.ring_slots,
+	        args.overwrite, args.max_frames):
+		sys.exit(0)
+	else:
+		sys.exit(1)
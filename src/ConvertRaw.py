@@ -0,0 +1,126 @@
+import argparse
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from image_writer import write_image
+from pixel_convert import convert
+from raw_capture import RawCaptureReader, STATUS_COMPLETE
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+BATCH_SIZE = 16  # frames converted together by one worker
+
+_readers = {}  # raw captures opened by this worker process, by path
+
+
+def convert_batch(path, records, mode, image_format, output_dir, digits):
+	"""
+	Worker function which converts a batch of one camera's frames and writes
+	them as images.
+
+	:param path: Base path of the raw capture
+	:param records: Index records of the frames (all from the same camera)
+	:param mode: mono8 or rgb8
+	:param image_format: Image file extension (jpg, png, tiff, ...)
+	:param output_dir: Folder to write images to
+	:param digits: Zero padding for frame numbers
+	:return: Number of images written
+	:rtype: int
+	"""
+	if path not in _readers:
+		_readers[path] = RawCaptureReader(path)
+	reader = _readers[path]
+
+	serial = reader.index['serial'][records[0]].decode()
+	camera = reader.header['cameras'][reader.serials.index(serial)]
+	frames = np.stack([reader.frame(record) for record in records])
+	converted = convert(frames, camera['pixel_format'], camera['width'], camera['height'], mode)
+
+	for record, image in zip(records, converted):
+		entry = reader.index[record]
+		image_file = os.path.join(output_dir, 'MCAT-{}-{:0{}f}-{}.{}'.format(
+			serial, entry['frame'], digits, entry['timestamp'], image_format))
+		write_image(image, image_file)
+
+	return len(records)
+
+
+def main(path, mode='mono8', image_format='jpg', output_dir=None, workers=None, batch_size=BATCH_SIZE):
+	"""
+	Converts every complete frame of a raw capture to an image sequence.
+
+	:param path: Base path of the raw capture (without extension)
+	:param mode: mono8 or rgb8
+	:param image_format: Image file extension (jpg, png, tiff, ...)
+	:param output_dir: Folder to write images to (defaults to the capture's folder)
+	:param workers: Number of conversion processes (defaults to the number of cores)
+	:param batch_size: Frames converted together by one worker
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	reader = RawCaptureReader(path)
+	if output_dir is None:
+		output_dir = os.path.dirname(path)
+	os.makedirs(output_dir, exist_ok=True)
+
+	complete = reader.index['status'] == STATUS_COMPLETE
+	log.VLOG(1, 'Converting {} frames ({} incomplete frames skipped) from {} to {} {}'.format(
+		np.count_nonzero(complete), len(reader) - np.count_nonzero(complete), path, mode, image_format))
+	digits = np.floor(np.log10(reader.index['frame'].max(initial=0) + 1) + 1)
+
+	batches = []
+	for serial in reader.serials:
+		records = reader.records(serial)
+		records = records[complete[records]]
+		batches += [records[i:i + batch_size].tolist() for i in range(0, len(records), batch_size)]
+
+	result = True
+	written = 0
+	with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+		futures = [pool.submit(convert_batch, path, records, mode, image_format, output_dir, digits)
+		           for records in batches]
+		for future in futures:
+			try:
+				written += future.result()
+			except Exception as ex:
+				log.error('Error: %s' % ex)
+				result = False
+
+	log.VLOG(1, 'Wrote {} images to {}'.format(written, output_dir))
+	return result
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help='base path of the raw capture (without extension)', type=str,
+	                    default='MultiCamAcqTest/MCAT')
+	parser.add_argument('-o', '--output_dir', help='folder to write images to (defaults to the capture\'s folder)',
+	                    type=str)
+	parser.add_argument('-m', '--mode', help='output pixel format', choices=['mono8', 'rgb8'], default='mono8')
+	parser.add_argument('-f', '--format', help='image file format', choices=['jpg', 'png', 'tiff'], default='jpg')
+	parser.add_argument('-w', '--workers', help='number of conversion processes (defaults to the number of cores)',
+	                    type=int)
+	parser.add_argument('-b', '--batch_size', help='frames converted together by one process', type=int,
+	                    default=BATCH_SIZE)
+	parser.add_argument('-v', '--verbosity', help='verbosity level for file prints (1 through 4 or DEBUG, INFO, etc.)',
+	                    type=str, default="1")
+	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
+	                    default="cpp")
+	args = parser.parse_args()
+	log = logger.getLogger(__file__, args.verbosity, args.logType)
+
+	if main(args.input, args.mode, args.format, args.output_dir, args.workers, args.batch_size):
+		sys.exit(0)
+	else:
+		sys.exit(1)
@@ -26,6 +26,8 @@ import datetime as dt
 import sys
 import os
 import argparse
+import queue
+import threading
 import PySpin
 import numpy as np
 
@@ -33,6 +35,11 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
 import logger
 
 from SetSettings import log_device_info
+from daemon_client import DEFAULT_SOCKET, daemon_request
+from image_writer import ImageWriter
+from frame_ring import RING_SLOTS
+from raw_capture import RawCaptureWriter, STATUS_COMPLETE, STATUS_INCOMPLETE
+from link_budget import check_link_budget
 
 if not __name__ == "__main__":
 	import traceback
@@ -40,6 +47,41 @@ if not __name__ == "__main__":
 	log = logger.getLogger(filename.split('"')[1], False, False)
 
 NUM_IMAGES = 1  # number of images to grab
+QUEUE_SIZE = 16  # number of frames buffered per camera between its grab and save threads
+BUFFER_HEADROOM = 4  # driver buffers per camera beyond QUEUE_SIZE, for the frames being grabbed and saved
+
+def set_stream_buffer_count(i, cam, count):
+	"""
+	This function raises the number of driver buffers a camera streams into.
+	Queued images are unreleased driver buffers, so the stream needs at least
+	as many buffers as can be queued, plus some to keep receiving into.
+
+	:param i: Camera index
+	:param cam: Camera
+	:param count: Number of buffers (capped at the camera's maximum; a larger count is kept)
+	:type cam: CameraPtr
+	:type count: int
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	nodemap = cam.GetTLStreamNodeMap()
+	node_count_mode = PySpin.CEnumerationPtr(nodemap.GetNode('StreamBufferCountMode'))
+	if PySpin.IsAvailable(node_count_mode) and PySpin.IsWritable(node_count_mode):
+		node_count_manual = node_count_mode.GetEntryByName('Manual')
+		if PySpin.IsAvailable(node_count_manual) and PySpin.IsReadable(node_count_manual):
+			node_count_mode.SetIntValue(node_count_manual.GetValue())
+
+	node_count = PySpin.CIntegerPtr(nodemap.GetNode('StreamBufferCountManual'))
+	if not PySpin.IsAvailable(node_count) or not PySpin.IsWritable(node_count):
+		log.warning('Unable to set stream buffer count (node retrieval; camera %d).' % i)
+		return False
+
+	count = min(count, node_count.GetMax())
+	if node_count.GetValue() < count:
+		node_count.SetValue(count)
+		log.VLOG(2, 'Camera %d stream buffer count set to %d...' % (i, count))
+	return True
+
 
 def prepare_camera(i, cam):
 	# Set acquisition mode to continuous
@@ -61,6 +103,8 @@ def prepare_camera(i, cam):
 
 	log.VLOG(2, 'Camera %d acquisition mode set to continuous...' % i)
 
+	set_stream_buffer_count(i, cam, QUEUE_SIZE + BUFFER_HEADROOM)
+
 	# Begin acquiring images
 	cam.BeginAcquisition()
 
@@ -69,119 +113,495 @@ def prepare_camera(i, cam):
 	return True
 
 
-def acquire_images(cam_list, num_frames, folder):
+def image_filename(i, device_num, n, frame_time, num_frames, folder, digits, cam_digits):
 	"""
-	This function acquires and saves n=num_frames images from each device.
+	This function builds the path an image is saved to.
+
+	:param i: Camera index
+	:param device_num: Camera serial number (or 0 if unknown)
+	:param n: Frame number
+	:param frame_time: Seconds since the start of acquisition
+	:param num_frames: Number of frames to capture
+	:param folder: Folder name
+	:param digits: Zero padding for frame numbers
+	:param cam_digits: Zero padding for camera folders
+	:return: Image path
+	:rtype: str
+	"""
+	if folder is None or num_frames > 1:
+		img_folder = 'MultiCamAcqTest' if folder is None else 'MultiCamAcqTest/{}'.format(folder)
+		return '{}/MCAT-{}-{:0{}f}-{}.jpg'.format(
+			img_folder, device_num if device_num else i, n, digits, frame_time)
+
+	cam_folder = 'cam{:0{}f}'.format(i + 1, cam_digits)
+	os.makedirs('MultiCamAcqTest/{}'.format(cam_folder), exist_ok=True)
+	return 'MultiCamAcqTest/{}/{}.jpg'.format(cam_folder, folder)
+
+
+def save_image(i, n, image, image_file, writer=None, convert=True, counts=None):
+	"""
+	This function converts a grabbed image to mono 8 (unless the camera
+	already streams mono 8) and saves it, either inline or by handing it to
+	the writer stage. The image must not be released before this returns.
+
+	:param i: Camera index
+	:param n: Frame number
+	:param image: Grabbed image
+	:param image_file: Path to save the image to
+	:param writer: Process-pool writer stage (saves inline if None)
+	:param convert: Convert the image to mono 8 (False if it already is)
+	:param counts: Per-camera 'converted' and 'passed_through' frame counts (updated in place)
+	:type image: ImagePtr
+	:type writer: ImageWriter
+	:type convert: bool
+	:type counts: dict
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	try:
+		if image.IsIncomplete():
+			log.warning('Image incomplete with image status %d ... \n' % image.GetImageStatus())
+			return True
+
+		# Print image information
+		width = image.GetWidth()
+		height = image.GetHeight()
+		log.VLOG(2, '%%% Camera {0} grabbed image {1}, width = {2}, height = {3}'.format(
+			i, n, width, height))
+
+		# Convert image to mono 8. Mono 8 images are used as they are, which
+		# saves allocating and copying a full frame.
+		if convert:
+			image_converted = image.Convert(PySpin.PixelFormat_Mono8, PySpin.HQ_LINEAR)
+		else:
+			image_converted = image
+		if counts is not None:
+			counts['converted' if convert else 'passed_through'][i] += 1
+
+		# Save image
+		if writer is None:
+			image_converted.Save(image_file)
+			log.VLOG(2, '%%% Image saved at {}'.format(image_file))
+		else:
+			# The writer copies the frame out of the image buffer before returning
+			writer.submit(image_converted.GetNDArray(), image_file)
+
+	except PySpin.SpinnakerException as ex:
+		log.error('Error: %s' % ex)
+		return False
+
+	return True
+
+
+def store_raw_image(i, n, image, frame_time, raw_writer, device_num):
+	"""
+	This function appends a grabbed image, unconverted, to the run's raw capture.
+
+	:param i: Camera index
+	:param n: Frame number
+	:param image: Grabbed image
+	:param frame_time: Seconds since the start of acquisition
+	:param raw_writer: Raw capture container for the run
+	:param device_num: Camera serial number (or 0 if unknown)
+	:type image: ImagePtr
+	:type raw_writer: RawCaptureWriter
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	try:
+		if image.IsIncomplete():
+			log.warning('Image incomplete with image status %d ... \n' % image.GetImageStatus())
+			status = STATUS_INCOMPLETE
+		else:
+			status = STATUS_COMPLETE
+
+		log.VLOG(2, '%%% Camera {0} grabbed image {1}, width = {2}, height = {3}'.format(
+			i, n, image.GetWidth(), image.GetHeight()))
+
+		if raw_writer.append(device_num if device_num else i, n, frame_time, image.GetData(), status) is None:
+			return False
+
+	except PySpin.SpinnakerException as ex:
+		log.error('Error: %s' % ex)
+		return False
+
+	return True
+
+
+def grab_images(i, cam, num_frames, frame_queue, start_time, high_water, results):
+	"""
+	Grab thread for a single camera. Pushes n=num_frames images into the
+	camera's bounded frame queue, followed by a None sentinel.
+
+	:param i: Camera index
+	:param cam: Camera
+	:param num_frames: Number of frames to capture
+	:param frame_queue: Bounded queue shared with the camera's save thread
+	:param start_time: Start of acquisition
+	:param high_water: Per-camera queue high-water marks (updated in place)
+	:param results: Per-camera results (updated in place)
+	:type cam: CameraPtr
+	:type frame_queue: queue.Queue
+	"""
+	try:
+		for n in range(num_frames):
+			try:
+				# Retrieve next received image
+				image = cam.GetNextImage(1000)
+				frame_time = (dt.datetime.now() - start_time).total_seconds()
+			except PySpin.SpinnakerException as ex:
+				log.error('Error: %s' % ex)
+				results[i] = False
+				continue
+
+			frame_queue.put((n, image, frame_time))
+			high_water[i] = max(high_water[i], frame_queue.qsize())
+	finally:
+		frame_queue.put(None)
+
+
+def save_images(i, frame_queue, save_func, results):
+	"""
+	Save thread for a single camera. Saves and releases images from the
+	camera's frame queue until the None sentinel is received. A frame which
+	fails to save only fails the camera's result: the queue is drained
+	regardless, or the grab thread would block on it forever.
+
+	:param i: Camera index
+	:param frame_queue: Bounded queue shared with the camera's grab thread
+	:param save_func: Function saving (camera index, frame number, image, frame time)
+	:param results: Per-camera results (updated in place)
+	:type frame_queue: queue.Queue
+	"""
+	while True:
+		item = frame_queue.get()
+		if item is None:
+			break
+
+		n, image, frame_time = item
+		try:
+			if not save_func(i, n, image, frame_time):
+				results[i] = False
+		except Exception as ex:
+			log.error('Unable to save frame {0} of camera {1}: {2}'.format(n, i, ex))
+			results[i] = False
+
+		try:
+			# Release image
+			image.Release()
+		except PySpin.SpinnakerException as ex:
+			log.error('Error: %s' % ex)
+			results[i] = False
+
+
+def acquire_images_serial(cam_list, num_frames, save_func):
+	"""
+	This function grabs one image from every camera in turn, then saves and
+	releases them, all on the calling thread.
+
+	:param cam_list: List of cameras
+	:param num_frames: Number of frames to capture
+	:param save_func: Function saving (camera index, frame number, image, frame time)
+	:type cam_list: CameraList
+	:type num_frames: int
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	result = True
+
+	start_time = dt.datetime.now()
+	for n in range(num_frames):
+		image_results = [PySpin.Image for _ in cam_list]
+		new_frame_times = [0 for _ in cam_list]
+		for i, cam in enumerate(cam_list):
+			try:
+				# Retrieve next received image and ensure image completion
+				image_results[i] = cam.GetNextImage(1000)
+				new_frame_times[i] = (dt.datetime.now() - start_time).total_seconds()
+			except PySpin.SpinnakerException as ex:
+				log.error('Error: %s' % ex)
+				result = False
+
+		for i, _ in enumerate(cam_list):
+			result &= save_func(i, n, image_results[i], new_frame_times[i])
+
+		for i, _ in enumerate(cam_list):
+			try:
+				# Release image
+				image_results[i].Release()
+			except PySpin.SpinnakerException as ex:
+				log.error('Error: %s' % ex)
+				result = False
+
+		log.VLOG(2, '%%%\n')
+
+	return result
+
+
+def acquire_images_concurrent(cam_list, num_frames, save_func, queue_size=QUEUE_SIZE):
+	"""
+	This function runs a grab thread and a save thread per camera, connected by
+	a bounded frame queue, so that a slow camera or a slow save only stalls
+	its own stream.
 
 	:param cam_list: List of cameras
 	:param num_frames: Number of frames to capture
+	:param save_func: Function saving (camera index, frame number, image, frame time)
+	:param queue_size: Maximum number of frames buffered per camera
+	:type cam_list: CameraList
+	:type num_frames: int
+	:type queue_size: int
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	num_cams = len(cam_list)
+	frame_queues = [queue.Queue(maxsize=queue_size) for _ in range(num_cams)]
+	high_water = [0 for _ in range(num_cams)]
+	results = [True for _ in range(num_cams)]
+
+	start_time = dt.datetime.now()
+	threads = []
+	for i, cam in enumerate(cam_list):
+		threads += [threading.Thread(target=save_images, name='save-{}'.format(i),
+		                             args=(i, frame_queues[i], save_func, results))]
+		threads += [threading.Thread(target=grab_images, name='grab-{}'.format(i),
+		                             args=(i, cam, num_frames, frame_queues[i], start_time, high_water, results))]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	for i in range(num_cams):
+		log.VLOG(1, '%%% Camera {0} frame queue high-water mark: {1}/{2}'.format(i, high_water[i], queue_size))
+
+	return min(results)
+
+
+def frame_bytes(cam_list):
+	"""
+	This function finds the size of the largest frame the cameras will
+	deliver with their current settings: the larger of a camera's PayloadSize
+	and its Width * Height (the size of the mono 8 frame it is converted to).
+	The cameras must be initialized.
+
+	:param cam_list: List of cameras
+	:type cam_list: CameraList
+	:return: Frame size in bytes
+	:rtype: int
+	"""
+	sizes = [0]
+	for cam in cam_list:
+		nodemap = cam.GetNodeMap()
+		node_payload = PySpin.CIntegerPtr(nodemap.GetNode('PayloadSize'))
+		if PySpin.IsAvailable(node_payload) and PySpin.IsReadable(node_payload):
+			sizes += [node_payload.GetValue()]
+
+		node_width = PySpin.CIntegerPtr(nodemap.GetNode('Width'))
+		node_height = PySpin.CIntegerPtr(nodemap.GetNode('Height'))
+		if PySpin.IsAvailable(node_width) and PySpin.IsReadable(node_width) and \
+				PySpin.IsAvailable(node_height) and PySpin.IsReadable(node_height):
+			sizes += [node_width.GetValue() * node_height.GetValue()]
+	return max(sizes)
+
+
+def camera_layout(cam):
+	"""
+	This function reads the pixel format and frame size a camera streams with.
+
+	:param cam: Camera
+	:type cam: CameraPtr
+	:return: (pixel format name, width, height)
+	:rtype: tuple
+	"""
+	nodemap = cam.GetNodeMap()
+	pixel_format = PySpin.CEnumerationPtr(nodemap.GetNode('PixelFormat')).GetCurrentEntry().GetSymbolic()
+	width = PySpin.CIntegerPtr(nodemap.GetNode('Width')).GetValue()
+	height = PySpin.CIntegerPtr(nodemap.GetNode('Height')).GetValue()
+	return pixel_format, width, height
+
+
+def start_acquisition(cam_list, system=None):
+	"""
+	This function prepares every camera, starts acquisition and reads the
+	camera serial numbers used in filenames.
+
+	:param cam_list: List of cameras
+	:param system: Spinnaker system the cameras were retrieved from (the link budget is only checked if given)
+	:type cam_list: CameraList
+	:type system: SystemPtr
+	:return: (True if successful, False otherwise; list of serial numbers, 0 if unknown)
+	:rtype: tuple
+	"""
+	result = True
+
+	# Warn now rather than after frames were dropped
+	if system is not None:
+		check_link_budget(system, cam_list)
+
+	# Prepare each camera to acquire images
+	#
+	# *** NOTES ***
+	# For pseudo-simultaneous streaming, each camera is prepared as if it
+	# were just one, but in a loop. Notice that cameras are selected with
+	# an index.
+	#
+
+	for i, cam in enumerate(cam_list):
+		result &= prepare_camera(i, cam)
+
+	device_nums = [0 for _ in cam_list]
+	for i, cam in enumerate(cam_list):
+		# Retrieve device serial number for filename
+		node_device_serial_number = PySpin.CStringPtr(
+			cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
+
+		if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
+			device_serial_number = node_device_serial_number.GetValue()
+			log.VLOG(2, 'Camera %d serial number set to %s...' % (i, device_serial_number))
+
+			device_nums[i] = device_serial_number
+
+	return result, device_nums
+
+
+def create_writer(cam_list, writers, ring_slots=RING_SLOTS, overwrite=False):
+	"""
+	This function starts the process-pool writer stage, if one is wanted.
+
+	:param cam_list: List of cameras
+	:param writers: Number of image writer processes (0 saves inline)
+	:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+	:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+	:return: Writer stage, or None to save inline
+	:rtype: ImageWriter
+	"""
+	if writers <= 0:
+		return None
+
+	slot_bytes = frame_bytes(cam_list) if ring_slots > 0 else 0
+	return ImageWriter(writers, slot_bytes, ring_slots, overwrite)
+
+
+def capture_images(cam_list, device_nums, num_frames, folder, serial=False, writer=None, output='jpg'):
+	"""
+	This function grabs and saves n=num_frames images from each device. The
+	cameras must already be acquiring.
+
+	:param cam_list: List of cameras
+	:param device_nums: Camera serial numbers (0 if unknown)
+	:param num_frames: Number of frames to capture
 	:param folder: Folder name
+	:param serial: Grab and save on a single thread instead of per-camera threads
+	:param writer: Process-pool writer stage (saves inline if None); waited on before returning
+	:param output: Output type: jpg (one file per frame) or raw (one unconverted raw capture for the run)
 	:type cam_list: CameraList
+	:type device_nums: list
 	:type num_frames: int
 	:type folder: str
+	:type serial: bool
+	:type writer: ImageWriter
+	:type output: str
 	:return: True if successful, False otherwise.
 	:rtype: bool
 	"""
+	result = True
 
 	if num_frames is None:
 		num_frames = NUM_IMAGES
 	digits = np.floor(np.log10(num_frames) + 1)
 
-	log.VLOG(2, '*** IMAGE ACQUISITION ***\n')
-	try:
-		result = True
+	os.makedirs('MultiCamAcqTest', exist_ok=True)
+	if folder is not None and (num_frames > 1 or output == 'raw'):
+		os.makedirs('MultiCamAcqTest/{}'.format(folder), exist_ok=True)
 
-		# Prepare each camera to acquire images
-		#
-		# *** NOTES ***
-		# For pseudo-simultaneous streaming, each camera is prepared as if it
-		# were just one, but in a loop. Notice that cameras are selected with
-		# an index. We demonstrate pseduo-simultaneous streaming because true
-		# simultaneous streaming would require multiple process or threads,
-		# which is too complex for an example.
-		#
+	cam_digits = np.floor(np.log10(len(cam_list)) + 1)
 
-		for i, cam in enumerate(cam_list):
-			result &= prepare_camera(i, cam)
+	raw_writer = None
+	counts = {'converted': [0 for _ in cam_list], 'passed_through': [0 for _ in cam_list]}
+	if output == 'raw':
+		cameras = {device_nums[i] if device_nums[i] else str(i): camera_layout(cam)
+		           for i, cam in enumerate(cam_list)}
+		raw_path = 'MultiCamAcqTest/MCAT' if folder is None else 'MultiCamAcqTest/{}/MCAT'.format(folder)
+		raw_writer = RawCaptureWriter(raw_path, cameras, num_frames * len(cam_list))
 
-		# Retrieve, convert, and save images for each camera
-		#
-		# *** NOTES ***
-		# In order to work with simultaneous camera streams, nested loops are
-		# needed. It is important that the inner loop be the one iterating
-		# through the cameras; otherwise, all images will be grabbed from a
-		# single camera before grabbing any images from another.
+		def save_func(i, n, image, frame_time):
+			return store_raw_image(i, n, image, frame_time, raw_writer, device_nums[i])
+	else:
+		# Only convert frames from cameras which don't already stream mono 8
+		convert = [camera_layout(cam)[0] != 'Mono8' for cam in cam_list]
+		for i, _ in enumerate(cam_list):
+			log.VLOG(2, 'Camera {} frames will be {}'.format(
+				i, 'converted to mono 8' if convert[i] else 'saved without conversion'))
+
+		def save_func(i, n, image, frame_time):
+			image_file = image_filename(i, device_nums[i], n, frame_time, num_frames, folder, digits, cam_digits)
+			return save_image(i, n, image, image_file, writer, convert[i], counts)
+
+	# Retrieve, convert, and save images for each camera
+	#
+	# *** NOTES ***
+	# In serial mode, nested loops are needed. It is important that the
+	# inner loop be the one iterating through the cameras; otherwise, all
+	# images will be grabbed from a single camera before grabbing any
+	# images from another. In concurrent mode, every camera gets its own
+	# grab thread and save thread instead.
+	try:
+		if serial:
+			result &= acquire_images_serial(cam_list, num_frames, save_func)
+		else:
+			result &= acquire_images_concurrent(cam_list, num_frames, save_func)
+	finally:
+		# Wait for every queued image to be written
+		if writer is not None:
+			result &= writer.wait()
+		if raw_writer is not None:
+			raw_writer.close()
+
+	if output != 'raw':
+		for i, _ in enumerate(cam_list):
+			log.VLOG(1, '%%% Camera {0}: {1} frames converted, {2} frames passed through'.format(
+				i, counts['converted'][i], counts['passed_through'][i]))
 
-		device_nums = [0 for _ in cam_list]
-		for i, cam in enumerate(cam_list):
-			# Retrieve device serial number for filename
-			node_device_serial_number = PySpin.CStringPtr(
-				cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
+	return result
 
-			if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
-				device_serial_number = node_device_serial_number.GetValue()
-				log.VLOG(2, 'Camera %d serial number set to %s...' % (i, device_serial_number))
 
-			device_nums[i] = device_serial_number
+def acquire_images(cam_list, num_frames, folder, serial=False, writers=0, ring_slots=RING_SLOTS, overwrite=False,
+                   output='jpg', system=None):
+	"""
+	This function acquires and saves n=num_frames images from each device.
 
-		os.makedirs('MultiCamAcqTest', exist_ok=True)
-		if folder is not None and num_frames > 1:
-			os.makedirs('MultiCamAcqTest/{}'.format(folder), exist_ok=True)
+	:param cam_list: List of cameras
+	:param num_frames: Number of frames to capture
+	:param folder: Folder name
+	:param serial: Grab and save on a single thread instead of per-camera threads
+	:param writers: Number of image writer processes (0 saves inline)
+	:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+	:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+	:param output: Output type: jpg (one file per frame) or raw (one unconverted raw capture for the run)
+	:param system: Spinnaker system the cameras were retrieved from
+	:type cam_list: CameraList
+	:type num_frames: int
+	:type folder: str
+	:type serial: bool
+	:type writers: int
+	:type ring_slots: int
+	:type overwrite: bool
+	:type output: str
+	:type system: SystemPtr
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
 
-		start_time = dt.datetime.now()
-		cam_digits = np.floor(np.log10(len(cam_list)) + 1)
-		for n in range(num_frames):
-			image_results = [PySpin.Image for _ in cam_list]
-			new_frame_times = [0 for _ in cam_list]
-			for i, cam in enumerate(cam_list):
-				try:
-					# Retrieve next received image and ensure image completion
-					image_results[i] = cam.GetNextImage(1000)
-					new_frame_times[i] = (dt.datetime.now() - start_time).total_seconds()
-				except PySpin.SpinnakerException as ex:
-					log.error('Error: %s' % ex)
-					result = False
-			
-			for i, cam in enumerate(cam_list):
-				try:
-					if image_results[i].IsIncomplete():
-						log.warning('Image incomplete with image status %d ... \n' % image_results[i].GetImageStatus())
-					else:
-						# Print image information
-						width = image_results[i].GetWidth()
-						height = image_results[i].GetHeight()
-						log.VLOG(2, '%%% Camera {0} grabbed image {1}, width = {2}, height = {3}'.format(
-							i, n, width, height))
-
-						# Convert image to mono 8
-						image_converted = image_results[i].Convert(PySpin.PixelFormat_Mono8, PySpin.HQ_LINEAR)
-
-						# Create a unique filename
-						if folder is None or num_frames > 1:
-							img_folder = 'MultiCamAcqTest' if folder is None else 'MultiCamAcqTest/{}'.format(folder)
-							image_file = '{}/MCAT-{}-{:0{}f}-{}.jpg'.format(
-								img_folder, device_nums[i] if device_nums[i] else i, n, digits, new_frame_times[i])
-						else:
-							cam_folder = 'cam{:0{}f}'.format(i + 1, cam_digits)
-							os.makedirs('MultiCamAcqTest/{}'.format(cam_folder), exist_ok=True)
-							image_file = 'MultiCamAcqTest/{}/{}.jpg'.format(
-								cam_folder, folder)
-						# Save image
-						image_converted.Save(image_file)
-						log.VLOG(2, '%%% Image saved at {}'.format(image_file))
-				except PySpin.SpinnakerException as ex:
-					log.error('Error: %s' % ex)
-					result = False
-
-			for i, _ in enumerate(cam_list):
-				try:
-					# Release image
-					image_results[i].Release()
-				except PySpin.SpinnakerException as ex:
-					log.error('Error: %s' % ex)
-					result = False
-
-			log.VLOG(2, '%%%\n')
+	log.VLOG(2, '*** IMAGE ACQUISITION ***\n')
+	try:
+		result, device_nums = start_acquisition(cam_list, system)
+
+		writer = create_writer(cam_list, writers if output != 'raw' else 0, ring_slots, overwrite)
+		try:
+			result &= capture_images(cam_list, device_nums, num_frames, folder, serial, writer, output)
+		finally:
+			if writer is not None:
+				result &= writer.close()
 
 		# End acquisition for each camera
 		#
@@ -242,7 +662,8 @@ def print_device_info(nodemap, cam_num):
 	return result
 
 
-def run_multiple_cameras(cam_list, num_frames, folder):
+def run_multiple_cameras(cam_list, num_frames, folder, serial=False, writers=0, ring_slots=RING_SLOTS,
+                         overwrite=False, output='jpg', system=None):
 	"""
 	This function acts as the body of the example; please see NodeMapInfo example
 	for more in-depth comments on setting up cameras.
@@ -250,9 +671,21 @@ def run_multiple_cameras(cam_list, num_frames, folder):
 	:param cam_list: List of cameras
 	:param num_frames: Number of frames to capture
 	:param folder: Folder name
+	:param serial: Grab and save on a single thread instead of per-camera threads
+	:param writers: Number of image writer processes (0 saves inline)
+	:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+	:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+	:param output: Output type: jpg (one file per frame) or raw (one unconverted raw capture for the run)
+	:param system: Spinnaker system the cameras were retrieved from
 	:type cam_list: CameraList
 	:type num_frames: int
 	:type folder: str
+	:type serial: bool
+	:type writers: int
+	:type ring_slots: int
+	:type overwrite: bool
+	:type output: str
+	:type system: SystemPtr
 	:return: True if successful, False otherwise.
 	:rtype: bool
 	"""
@@ -292,7 +725,7 @@ def run_multiple_cameras(cam_list, num_frames, folder):
 			cam.Init()
 
 		# Acquire images on all cameras
-		result &= acquire_images(cam_list, num_frames, folder)
+		result &= acquire_images(cam_list, num_frames, folder, serial, writers, ring_slots, overwrite, output, system)
 
 		# Deinitialize each camera
 		#
@@ -316,11 +749,19 @@ def run_multiple_cameras(cam_list, num_frames, folder):
 	return result
 
 
-def main(num_frames=None, folder=None):
+def main(num_frames=None, folder=None, serial=False, writers=0, ring_slots=RING_SLOTS, overwrite=False,
+         output='jpg'):
 	"""
 	Example entry point; please see Enumeration example for more in-depth
 	comments on preparing and cleaning up the system.
 
+	:param num_frames: Number of frames to capture
+	:param folder: Folder name
+	:param serial: Grab and save on a single thread instead of per-camera threads
+	:param writers: Number of image writer processes (0 saves inline)
+	:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+	:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+	:param output: Output type: jpg (one file per frame) or raw (one unconverted raw capture for the run)
 	:return: True if successful, False otherwise.
 	:rtype: bool
 	"""
@@ -367,7 +808,8 @@ def main(num_frames=None, folder=None):
 	# Run example on all cameras
 	log.VLOG(1, 'Running acquisition for all cameras...')
 
-	result = run_multiple_cameras(cam_list, num_frames, folder)
+	result = run_multiple_cameras(cam_list, num_frames, folder, serial, writers, ring_slots, overwrite, output,
+	                              system)
 
 	log.VLOG(1, 'Acquisition complete... \n')
 
@@ -388,11 +830,29 @@ if __name__ == '__main__':
 	                    type=str, default="1")
 	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
 	                    default="cpp")
+	parser.add_argument('-s', '--serial', help='grab and save on a single thread (for comparison with the default '
+	                    'per-camera grab threads)', action='store_true')
+	parser.add_argument('-w', '--writers', help='number of image writer processes (0 (default) saves inline)', type=int,
+	                    default=0)
+	parser.add_argument('-r', '--ring_slots', help='number of shared-memory frame slots between the grab threads and '
+	                    'the image writers (0 pickles frames instead)', type=int, default=RING_SLOTS)
+	parser.add_argument('-o', '--overwrite', help='overwrite the oldest unsaved frame instead of dropping new frames '
+	                    'when the frame ring is full', action='store_true')
+	parser.add_argument('--output', help='jpg (default): one image per frame, raw: one unconverted raw capture '
+	                    'container for the whole run', choices=['jpg', 'raw'], default='jpg')
+	parser.add_argument('-d', '--daemon', help='capture through a running camera daemon (optionally the path of its '
+	                    'socket); writer options are then set when starting the daemon', nargs='?',
+	                    const=DEFAULT_SOCKET, type=str)
 	args = parser.parse_args()
 	config_path = args.config_file
 	log = logger.getLogger(__file__, args.verbosity, args.logType)
 
-	if main(folder="0"):
+	if args.daemon is not None:
+		response = daemon_request('capture', args.daemon, num_frames=NUM_IMAGES, folder="0", output=args.output)
+		sys.exit(0 if response['ok'] else 1)
+
+	if main(folder="0", serial=args.serial, writers=args.writers, ring_slots=args.ring_slots,
+	        overwrite=args.overwrite, output=args.output):
 		sys.exit(0)
 	else:
 		sys.exit(1)
@@ -26,16 +26,22 @@ import time
 import sys
 import os
 import argparse
-import configparser
+from concurrent.futures import ThreadPoolExecutor
 import PySpin
 from multiprocess_logging import install_mp_handler
 from llpyspin import primary, secondary
-import numpy as np
 import datetime as dt
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
 import logger
 
+from camera_backend import PySpinBackend, Recorder, raw_capture_path
+from daemon_client import DEFAULT_SOCKET, daemon_request
+from rig_config import load_rig_config
+from rig_solver import max_exposure
+from SetSettings import forget_applied_settings
+from timestamp_file import save_timestamps, timestamps_path, write_timestamp_file
+
 if not __name__ == "__main__":
     import traceback
 
@@ -43,6 +49,10 @@ if not __name__ == "__main__":
     log = logger.getLogger(filename.split('"')[1])
 
 NUM_IMAGES = 30  # number of images to grab
+DEADLINE_FACTOR = 1.5  # a counted recording is stopped after this many times its nominal duration...
+DEADLINE_SLACK = 5  # ...plus this many seconds, if some camera hasn't reached its frame count
+PROGRESS_INTERVAL = 1  # seconds between frame count checks of a counted recording
+PHASES_FILE = 'Timestamps/MCAT-phases.csv'  # start and stop timings of every recording, one row each
 
 
 def print_device_info(nodemap, cam_num):
@@ -84,8 +94,64 @@ def print_device_info(nodemap, cam_num):
     return result
 
 
-def run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_index, capture_num):
+def for_each_camera(func, indices, step, timings):
+    """
+    Calls func on every camera at once. Each llpyspin call round-trips to the
+    camera's child process, so issuing them concurrently keeps the time of a
+    step close to that of the slowest camera however many cameras there are.
+    A camera which fails is logged and its result is None.
+
+    :param func: Function taking a camera index
+    :param indices: Camera indices
+    :param step: Name of the step, for log messages and timings
+    :param timings: Step name -> seconds, which the time of this step is added to
+    :type step: str
+    :type timings: dict
+    :return: Results of func, in the order of indices
+    :rtype: list
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(len(indices), 1)) as pool:
+        futures = [pool.submit(func, i) for i in indices]
+    timings[step] = time.perf_counter() - start
+
+    results = []
+    for i, future in zip(indices, futures):
+        try:
+            results += [future.result()]
+        except Exception as ex:
+            log.error('{0} of camera {1} failed: {2}'.format(step, i, ex))
+            results += [None]
+
+    log.VLOG(2, '{0} of {1} cameras took {2:.3f} s'.format(step, len(indices), timings[step]))
+    return results
+
+
+def save_phase_timings(timings, num_cams):
     """
+    Appends the timings of one recording to PHASES_FILE, so start latency can
+    be compared across rig sizes.
+
+    :param timings: Step name -> seconds (open, prime, trigger, stop primary, stop)
+    :param num_cams: Number of cameras
+    :type timings: dict
+    :type num_cams: int
+    """
+    phases = ['open', 'prime', 'trigger', 'stop primary', 'stop']
+    os.makedirs(os.path.dirname(PHASES_FILE), exist_ok=True)
+    new_file = not os.path.exists(PHASES_FILE)
+    with open(PHASES_FILE, 'a') as phases_file:
+        if new_file:
+            phases_file.write(','.join(['date', 'cameras'] + [phase.replace(' ', '_') for phase in phases]) + '\n')
+        phases_file.write(','.join([dt.datetime.now().isoformat(), str(num_cams)] +
+                                   ['{:.6f}'.format(timings.get(phase, 0.0)) for phase in phases]) + '\n')
+    log.VLOG(2, 'Saving phase timings to %s' % PHASES_FILE)
+
+
+def run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_index):
+    """
+    Records AVI videos through llpyspin until Enter is pressed (counted
+    recordings go through record_frames()).
 
     :param cam_list: List of cameras
     :type cam_list: CameraList
@@ -108,58 +174,73 @@ def run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_inde
             primary_index = device_nums.index(primary_index)
             log.VLOG(3, 'Primary camera found')
 
-        cams = []
-        for i in num_cams:
+        timings = {}
+
+        def open_camera(i):
             if i != primary_index:
-                cams += [secondary.SecondaryCamera(device_nums[i])]
+                cam = secondary.SecondaryCamera(device_nums[i])
             else:
-                cams += [primary.PrimaryCamera(device_nums[i])]
-                
-        os.makedirs('MultiCamAcqTest', exist_ok=True)
-        if capture_num > 0:
-            os.makedirs('MultiCamAcqTest/{}'.format(capture_num), exist_ok=True)
-            video_files = ['MultiCamAcqTest/{}/MCAT-{}.avi'.format(capture_num, device_nums[i]) for i in num_cams]
-        else:
-            video_files = ['MultiCamAcqTest/MCAT-%s.avi' % (device_nums[i]) for i in num_cams]
-
-        if primary_index >= 0:
-            cams[primary_index].framerate = framerate
-            cams[primary_index].exposure = exposure
-            cams[primary_index].binsize = binsize
-            # override binsize for now, need to add to config parser
-
-        for i in num_cams:
+                cam = primary.PrimaryCamera(device_nums[i])
             if primary_index < 0:
-                cams[i].framerate = 'max'
+                cam.framerate = 'max'
                 log.VLOG(4, 'Setting camera frame rate to maximum')
+            if i == primary_index:
+                cam.framerate = framerate
+            # override binsize for now, need to add to config parser
+            cam.binsize = binsize
+            cam.exposure = exposure
+            return cam
+
+        cams = for_each_camera(open_camera, num_cams, 'open', timings)
+        # llpyspin wrote the frame rate, exposure and binning, so the cameras no longer hold what SetSettings applied
+        forget_applied_settings(device_nums)
+
+        os.makedirs('MultiCamAcqTest', exist_ok=True)
+        video_files = ['MultiCamAcqTest/MCAT-%s.avi' % (device_nums[i]) for i in num_cams]
+
+        def prime_camera(i):
             if i != primary_index:
-                cams[i].binsize = binsize
-                cams[i].exposure = exposure
                 cams[i].prime(video_files[i], framerate, backend='opencv')
+            else:
+                cams[i].prime(video_files[i], backend='opencv')
+            return True
+
+        primed = [i for i in num_cams if cams[i] is not None]
+        if len(primed) == len(cams):
+            primed = [i for i, ok in zip(primed, for_each_camera(prime_camera, primed, 'prime', timings)) if ok]
+
+        # every camera is primed before the primary starts the hardware trigger
+        if len(primed) != len(cams):
+            log.error('Unable to open or prime cameras {}. Exiting...'.format(
+                [device_nums[i] for i in num_cams if i not in primed]))
+            for_each_camera(lambda i: cams[i].stop(), primed, 'stop', timings)
+            return False
 
         if primary_index >= 0:
-            cams[primary_index].prime(video_files[primary_index], backend='opencv')
+            start = time.perf_counter()
             cams[primary_index].trigger()
+            timings['trigger'] = time.perf_counter() - start
+        log.VLOG(1, 'Rig of {0} cameras started in {1:.3f} s'.format(len(cams), sum(timings.values())))
 
         # start the hardware trigger and record as long as you'd like
         if primary_index >= 0:
-            if capture_num > 0:
-                time.sleep(capture_num / framerate)
-                print(dt.datetime.now())
-            else:
-                input('Starting acquisition. Press Enter to stop.')
+            input('Starting acquisition. Press Enter to stop.')
         else:
             input('To start acquisition, turn on your trigger.\nTo stop acquisition, turn off your trigger. Then press Enter.')
         # stop the hardware trigger
 
+        synced = primary_index >= 0
         if primary_index < 0:
             primary_index = 0
 
+        start = time.perf_counter()
         timestamps = [cams[primary_index].stop()]
+        timings['stop primary'] = time.perf_counter() - start
 
-        for i in num_cams:
-            if i != primary_index:
-                timestamps += [cams[i].stop()]
+        stopped = for_each_camera(lambda i: cams[i].stop(), [i for i in num_cams if i != primary_index], 'stop',
+                                  timings)
+        timestamps += stopped
+        save_phase_timings(timings, len(cams))
         
         try:
             lengths = [len(x) for x in timestamps]
@@ -167,25 +248,11 @@ def run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_inde
             log.error('ERROR: Could not acquire video. Exiting...')
             return False
 
-        if max(lengths) != min(lengths):
-            if len(timestamps) > 5:
-                message = "Min: {}, Max: {}".format(min(lengths), max(lengths))
-            else:
-                message = lengths
-            log.warning("Timestamp lengths are not equal! {}".format(message))
-            log.info("Resulting timestamps will be cropped.")
-            # line up frames
-            timestamps = [times[:min(lengths)] for times in timestamps]
-
-        timestamp_list = np.transpose(np.array(timestamps))
-        timestamp_list[[0, primary_index]] = timestamp_list[[primary_index, 0]]
-        
-        if capture_num > 0:
-            os.makedirs('Timestamps', exist_ok=True)
-            np.savetxt('Timestamps/MCAT-timestamps-{}.csv'.format(capture_num), timestamp_list / 1e3, delimiter=',')
-        else:
-            np.savetxt('MCAT-timestamps.csv', timestamp_list / 1e3, delimiter=',')
-            log.VLOG(2, 'Saving timestamps as MCAT-timestamps.csv')
+        # the primary camera's timestamps come first; llpyspin timestamps are in milliseconds, from each camera's clock
+        serials = [device_nums[primary_index]] + [device_nums[i] for i in num_cams if i != primary_index]
+        timestamps_file = timestamps_path()
+        write_timestamp_file(timestamps_file, timestamps, serials, 0 if synced else -1, scale=1e6, clock='camera')
+        log.VLOG(2, 'Saving timestamps as %s' % timestamps_file)
 
     except PySpin.SpinnakerException as ex:
         log.error('Error: %s' % ex)
@@ -285,7 +352,10 @@ def main(framerate, exposure, binsize, primary_index, capture_num=-1):
     # Release system instance
     system.ReleaseInstance()
 
-    result &= run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_index, capture_num)
+    if capture_num > 0:
+        result &= record_frames(framerate, exposure, binsize, primary_index, capture_num)
+    else:
+        result &= run_multiple_cameras(device_nums, framerate, exposure, binsize, primary_index)
 
     log.VLOG(1, 'Acquisition complete... \n')
 
@@ -293,6 +363,132 @@ def main(framerate, exposure, binsize, primary_index, capture_num=-1):
     return result
 
 
+def recording_settings(framerate, exposure, binsize, primary_index):
+    """
+    Builds the settings run_multiple_cameras() has llpyspin write: the exposure
+    and binning of every camera, and the frame rate of the primary camera (of
+    every camera if there is none; the others follow the primary's trigger).
+
+    :param framerate: Frame rate (fps)
+    :param exposure: Exposure time (us)
+    :param binsize: (horizontal, vertical) binning
+    :param primary_index: Serial number of the primary camera (-1 if there is none)
+    :type framerate: float
+    :type exposure: float
+    :type binsize: tuple
+    :return: (default or secondary settings, primary settings or None, primary camera ID or None), as returned by
+        SetSettings.load_config
+    :rtype: tuple
+    """
+    settings = {'BinningHorizontal': binsize[0], 'BinningVertical': binsize[1], 'ExposureTime': float(exposure)}
+    rate = {'AcquisitionFrameRateEnable': True, 'AcquisitionFrameRate': float(framerate)}
+    if primary_index == -1:
+        return dict(settings, **rate), None, None
+    return settings, dict(settings, **rate), str(primary_index)
+
+
+def record_frames(framerate, exposure, binsize, primary_index, capture_num, timeout=None):
+    """
+    Records capture_num frames per camera into a raw capture in
+    MultiCamAcqTest/<capture_num> (not into AVI videos, as
+    run_multiple_cameras() does). The frame rate, exposure and binning are
+    written first, and the primary camera starts streaming last, so it only
+    triggers the other cameras once they stream. Each camera's grab thread
+    counts its frames and stops at capture_num, and the cameras are stopped
+    as soon as every camera has its frames (or at a deadline), rather than
+    after a fixed sleep. The cameras buffer every frame in order while
+    recording, and frames lost anyway are counted as dropped. Timestamps are
+    saved like run_multiple_cameras() saves them.
+
+    :param framerate: Frame rate of the rig (fps)
+    :param exposure: Exposure time (us)
+    :param binsize: (horizontal, vertical) binning
+    :param primary_index: Serial number of the primary camera (-1 if there is none)
+    :param capture_num: Number of frames to record per camera
+    :param timeout: Seconds to wait for the frames (defaults to DEADLINE_FACTOR times the nominal duration plus
+        DEADLINE_SLACK)
+    :type framerate: float
+    :type exposure: float
+    :type binsize: tuple
+    :type capture_num: int
+    :return: True if every camera recorded capture_num frames without dropping any, False otherwise.
+    :rtype: bool
+    """
+    if timeout is None:
+        timeout = capture_num / framerate * DEADLINE_FACTOR + DEADLINE_SLACK
+
+    backend = PySpinBackend()
+    if not backend.open():
+        return False
+
+    try:
+        applied = backend.write_settings(*recording_settings(framerate, exposure, binsize, primary_index))
+        # Only the frame rate, exposure and binning were written, so the cameras no longer hold what SetSettings
+        # applied
+        forget_applied_settings(backend.serials)
+        if not applied:
+            log.error('Unable to apply the recording settings. Exiting...')
+            return False
+
+        primary = backend.serials.index(str(primary_index)) if str(primary_index) in backend.serials else -1
+        recorder = Recorder(backend, raw_capture_path(str(capture_num)), capture_num)
+        recorder.start()
+        start = time.perf_counter()
+        deadline = start + timeout
+
+        done = False
+        while not done and time.perf_counter() < deadline:
+            done = recorder.wait(min(PROGRESS_INTERVAL, deadline - time.perf_counter()))
+            log.VLOG(3, 'Frames recorded: {}'.format(recorder.stats['frames']))
+        elapsed = time.perf_counter() - start
+
+        timestamps = recorder.stop()
+        dropped = sum(recorder.stats['dropped'])
+        if done and dropped:
+            log.warning('Recorded {0} frames per camera in {1:.2f} s, but {2} frames were dropped in between'.format(
+                capture_num, elapsed, dropped))
+            done = False
+        elif done:
+            log.VLOG(1, 'Recorded {0} frames per camera in {1:.2f} s'.format(capture_num, elapsed))
+        else:
+            log.warning('Stopped at the {0:.1f} s deadline with {1} of {2} frames per camera'.format(
+                timeout, recorder.stats['frames'], capture_num))
+
+        save_timestamps(timestamps, backend.serials, primary, capture_num)
+    except PySpin.SpinnakerException as ex:
+        log.error('Error: %s' % ex)
+        done = False
+    finally:
+        backend.close()
+
+    return done
+
+
+def record_with_daemon(socket_path=DEFAULT_SOCKET, capture_num=-1):
+    """
+    Records a synchronized acquisition through a running camera daemon, whose
+    cameras are already initialized and streaming. Frames go to a raw capture
+    in MultiCamAcqTest and timestamps are saved like main() saves them.
+
+    :param socket_path: Path of the daemon's Unix socket
+    :param capture_num: Number of frames to record (-1 records until Enter is pressed)
+    :type socket_path: str
+    :type capture_num: int
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    if not daemon_request('start', socket_path, num_frames=capture_num)['ok']:
+        return False
+
+    if capture_num <= 0:
+        input('Starting acquisition. Press Enter to stop.')
+    response = daemon_request('stop', socket_path, wait=capture_num > 0)
+    if response['ok']:
+        log.VLOG(1, 'Recorded {} frames per camera to {}'.format(response['frames'], response['path']))
+        log.VLOG(2, 'Saving timestamps as %s' % response['timestamps'])
+    return response['ok']
+
+
 def parseConfigFile(config_path, section):
     # read settings parameters from a configuration file
     # Input:
@@ -301,28 +497,27 @@ def parseConfigFile(config_path, section):
     # Outputs:
     # config_dict - dictionary with new configurations
 
-    # create config parser and read config file
-    config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-    config.read(config_path)
-    #p = {}
-    p_config = config[section]
+    # read the compiled config file
+    config = load_rig_config(config_path)
+    p_config = getattr(config, section)
 
-    framerate = p_config.getint('AcquisitionFrameRate')
-    exposure = p_config.getint('ExposureTime')
+    framerate = int(p_config['AcquisitionFrameRate'])
+    exposure = int(p_config['ExposureTime'])
     
     # check that exposure time is compatible with framerate
-    exposurecheck = int(1/framerate*1000000);
+    exposurecheck = int(max_exposure(framerate, str(p_config.get('TriggerOverlap', 'ReadOut')).lower() != 'off'))
     if exposurecheck < exposure:
-        log.warning('Maximum exposure time incompatible with frame rate. Reducing exposure time.')
-        exposure = exposurecheck - 5; # exposure margin of 5us below maximum - check actual camera spec here    
+        log.warning('Maximum exposure time incompatible with frame rate. Reducing exposure time (run SetSettings.py '
+                    '--solve to find the fastest frame rate and exposure the cameras can sustain).')
+        exposure = exposurecheck
     
-    binh = p_config.getint('BinningHorizontal')
-    binv = p_config.getint('BinningVertical')
+    binh = p_config['BinningHorizontal']
+    binv = p_config['BinningVertical']
     binsize = (binh,binv)
 
     if section == 'primary':
-        if p_config.getboolean('V3_3Enable') is not None:
-            primary_id = p_config.get('PrimaryID')
+        if 'V3_3Enable' in p_config:
+            primary_id = config.primary_id
             log.VLOG(3, 'Primary camera assigned to %s' % primary_id)
         else:
             primary_id = -1
@@ -340,15 +535,18 @@ if __name__ == '__main__':
                         type=str, default="1")
     parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
                         default="cpp")
+    parser.add_argument('-d', '--daemon', help='record through a running camera daemon (optionally the path of its '
+                        'socket)', nargs='?', const=DEFAULT_SOCKET, type=str)
     args = parser.parse_args()
     config_path = args.config_file
     log = logger.getLogger(__file__, args.verbosity, args.logType)
 
+    if args.daemon is not None:
+        sys.exit(0 if record_with_daemon(args.daemon) else 1)
+
     from SetSettings import log_device_info
 
-    config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-    config.read(config_path)
-    if dict(config['default'].items()) == {}:
+    if load_rig_config(config_path).synced:
         framerate1, exposure1, binsize1, primary_id = parseConfigFile(config_path, 'primary')
         framerate2, exposure2, binsize2 = parseConfigFile(config_path, 'secondary')
 
@@ -364,7 +562,7 @@ if __name__ == '__main__':
         framerate, exposure, binsize = parseConfigFile(config_path, 'default')
         log.VLOG(3, 'Frame rate set for default camera to %d' % framerate)
 
-        if main(framerate, exposure, binsize -1):
+        if main(framerate, exposure, binsize, -1):
             sys.exit(0)
         else:
             sys.exit(1)
\ No newline at end of file
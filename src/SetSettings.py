@@ -22,16 +22,26 @@
 # This example reads similarly to the Acquisition example,
 # except that loops are used to allow for simultaneous acquisitions.
 
+import functools
+import hashlib
+import json
+import math
 import os
 import PySpin
 import sys
-from enum import Enum
-import configparser
+import time
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
 import logger
 
+from daemon_client import DEFAULT_SOCKET, daemon_request
+from rig_config import Types, full_settings, setting_types, register_schema, load_rig_config
+from rig_solver import camera_limits, solve_rig, fit_throughput, read_float
+from link_budget import allocate_group, camera_demand, camera_groups, link_bandwidth
+from settings_schema import camera_schema, validate_setting
+
 if not __name__ == "__main__":
     import traceback
 
@@ -39,39 +49,40 @@ if not __name__ == "__main__":
     log = logger.getLogger(filename.split('"')[1], False, False)
 
 
-class Types(Enum):
-    ENUM = Enum
-    FLOAT = float
-    BOOLEAN = bool
-    INTEGER = int
-
-
-full_settings = {'AcquisitionMode': Types.ENUM.value,
-                 'AcquisitionFrameCount': Types.INTEGER.value,
-                 'AcquisitionFrameRateEnable': Types.BOOLEAN.value,
-                 'AcquisitionFrameRate': Types.FLOAT.value,
-                 'ExposureMode': Types.ENUM.value,
-                 'ExposureAuto': Types.ENUM.value,
-                 'ExposureTime': Types.FLOAT.value,
-                 'BinningVertical': Types.INTEGER.value,
-                 'BinningHorizontal': Types.INTEGER.value,
-                 'Height': Types.INTEGER.value,
-                 'Width': Types.INTEGER.value,
-                 'AutoExposureExposureTimeLowerLimit': Types.FLOAT.value,
-                 'AutoExposureExposureTimeUpperLimit': Types.FLOAT.value,
-                 'GainAuto': Types.ENUM.value,
-                 'Gain': Types.FLOAT.value,
-                 'GammaEnable': Types.BOOLEAN.value,
-                 'Gamma': Types.FLOAT.value,
-                 'BlackLevelSelector': Types.ENUM.value,
-                 'BlackLevel': Types.FLOAT.value,
-                 'DeviceLinkThroughputLimit': Types.INTEGER.value,
-                 'TriggerMode': Types.ENUM.value,
-                 'LineSelector': Types.ENUM.value,
-                 'LineMode': Types.ENUM.value,
-                 'V3_3Enable': Types.BOOLEAN.value,
-                 'TriggerSource': Types.ENUM.value,
-                 'TriggerOverlap': Types.ENUM.value}
+# Settings which must be written before a setting when both are configured. Auto
+# modes and enables gate the value they control, binning limits the frame size,
+# and the frame size, binning and link limit bound the frame rate, which in turn
+# bounds the exposure time (unless the frame rate goes up, see
+# plan_settings()). The trigger source can only change while the trigger is
+# off, so the trigger is turned off before the trigger settings are written
+# (see set_camera_settings()) and TriggerMode is written last.
+setting_dependencies = {'AcquisitionFrameCount': ('AcquisitionMode',),
+                        'AcquisitionFrameRate': ('AcquisitionFrameRateEnable', 'BinningVertical', 'BinningHorizontal',
+                                                 'Height', 'Width', 'DeviceLinkThroughputLimit'),
+                        'ExposureAuto': ('ExposureMode',),
+                        'ExposureTime': ('ExposureMode', 'ExposureAuto', 'AcquisitionFrameRate'),
+                        'AutoExposureExposureTimeLowerLimit': ('ExposureAuto',),
+                        'AutoExposureExposureTimeUpperLimit': ('ExposureAuto',),
+                        'Height': ('BinningVertical',),
+                        'Width': ('BinningHorizontal',),
+                        'Gain': ('GainAuto',),
+                        'Gamma': ('GammaEnable',),
+                        'BlackLevel': ('BlackLevelSelector',),
+                        'LineMode': ('LineSelector',),
+                        'V3_3Enable': ('LineSelector',),
+                        'TriggerMode': ('TriggerSource', 'TriggerOverlap')}
+
+# Settings which can only be written while TriggerMode is off
+trigger_settings = ('TriggerSource', 'TriggerOverlap')
+
+# Settings which change the availability or writability of other nodes when written
+availability_settings = ('AcquisitionMode', 'AcquisitionFrameRateEnable', 'ExposureMode', 'ExposureAuto', 'GainAuto',
+                         'GammaEnable', 'LineSelector', 'TriggerMode')
+
+# Record of the settings last applied to each camera, by serial number
+APPLIED_SETTINGS_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'spinnaker-python', 'applied_settings.json')
+
+FLOAT_TOLERANCE = 1e-3  # relative difference below which a float setting already matches (cameras round floats)
 
 
 def check_value(value_type):
@@ -88,6 +99,106 @@ def check_value(value_type):
     return node_func
 
 
+class NodeCache:
+    """
+    Resolved, typed node handles of one camera, keyed by setting name, along
+    with their availability and enumeration entry values. Availability is
+    re-checked only after a setting in availability_settings is written (or
+    invalidate() is called, e.g. when acquisition starts or stops).
+    """
+
+    def __init__(self, cam):
+        """
+        :param cam: Initialized camera
+        :type cam: CameraPtr
+        """
+        self.nodemap = cam.GetNodeMap()
+        self._nodes = {title: check_value(value_type)(self.nodemap.GetNode(title))
+                       for title, value_type in full_settings.items()}
+        self._access = {}  # title -> (readable, writable)
+        self._entries = {}  # (title, entry name) -> entry value, or None if unavailable
+
+    def node(self, title, node_func=None):
+        """
+        Returns the typed handle of a node, resolving it on first use.
+
+        :param title: Node name
+        :param node_func: CPtr type for nodes of unknown type
+        """
+        if title not in self._nodes:
+            self._nodes[title] = (node_func or check_value(setting_types[title]))(self.nodemap.GetNode(title))
+        return self._nodes[title]
+
+    def _check(self, title):
+        if title not in self._access:
+            node = self.node(title)
+            available = PySpin.IsAvailable(node)
+            self._access[title] = (available and PySpin.IsReadable(node), available and PySpin.IsWritable(node))
+        return self._access[title]
+
+    def readable(self, title):
+        return self._check(title)[0]
+
+    def writable(self, title):
+        return self._check(title)[1]
+
+    def entry(self, title, name):
+        """
+        Returns the value of an enumeration entry, or None if it is unavailable.
+
+        :param title: Enumeration node name
+        :param name: Entry name
+        """
+        if (title, name) not in self._entries:
+            node_entry = self.node(title).GetEntryByName(name)
+            self._entries[(title, name)] = node_entry.GetValue() \
+                if PySpin.IsAvailable(node_entry) and PySpin.IsReadable(node_entry) else None
+        return self._entries[(title, name)]
+
+    def written(self, title):
+        """
+        Records a write to a node, invalidating availability if it depends on it.
+        """
+        if title in availability_settings:
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Forgets every node's availability; the handles themselves stay valid.
+        """
+        self._access.clear()
+        self._entries.clear()
+
+
+_node_caches = {}  # camera unique ID -> NodeCache
+
+
+def node_cache(cam):
+    """
+    Returns a camera's node cache, building it on first use. The camera must
+    be initialized.
+
+    :param cam: Camera
+    :type cam: CameraPtr
+    :rtype: NodeCache
+    """
+    key = cam.GetUniqueID()
+    if key not in _node_caches:
+        _node_caches[key] = NodeCache(cam)
+    return _node_caches[key]
+
+
+def drop_node_cache(cam):
+    """
+    Discards a camera's node cache. Must be called when the camera is
+    deinitialized, since its handles become invalid.
+
+    :param cam: Camera
+    :type cam: CameraPtr
+    """
+    _node_caches.pop(cam.GetUniqueID(), None)
+
+
 def change_setting(i, cam, value, title, value_type):
     # Choose correct CPtr function
     node_func = check_value(value_type)
@@ -97,25 +208,25 @@ def change_setting(i, cam, value, title, value_type):
         return False
 
     # Find node
-    node_setting = node_func(cam.GetNodeMap().GetNode(title))
-    if not PySpin.IsAvailable(node_setting) or not PySpin.IsWritable(node_setting):
+    nodes = node_cache(cam)
+    node_setting = nodes.node(title, node_func)
+    if not nodes.writable(title):
         log.error('Unable to set {0} to {2} (node retrieval; camera {1}). Aborting... \n'.format(title, i, value))
         return False
 
     # Set node to given value
     if value_type == Types.ENUM.value:
-        node_setting_value = node_setting.GetEntryByName(value)
-        if not PySpin.IsAvailable(node_setting_value) or not PySpin.IsReadable(
-                node_setting_value):
+        setting_value = nodes.entry(title, value)
+        if setting_value is None:
             log.error('Unable to set {2} to {0} (entry {0!r} retrieval {1}). \
                             Aborting... \n'.format(value.lower(), i, title))
             return False
 
-        setting_value = node_setting_value.GetValue()
         node_setting.SetIntValue(setting_value)
         value = value.lower()
     else:
         node_setting.SetValue(value)
+    nodes.written(title)
 
     log.VLOG(2, '%%% Camera {0} {1} set to {2}...'.format(i, title, value))
 
@@ -129,9 +240,10 @@ def retrieve_settings(i, cam, title, value_type):
                         Aborting... \n')
         return False
 
-    node_setting = node_func(cam.GetNodeMap().GetNode(title))
+    nodes = node_cache(cam)
+    node_setting = nodes.node(title, node_func)
 
-    if PySpin.IsAvailable(node_setting) and PySpin.IsReadable(node_setting):
+    if nodes.readable(title):
         if value_type == Types.ENUM.value:
             value = node_setting.GetIntValue()
             value = node_setting.GetEntry(value).GetName()
@@ -142,60 +254,620 @@ def retrieve_settings(i, cam, title, value_type):
 
     return True
 
-def set_settings(cam_list, config_dict, config_dict_primary, primary_id):
-    log.VLOG(2, '*** CHANGING SETTINGS ***\n')
+def for_each_camera(cam_list, func, *args, step='Setup'):
+    """
+    Runs func(i, cam, *args) for every camera at once, on a thread per camera.
+    A camera which fails, or raises anything (a Spinnaker error, an OSError
+    from the schema cache, ...), is logged and reported instead of stopping
+    the others.
+
+    :param cam_list: List of cameras
+    :param func: Function taking (camera index, camera, *args) and returning True if successful
+    :param args: Extra arguments passed to func
+    :param step: Name of the step, for log messages
+    :type cam_list: CameraList
+    :type step: str
+    :return: Per-camera results
+    :rtype: list
+    """
+    cams = [cam for cam in cam_list]
+    timings = [0.0 for _ in cams]
+
+    def timed(i, cam):
+        start = time.perf_counter()
+        try:
+            return func(i, cam, *args)
+        finally:
+            timings[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(len(cams), 1)) as pool:
+        futures = [pool.submit(timed, i, cam) for i, cam in enumerate(cams)]
+
+    results = []
+    for i, future in enumerate(futures):
+        try:
+            results += [future.result()]
+        except Exception as ex:
+            log.error('Error (camera {0}): {1!r}'.format(i, ex))
+            results += [False]
+        log.VLOG(2, '{0} of camera {1} took {2:.3f} s'.format(step, i, timings[i]))
+
+    log.VLOG(1, '{0} of {1} cameras took {2:.3f} s'.format(step, len(cams), time.perf_counter() - start))
+    failed = [i for i, result in enumerate(results) if not result]
+    if failed:
+        log.error('{0} failed for cameras {1}'.format(step, failed))
+
+    return results
+
+
+def init_camera(i, cam):
+    """
+    Initializes one camera, resolves its settings nodes and loads (or
+    introspects) the schema of its model.
+
+    :param i: Camera index
+    :param cam: Camera
+    :type cam: CameraPtr
+    :return: True
+    :rtype: bool
+    """
+    cam.Init()
+    node_cache(cam)
+    register_schema(camera_schema(cam))
+    return True
+
+
+def camera_settings(cam, config_dict, config_dict_primary, primary_id):
+    """
+    Picks the settings for one camera: the primary settings for the primary
+    camera, the default (or secondary) settings for every other camera.
+
+    :param cam: Camera
+    :param config_dict: Default or secondary settings
+    :param config_dict_primary: Primary settings
+    :param primary_id: Serial number of the primary camera
+    :type cam: CameraPtr
+    :return: Settings to apply
+    :rtype: dict
+    """
+    node_device_serial_number = PySpin.CStringPtr(cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
+
+    if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
+        if node_device_serial_number.GetValue() == primary_id:
+            log.VLOG(2, 'Using Primary settings')
+            return config_dict_primary
+        log.VLOG(2, 'Using Secondary settings')
+
+    return config_dict
+
+
+@functools.lru_cache(maxsize=None)
+def plan_settings(settings, exposure_first=False):
+    """
+    Orders the writes for a config section so that every setting is written
+    after the settings it depends on (see setting_dependencies), and
+    otherwise in the order given. Plans are cached per set of settings.
+
+    The frame rate normally goes before the exposure time it bounds, but a
+    camera's current exposure time also caps its frame rate: when the frame
+    rate goes up, the exposure time has to shrink first.
+
+    :param settings: Setting names, as parsed from the config section
+    :param exposure_first: Write ExposureTime before AcquisitionFrameRate (see exposure_first())
+    :type settings: tuple
+    :type exposure_first: bool
+    :return: Setting names, in write order
+    :rtype: tuple
+    """
+    dependencies = setting_dependencies
+    if exposure_first:
+        dependencies = dict(setting_dependencies)
+        dependencies['ExposureTime'] = tuple(dependency for dependency in dependencies['ExposureTime']
+                                             if dependency != 'AcquisitionFrameRate')
+        dependencies['AcquisitionFrameRate'] += ('ExposureTime',)
+
+    pending = list(settings)
+    order = []
+    while pending:
+        for setting in pending:
+            if not any(dependency in pending for dependency in dependencies.get(setting, ())):
+                break
+        else:
+            raise ValueError('Circular setting dependencies between {}'.format(pending))
+        pending.remove(setting)
+        order += [setting]
+    return tuple(order)
+
+
+def print_plan(config_path):
+    """
+    Prints the write plan of every camera section of a config file without
+    touching the cameras. On a camera whose frame rate goes up, the exposure
+    time is written before the frame rate instead.
+
+    :param config_path: Relative path to config file
+    :type config_path: str
+    :return: Number of node writes per camera, by section
+    :rtype: dict
+    """
+    config_dict, config_dict_primary, primary_id = load_config(config_path)
+    if config_dict_primary is None:
+        sections = {'default': config_dict}
+    else:
+        sections = {'primary': config_dict_primary, 'secondary': config_dict}
+
+    writes = {}
+    for section, settings in sections.items():
+        plan = plan_settings(tuple(settings))
+        print('[{}]{}'.format(section, ' (camera {})'.format(primary_id) if section == 'primary' else ''))
+        for n, setting in enumerate(plan):
+            after = [dependency for dependency in setting_dependencies.get(setting, ()) if dependency in settings]
+            print('{0:4d}. {1:35} = {2}{3}'.format(n + 1, setting, settings[setting],
+                                                  '   (after {})'.format(', '.join(after)) if after else ''))
+        print('      {} node writes per camera\n'.format(len(plan)))
+        writes[section] = len(plan)
+
+    return writes
+
+
+def read_setting(nodes, title, value_type):
+    """
+    Reads the current value of a setting (the entry name for enumerations).
+
+    :param nodes: Node cache of the camera
+    :param title: Setting name
+    :param value_type: Setting type
+    :type nodes: NodeCache
+    :return: Current value, or None if the node isn't readable
+    """
+    if not nodes.readable(title):
+        return None
+    if value_type == Types.ENUM.value:
+        return nodes.node(title).GetCurrentEntry().GetSymbolic()
+    return nodes.node(title).GetValue()
+
+
+def setting_matches(current, value, value_type):
+    """
+    Checks whether a camera's current value of a setting already equals the configured value.
+
+    :param current: Value read by read_setting (None if unreadable)
+    :param value: Configured value
+    :param value_type: Setting type
+    :rtype: bool
+    """
+    if current is None:
+        return False
+    if value_type == Types.ENUM.value:
+        return current.lower() == value.lower()
+    if value_type == Types.FLOAT.value:
+        return math.isclose(current, value, rel_tol=FLOAT_TOLERANCE)
+    return current == value
+
+
+def exposure_first(nodes, settings):
+    """
+    Checks whether a camera's exposure time has to be written before its
+    frame rate: a higher frame rate can be capped by the current (longer)
+    exposure time, while the new exposure time always fits the current frame
+    rate's period if it fits the new one's.
+
+    :param nodes: Node cache of the camera
+    :param settings: Settings to write
+    :type nodes: NodeCache
+    :type settings: dict
+    :rtype: bool
+    """
+    if 'AcquisitionFrameRate' not in settings or 'ExposureTime' not in settings:
+        return False
+    current = read_setting(nodes, 'AcquisitionFrameRate', setting_types['AcquisitionFrameRate'])
+    # An unreadable frame rate isn't enabled, so it isn't bounding the exposure time
+    return current is None or settings['AcquisitionFrameRate'] > current
+
+
+def settings_delta(cam, temp_config_dict):
+    """
+    Reads every configured setting of a camera in one pass, before anything
+    is written, and returns only the settings which differ.
+
+    :param cam: Camera
+    :param temp_config_dict: Settings to apply
+    :type cam: CameraPtr
+    :type temp_config_dict: dict
+    :return: Settings which need to be written, in config order
+    :rtype: dict
+    """
+    nodes = node_cache(cam)
+    current = {setting: read_setting(nodes, setting, setting_types[setting]) for setting in temp_config_dict}
+    return {setting: value for setting, value in temp_config_dict.items()
+            if not setting_matches(current[setting], value, setting_types[setting])}
+
+
+def validate_settings(i, cam, temp_config_dict):
+    """
+    Checks every setting against the camera's schema before anything is
+    written, so a typo or an entry the model doesn't have fails the camera
+    without leaving it half configured.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param temp_config_dict: Settings to apply
+    :type cam: CameraPtr
+    :type temp_config_dict: dict
+    :return: True if every setting is valid, False otherwise.
+    :rtype: bool
+    """
+    schema = camera_schema(cam)
+    if not schema:
+        # Without a schema, the settings were only typed against full_settings
+        return True
+    result = True
+    for setting, value in temp_config_dict.items():
+        error = validate_setting(schema, setting, value)
+        if error is not None:
+            log.error('Invalid setting for camera {0}: {1}'.format(i, error))
+            result = False
+    return result
+
+
+def select_user_set(i, cam, user_set, selector='UserSetSelector'):
+    """
+    Points a user set selector node of a camera at a user set.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param user_set: User set name (e.g. UserSet1)
+    :param selector: Selector node (UserSetSelector or UserSetDefault)
+    :type cam: CameraPtr
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    nodes = node_cache(cam)
+    node_selector = nodes.node(selector, PySpin.CEnumerationPtr)
+    if not nodes.writable(selector):
+        log.error('Unable to select {0} (node {1} retrieval; camera {2}).'.format(user_set, selector, i))
+        return False
+
+    user_set_value = nodes.entry(selector, user_set)
+    if user_set_value is None:
+        log.error('Unable to select {0} (entry retrieval; camera {1}).'.format(user_set, i))
+        return False
+
+    node_selector.SetIntValue(user_set_value)
+    return True
+
+
+def execute_command(i, cam, title):
+    """
+    Executes a command node of a camera.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param title: Command node name
+    :type cam: CameraPtr
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    node_command = PySpin.CCommandPtr(cam.GetNodeMap().GetNode(title))
+    if not PySpin.IsAvailable(node_command) or not PySpin.IsWritable(node_command):
+        log.error('Unable to execute {0} (node retrieval; camera {1}).'.format(title, i))
+        return False
+
+    node_command.Execute()
+    return True
+
+
+def save_user_set(i, cam, user_set):
+    """
+    Saves a camera's current settings to a user set, and makes the camera
+    load that user set when it powers up.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param user_set: User set name (e.g. UserSet1)
+    :type cam: CameraPtr
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    if not select_user_set(i, cam, user_set) or not execute_command(i, cam, 'UserSetSave'):
+        return False
+
+    if not select_user_set(i, cam, user_set, 'UserSetDefault'):
+        log.warning('Camera {0} will not load {1} on power up.'.format(i, user_set))
+
+    log.VLOG(2, 'Camera {0} settings saved to {1}'.format(i, user_set))
+    return True
+
+
+def load_user_set(i, cam, user_set):
+    """
+    Restores a camera's settings from a user set in one operation.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param user_set: User set name (e.g. UserSet1)
+    :type cam: CameraPtr
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    if not select_user_set(i, cam, user_set) or not execute_command(i, cam, 'UserSetLoad'):
+        return False
+
+    # Every setting may have changed
+    node_cache(cam).invalidate()
+    log.VLOG(2, 'Camera {0} settings loaded from {1}'.format(i, user_set))
+    return True
+
+
+def user_set_matches(cam, user_set, digest, applied):
+    """
+    Checks whether a camera's user set was saved with the given settings, on
+    the camera's current firmware.
+
+    :param cam: Camera
+    :param user_set: User set name
+    :param digest: Hash of the settings to apply
+    :param applied: Records loaded by load_applied_settings
+    :rtype: bool
+    """
+    serial, firmware = device_identity(cam)
+    record = applied.get(serial)
+    return record is not None and record['firmware'] == firmware and \
+        record.get('user_sets', {}).get(user_set) == digest
+
+
+def set_camera_settings(i, cam, config_dict, config_dict_primary, primary_id, diff=False, counts=None, user_set=None,
+                        applied=None):
+    """
+    Changes the settings of one camera and reports the frame rate it ends up with.
+
+    With a user set, the settings are loaded from it in one operation if it
+    was saved with the same settings; otherwise they are applied node by node
+    and then saved to it.
+
+    :param i: Camera index
+    :param cam: Camera
+    :param config_dict: Default or secondary settings
+    :param config_dict_primary: Primary settings
+    :param primary_id: Serial number of the primary camera
+    :param diff: Only write settings which differ from the camera's current values
+    :param counts: Per-camera 'written', 'skipped' and 'loaded' setting counts (updated in place)
+    :param user_set: User set to restore the settings from or save them to (e.g. UserSet1)
+    :param applied: Records loaded by load_applied_settings (needed with a user set)
+    :type cam: CameraPtr
+    :type diff: bool
+    :type counts: dict
+    :type user_set: str
+    :type applied: dict
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
     try:
         result = True
 
-        # Change settings of each camera
-        for i, cam in enumerate(cam_list):
-            try:
-                # Change settings for minimum processing
-                log.VLOG(2, 'Changing settings for camera %d...\n' % i)
-        
-                node_device_serial_number = PySpin.CStringPtr(
-                cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
-                
-                if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
-                    device_serial_number = node_device_serial_number.GetValue()
-                    
-                    if device_serial_number == primary_id:
-                        temp_config_dict = config_dict_primary
-                        log.VLOG(2, 'Using Primary settings')
-                    else:
-                        temp_config_dict = config_dict
-                        log.VLOG(2, 'Using Secondary settings')
-
-                for setting in temp_config_dict:
-                    result &= change_setting(i, cam, temp_config_dict[setting], setting, full_settings[setting])
-
-                # Retrieve acquisition frame rate
-                node_acquisition_frame_rate = PySpin.CFloatPtr(cam.GetNodeMap().GetNode('AcquisitionFrameRate'))
-                if not PySpin.IsAvailable(node_acquisition_frame_rate) or not PySpin.IsReadable(
-                        node_acquisition_frame_rate):
-                    log.warning('Unable to read acquisition fps (node retrieval; camera {0}). Aborting... \n'.format(i))
-                    return False
-                acq_frame_rate = node_acquisition_frame_rate.GetValue()
-
-                # Retrieve resulting frame rate
-                node_resulting_frame_rate = PySpin.CFloatPtr(cam.GetNodeMap().GetNode('AcquisitionResultingFrameRate'))
-                if not PySpin.IsAvailable(node_resulting_frame_rate) or not PySpin.IsReadable(
-                        node_resulting_frame_rate):
-                    log.warning('Unable to read acquisition fps (node retrieval; camera {0}). Aborting... \n'.format(i))
-                    return False
-                res_frame_rate = node_resulting_frame_rate.GetValue()
-
-                # Retrieve resulting frame rate
-                log.VLOG(1, '%%%Camera {0} settings changed with acquisition frame rate {1:.2f} '
-                      'and resulting frame rate {2:.2f}...'.format(i, acq_frame_rate, res_frame_rate))
-                if 2 < abs(acq_frame_rate - res_frame_rate):
-                    log.VLOG(2, '%%% \tThey are not equal because the Exposure Time is greater than the frame time.')
-
-                log.VLOG(2, '%%%\n')
-
-            except PySpin.SpinnakerException as ex:
-                log.error('Error: %s' % ex)
-                result = False
+        # Change settings for minimum processing
+        log.VLOG(2, 'Changing settings for camera %d...\n' % i)
+
+        start = time.perf_counter()
+        temp_config_dict = camera_settings(cam, config_dict, config_dict_primary, primary_id)
+        if not validate_settings(i, cam, temp_config_dict):
+            return False
+
+        if user_set is not None and user_set_matches(cam, user_set, settings_hash(temp_config_dict), applied):
+            result &= load_user_set(i, cam, user_set)
+            if counts is not None:
+                counts['loaded'][i] = len(temp_config_dict)
+            log.VLOG(1, 'Camera {0} ready in {1:.3f} s ({2} settings loaded from {3})'.format(
+                i, time.perf_counter() - start, len(temp_config_dict), user_set))
+        else:
+            writes = dict(settings_delta(cam, temp_config_dict) if diff else temp_config_dict)
+            if counts is not None:
+                counts['written'][i] = len(writes)
+                counts['skipped'][i] = len(temp_config_dict) - len(writes)
+
+            # The trigger settings can only change with the trigger off; TriggerMode is then written last, back to
+            # its configured or current value
+            nodes = node_cache(cam)
+            if any(setting in writes for setting in trigger_settings):
+                trigger_mode = read_setting(nodes, 'TriggerMode', setting_types['TriggerMode'])
+                if trigger_mode is not None and trigger_mode.lower() != 'off':
+                    result &= change_setting(i, cam, 'Off', 'TriggerMode', setting_types['TriggerMode'])
+                    writes['TriggerMode'] = temp_config_dict.get('TriggerMode', trigger_mode)
+
+            # Write in dependency order, so a single pass converges
+            for setting in plan_settings(tuple(writes), exposure_first(nodes, writes)):
+                result &= change_setting(i, cam, writes[setting], setting, setting_types[setting])
+            log.VLOG(1, 'Camera {0} ready in {1:.3f} s ({2} settings written node by node)'.format(
+                i, time.perf_counter() - start, len(writes)))
+
+            if user_set is not None and result:
+                result &= save_user_set(i, cam, user_set)
+
+        # Retrieve acquisition frame rate
+        nodes = node_cache(cam)
+        if not nodes.readable('AcquisitionFrameRate'):
+            log.warning('Unable to read acquisition fps (node retrieval; camera {0}). Aborting... \n'.format(i))
+            return False
+        acq_frame_rate = nodes.node('AcquisitionFrameRate').GetValue()
+
+        # Retrieve resulting frame rate
+        node_resulting_frame_rate = nodes.node('AcquisitionResultingFrameRate', PySpin.CFloatPtr)
+        if not nodes.readable('AcquisitionResultingFrameRate'):
+            log.warning('Unable to read acquisition fps (node retrieval; camera {0}). Aborting... \n'.format(i))
+            return False
+        res_frame_rate = node_resulting_frame_rate.GetValue()
+
+        # Retrieve resulting frame rate
+        log.VLOG(1, 'Camera {0} settings changed with acquisition frame rate {1:.2f} '
+                 'and resulting frame rate {2:.2f}...'.format(i, acq_frame_rate, res_frame_rate))
+        if 2 < abs(acq_frame_rate - res_frame_rate):
+            log.VLOG(2, '%%% \tThey are not equal because the Exposure Time is greater than the frame time.')
+
+    except PySpin.SpinnakerException as ex:
+        log.error('Error: %s' % ex)
+        result = False
+
+    return result
+
+
+def settings_hash(settings):
+    """
+    Returns a stable hash of one camera's parsed settings.
+
+    :param settings: Settings to apply
+    :type settings: dict
+    :rtype: str
+    """
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def device_identity(cam):
+    """
+    Reads a camera's serial number and firmware version from the transport
+    layer, which doesn't need the camera to be initialized.
+
+    :param cam: Camera
+    :type cam: CameraPtr
+    :return: (serial number, firmware version); empty strings if unreadable
+    :rtype: tuple
+    """
+    nodemap_tldevice = cam.GetTLDeviceNodeMap()
+    identity = []
+    for title in ('DeviceSerialNumber', 'DeviceVersion'):
+        node = PySpin.CStringPtr(nodemap_tldevice.GetNode(title))
+        identity += [node.GetValue() if PySpin.IsAvailable(node) and PySpin.IsReadable(node) else '']
+    return tuple(identity)
+
+
+def load_applied_settings():
+    """
+    :return: Serial number -> {'firmware', 'hash', 'applied'} of the settings last applied
+    :rtype: dict
+    """
+    try:
+        with open(APPLIED_SETTINGS_FILE) as applied_file:
+            return json.load(applied_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_applied_settings(applied):
+    os.makedirs(os.path.dirname(APPLIED_SETTINGS_FILE), exist_ok=True)
+    temp_file = '{}.{}'.format(APPLIED_SETTINGS_FILE, os.getpid())
+    with open(temp_file, 'w') as applied_file:
+        json.dump(applied, applied_file, indent=2)
+    os.replace(temp_file, APPLIED_SETTINGS_FILE)
+
+
+def settings_already_applied(cam_list, config_dict, config_dict_primary, primary_id):
+    """
+    Checks whether every camera was last configured with exactly these
+    settings, on its current firmware. Logs the reason for every camera
+    which needs its settings re-applied.
+
+    :return: True if no camera needs its settings applied
+    :rtype: bool
+    """
+    applied = load_applied_settings()
+    result = True
+    for i, cam in enumerate(cam_list):
+        serial, firmware = device_identity(cam)
+        record = applied.get(serial)
+        if not serial:
+            log.VLOG(1, 'Camera {0}: serial number unreadable, applying settings'.format(i))
+        elif record is None:
+            log.VLOG(1, 'Camera {0} ({1}): no record of applied settings, applying settings'.format(i, serial))
+        elif record['firmware'] != firmware:
+            log.VLOG(1, 'Camera {0} ({1}): firmware changed from {2} to {3}, applying settings'.format(
+                i, serial, record['firmware'], firmware))
+        elif record['hash'] != settings_hash(camera_settings(cam, config_dict, config_dict_primary, primary_id)):
+            log.VLOG(1, 'Camera {0} ({1}): settings changed since {2}, applying settings'.format(
+                i, serial, record['applied']))
+        else:
+            continue
+        result = False
+    return result
+
+
+def record_applied_settings(cam_list, config_dict, config_dict_primary, primary_id, success, user_set=None):
+    """
+    Records the settings hash of every camera after the settings were
+    applied (and of the user set they were saved to or loaded from), or
+    forgets it if applying them failed (the camera's state is then unknown).
+
+    :param success: True if the settings were applied to every camera
+    :param user_set: User set holding the applied settings
+    :type success: bool
+    :type user_set: str
+    """
+    applied = load_applied_settings()
+    for cam in cam_list:
+        serial, firmware = device_identity(cam)
+        if not serial:
+            continue
+        if success:
+            digest = settings_hash(camera_settings(cam, config_dict, config_dict_primary, primary_id))
+            record = applied.get(serial, {})
+            user_sets = record.get('user_sets', {}) if record.get('firmware') == firmware else {}
+            if user_set is not None:
+                user_sets[user_set] = digest
+            applied[serial] = {'firmware': firmware,
+                               'hash': digest,
+                               'applied': time.strftime('%Y-%m-%d %H:%M:%S'),
+                               'user_sets': user_sets}
+        else:
+            applied.pop(serial, None)
+    try:
+        save_applied_settings(applied)
+    except OSError as ex:
+        log.warning('Unable to record applied settings in {0}: {1}'.format(APPLIED_SETTINGS_FILE, ex))
+
+
+def forget_applied_settings(serials):
+    """
+    Forgets the settings last applied to some cameras, so the next run
+    applies its settings instead of skipping them. Must be called wherever
+    settings are written outside set_settings() (the frame rate solver, the
+    bandwidth budget, llpyspin recordings), since the cameras no longer hold
+    the recorded settings then.
+
+    :param serials: Camera serial numbers
+    :type serials: list
+    """
+    applied = load_applied_settings()
+    serials = [str(serial) for serial in serials if str(serial) in applied]
+    if not serials:
+        return
+
+    for serial in serials:
+        del applied[serial]
+    try:
+        save_applied_settings(applied)
+    except OSError as ex:
+        log.warning('Unable to record applied settings in {0}: {1}'.format(APPLIED_SETTINGS_FILE, ex))
+
+
+def set_settings(cam_list, config_dict, config_dict_primary, primary_id, diff=False, user_set=None):
+    log.VLOG(2, '*** CHANGING SETTINGS ***\n')
+    try:
+        # Change settings of every camera at once
+        counts = {'written': [0 for _ in cam_list], 'skipped': [0 for _ in cam_list], 'loaded': [0 for _ in cam_list]}
+        applied = load_applied_settings() if user_set is not None else None
+        result = min(for_each_camera(cam_list, set_camera_settings, config_dict, config_dict_primary, primary_id,
+                                     diff, counts, user_set, applied, step='Setting change'), default=True)
+
+        if user_set is not None:
+            log.VLOG(1, '{0} cameras restored from {1}, {2} configured node by node and saved to it'.format(
+                sum(1 for loaded in counts['loaded'] if loaded), user_set,
+                sum(1 for loaded in counts['loaded'] if not loaded)))
+
+        if diff:
+            for i, _ in enumerate(cam_list):
+                log.VLOG(2, 'Camera {0}: {1} settings written, {2} already matching'.format(
+                    i, counts['written'][i], counts['skipped'][i]))
+            log.VLOG(1, '{0} settings written, {1} writes skipped (already matching)'.format(
+                sum(counts['written']), sum(counts['skipped'])))
 
         log.VLOG(4, '*** VERIFYING SETTINGS ***\n')
         # Print new changed camera settings
@@ -211,26 +883,153 @@ def set_settings(cam_list, config_dict, config_dict_primary, primary_id):
                         device_serial_number = node_device_serial_number.GetValue()
                         log.VLOG(4, 'Camera %d serial number: %s' % (i, device_serial_number))
 
-                    node_device_serial_number = PySpin.CStringPtr(
-                    cam.GetTLDeviceNodeMap().GetNode('DeviceSerialNumber'))
-                    
-                    if PySpin.IsAvailable(node_device_serial_number) and PySpin.IsReadable(node_device_serial_number):
-                        device_serial_number = node_device_serial_number.GetValue()
-                        
-                        if device_serial_number == primary_id:
-                            temp_config_dict = config_dict_primary
-                        else:
-                            temp_config_dict = config_dict
-                 
+                    temp_config_dict = camera_settings(cam, config_dict, config_dict_primary, primary_id)
                     for setting in temp_config_dict:
-                        result &= retrieve_settings(i, cam, setting, full_settings[setting])
+                        result &= retrieve_settings(i, cam, setting, setting_types[setting])
 
                     log.VLOG(4, '%%%\n')
 
                 except PySpin.SpinnakerException as ex:
                     log.error('Error: %s' % ex)
                     result = False
-                    
+
+        record_applied_settings(cam_list, config_dict, config_dict_primary, primary_id, result, user_set)
+
+    except PySpin.SpinnakerException as ex:
+        log.error('Error: %s' % ex)
+        result = False
+
+    return result
+
+
+def unlock_limits(i, cam, exposure=True):
+    """
+    Lifts the limits the link throughput limit (and the current exposure
+    time) put on a camera's frame rate, so its sensor limit can be read.
+    The caller must forget the camera's applied settings afterwards (see
+    forget_applied_settings()).
+
+    :param i: Camera index
+    :param cam: Camera
+    :param exposure: Also minimize the exposure time
+    :type cam: CameraPtr
+    :type exposure: bool
+    :return: True
+    :rtype: bool
+    """
+    nodes = node_cache(cam)
+    limits = (('DeviceLinkThroughputLimit', PySpin.CIntegerPtr, True), ('ExposureTime', PySpin.CFloatPtr, False))
+    for title, node_func, use_max in limits[:2 if exposure else 1]:
+        node = nodes.node(title, node_func)
+        if nodes.writable(title):
+            node.SetValue(node.GetMax() if use_max else node.GetMin())
+    nodes.invalidate()
+    return True
+
+
+def solve_settings(cam_list, config_dict, config_dict_primary, primary_id, bandwidth=None):
+    """
+    Finds the highest frame rate every camera can sustain with the applied
+    frame size, binning and pixel format, the longest exposure which fits
+    in a frame at that rate and a link throughput limit per camera which
+    fits the shared bandwidth, then writes them to every camera and prints
+    them as config file lines.
+
+    :param cam_list: List of configured cameras
+    :param bandwidth: Link bandwidth shared by every camera (MB/s), or None if each camera has its own link
+    :type cam_list: CameraList
+    :type bandwidth: float
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    log.VLOG(2, '*** SOLVING FRAME RATE ***\n')
+    try:
+        result = min(for_each_camera(cam_list, unlock_limits, step='Limit reading'), default=True)
+        limits = [camera_limits(node_cache(cam)) for cam in cam_list]
+        settings = [camera_settings(cam, config_dict, config_dict_primary, primary_id) for cam in cam_list]
+        for i, camera in enumerate(limits):
+            log.VLOG(2, 'Camera {0}: {1} bytes per frame, sensor limit {2} fps, readout {3} us'.format(
+                i, camera['frame_bytes'], camera['framerate_max'], camera['readout']))
+
+        proposal = solve_rig(limits, settings, bandwidth * 1e6 if bandwidth else None)
+        log.VLOG(1, 'Highest common frame rate: {0:.1f} fps (limited by {1}), exposure up to {2:.0f} us'.format(
+            proposal['framerate'], proposal['limit'], proposal['exposure']))
+
+        for i, cam in enumerate(cam_list):
+            writes = {'AcquisitionFrameRateEnable': True,
+                      'AcquisitionFrameRate': proposal['framerate'],
+                      'ExposureTime': proposal['exposure']}
+            if proposal['throughput'][i] is not None:
+                writes['DeviceLinkThroughputLimit'] = proposal['throughput'][i]
+            for setting in plan_settings(tuple(writes), exposure_first(node_cache(cam), writes)):
+                result &= change_setting(i, cam, writes[setting], setting, setting_types[setting])
+
+        print('AcquisitionFrameRateEnable          = True')
+        print('AcquisitionFrameRate                = {:.1f}'.format(proposal['framerate']))
+        print('ExposureTime                        = {:.0f}'.format(proposal['exposure']))
+        for i, throughput in enumerate(proposal['throughput']):
+            if throughput is not None:
+                print('; camera {0}: DeviceLinkThroughputLimit = {1}'.format(i, throughput))
+
+        # The cameras no longer hold the settings of the config file
+        forget_applied_settings([device_identity(cam)[0] for cam in cam_list])
+
+    except (PySpin.SpinnakerException, ValueError) as ex:
+        log.error('Error: %s' % ex)
+        result = False
+
+    return result
+
+
+def budget_settings(cam_list, system, bandwidth=None):
+    """
+    Splits the bandwidth of every interface (USB3 host controller or
+    network adapter) between its cameras, in proportion to the bytes/s
+    each streams at its frame size, bit depth and frame rate, and writes
+    the shares as DeviceLinkThroughputLimit. Warns about interfaces which
+    can't carry every camera's full frame rate.
+
+    :param cam_list: List of configured cameras
+    :param system: Spinnaker system the cameras were retrieved from (to enumerate its interfaces)
+    :param bandwidth: Bandwidth of every interface (MB/s), or None to use the link speed the cameras report
+    :type cam_list: CameraList
+    :type system: SystemPtr
+    :type bandwidth: float
+    :return: True if successful, False otherwise.
+    :rtype: bool
+    """
+    log.VLOG(2, '*** BUDGETING LINK BANDWIDTH ***\n')
+    try:
+        cams = [cam for cam in cam_list]
+
+        # The current limits throttle the frame rate, so demand is read without them
+        result = min(for_each_camera(cam_list, unlock_limits, False, step='Throughput limit reset'), default=True)
+        demands = [camera_demand(cam) for cam in cams]
+
+        for name, indices in camera_groups(system, cams).items():
+            available = link_bandwidth(cams, indices, bandwidth * 1e6 if bandwidth else None)
+            shares, oversubscribed = allocate_group([demands[i] for i in indices], available)
+            if oversubscribed:
+                log.warning('Cameras {0} on {1} need {2:.0f} MB/s but only {3:.0f} MB/s is available; their frame '
+                            'rates will drop to {4:.0%} (lower the frame rate or frame size, or move cameras to '
+                            'another controller)'.format(indices, name, sum(demands[i] for i in indices) / 1e6,
+                                                         sum(shares) / 1e6,
+                                                         sum(shares) / sum(demands[i] for i in indices)))
+
+            for i, share in zip(indices, shares):
+                throughput = read_float(node_cache(cams[i]), 'DeviceLinkThroughputLimit', PySpin.CIntegerPtr)
+                if throughput is None:
+                    log.warning('Camera {} has no link throughput limit'.format(i))
+                    continue
+                limit = fit_throughput(share, throughput)
+                log.VLOG(1, 'Camera {0} on {1}: {2:.0f} MB/s needed, limit {3:.0f} MB/s'.format(
+                    i, name, demands[i] / 1e6, limit / 1e6))
+                result &= change_setting(i, cams[i], limit, 'DeviceLinkThroughputLimit',
+                                         setting_types['DeviceLinkThroughputLimit'])
+
+        # The cameras no longer hold the settings of the config file
+        forget_applied_settings([device_identity(cam)[0] for cam in cams])
+
     except PySpin.SpinnakerException as ex:
         log.error('Error: %s' % ex)
         result = False
@@ -286,7 +1085,8 @@ def log_device_info(nodemap, cam_num, primary_id):
     return (result, cam_num) if primary_camera else result
 
 
-def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id):
+def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id, diff=False, force=False,
+                         user_set=None, solve=False, bandwidth=None, budget=False, system=None):
     """
     This function acts as the body of the example; please see NodeMapInfo example
     for more in-depth comments on setting up cameras.
@@ -294,9 +1094,22 @@ def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
     :param cam_list: List of cameras
     :param config_dict: Dictionary with config file settings and values
     :param primary_id: ID of primary camera
+    :param diff: Only write settings which differ from the cameras' current values
+    :param force: Apply the settings even if every camera was last configured with them
+    :param user_set: User set to restore the settings from or save them to (e.g. UserSet1)
+    :param solve: After applying the settings, find and write the fastest drop-free frame rate and exposure
+    :param bandwidth: Link bandwidth shared by every camera (MB/s) for solve, or of every interface for budget
+    :param budget: After applying the settings, split each interface's bandwidth between its cameras
+    :param system: Spinnaker system the cameras were retrieved from (needed with budget)
     :type cam_list: CameraList
     :type config_dict: dict
     :type primary_id: str
+    :type diff: bool
+    :type force: bool
+    :type user_set: str
+    :type solve: bool
+    :type bandwidth: float
+    :type budget: bool
     :return: True if successful, False otherwise.
     :rtype: bool
     """
@@ -325,6 +1138,16 @@ def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
                 else:
                     result &= temp_result
 
+        # Skip initialization and every write if the cameras were last
+        # configured with exactly these settings
+        if force or solve or budget:
+            log.VLOG(1, 'Applying settings to every camera ({})'.format(
+                'forced' if force else 'solving' if solve else 'budgeting'))
+        elif settings_already_applied(cam_list, config_dict, config_dict_primary, primary_id):
+            log.VLOG(1, 'Every camera is already configured with these settings, nothing to do (use --force to '
+                     're-apply, e.g. after power cycling the cameras)')
+            return result
+
         # Initialize each camera
         #
         # *** NOTES ***
@@ -336,12 +1159,19 @@ def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
         # *** LATER ***
         # Each camera needs to be deinitialized once all images have been
         # acquired.
-        for i, cam in enumerate(cam_list):
-            # Initialize camera
-            cam.Init()
+        #
+        # Cameras are initialized (and configured below) on a thread each, so
+        # setup time doesn't grow with the number of cameras.
+        result &= min(for_each_camera(cam_list, init_camera, step='Initialization'), default=True)
+
+        # Change settings on all cameras
+        result &= set_settings(cam_list, config_dict, config_dict_primary, primary_id, diff, user_set)
 
-        # Acquire images on all cameras
-        result &= set_settings(cam_list, config_dict, config_dict_primary, primary_id)
+        if solve:
+            result &= solve_settings(cam_list, config_dict, config_dict_primary, primary_id, bandwidth)
+
+        if budget:
+            result &= budget_settings(cam_list, system, bandwidth)
 
         # Deinitialize each camera
         #
@@ -349,8 +1179,10 @@ def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
         # Again, each camera must be deinitialized separately by first
         # selecting the camera and then deinitializing it.
         for cam in cam_list:
-            # Deinitialize camera
-            cam.DeInit()
+            # Deinitialize camera (unless it failed to initialize)
+            drop_node_cache(cam)
+            if cam.IsInitialized():
+                cam.DeInit()
 
         # Release reference to camera
         # NOTE: Unlike the C++ examples, we cannot rely on pointer objects being automatically
@@ -365,11 +1197,19 @@ def run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
     return result
 
 
-def main(config_dict, config_dict_primary=None, primary_id=None):
+def main(config_dict, config_dict_primary=None, primary_id=None, diff=False, force=False, user_set=None, solve=False,
+         bandwidth=None, budget=False):
     """
     Example entry point; please see Enumeration example for more in-depth
     comments on preparing and cleaning up the system.
 
+    :param diff: Only write settings which differ from the cameras' current values
+    :param force: Apply the settings even if every camera was last configured with them
+    :param user_set: User set to restore the settings from or save them to (e.g. UserSet1)
+    :param solve: After applying the settings, find and write the fastest drop-free frame rate and exposure
+    :param bandwidth: Link bandwidth shared by every camera (MB/s) for solve, or of every interface for budget
+    :param budget: After applying the settings, split each interface's bandwidth between its cameras
+
     :return: True if successful, False otherwise.
     :rtype: bool
     """
@@ -416,7 +1256,8 @@ def main(config_dict, config_dict_primary=None, primary_id=None):
     # Run example on all cameras
     log.VLOG(1, 'Changing settings for all cameras...')
 
-    result = run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id)
+    result = run_multiple_cameras(cam_list, config_dict, config_dict_primary, primary_id, diff, force, user_set,
+                                  solve, bandwidth, budget, system)
 
     log.VLOG(1, 'Setting change completed... \n')
 
@@ -430,38 +1271,27 @@ def main(config_dict, config_dict_primary=None, primary_id=None):
     return result
 
 
-def parseConfigFile(config_path, section):
-    # read settings parameters from a configuration file
-    # Input:
-    # config_path - string with relative path to configuration file
-    #
-    # Outputs:
-    # config_dict - dictionary with new configurations
-
-    # create config parser and read config file
-    config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-    config.read(config_path)
-    p = {}
-    p_config = config[section]
+def load_config(config_path):
+    """
+    Reads the settings for every camera from a config file: either one
+    [default] section for all cameras, or [primary] and [secondary] sections.
 
-    # format settings
-    for setting in full_settings:
-        if setting in p_config:
-            if full_settings[setting] == Types.FLOAT.value:
-                get_func = p_config.getfloat
-            elif full_settings[setting] == Types.INTEGER.value:
-                get_func = p_config.getint
-            elif full_settings[setting] == Types.BOOLEAN.value:
-                get_func = p_config.getboolean
-            else:
-                get_func = p_config.get
+    :param config_path: Relative path to config file
+    :type config_path: str
+    :return: (default or secondary settings, primary settings or None, primary camera ID or None)
+    :rtype: tuple
+    """
+    config = load_rig_config(config_path)
+    if not config.has_cameras:
+        raise ValueError('{}: no [default] or [primary] and [secondary] camera settings'.format(config_path))
 
-            p[setting] = get_func(setting)
+    # Copies, since callers hash and serialize them
+    if config.synced:
+        log.VLOG(3, 'Primary camera ID set to %s' % config.primary_id)
 
-    if section == 'primary':
-        p = p, p_config.get('PrimaryID')
+        return dict(config.secondary), dict(config.primary), config.primary_id
 
-    return p
+    return dict(config.default), None, None
 
 
 if __name__ == '__main__':
@@ -472,26 +1302,40 @@ if __name__ == '__main__':
                         type=str, default="1")
     parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
                         default="cpp")
+    parser.add_argument('-d', '--daemon', help='apply the settings through a running camera daemon (optionally '
+                        'the path of its socket)', nargs='?', const=DEFAULT_SOCKET, type=str)
+    parser.add_argument('--diff', help='read the current settings first and only write those which differ',
+                        action='store_true')
+    parser.add_argument('-f', '--force', help='apply the settings even if the cameras were last configured with them',
+                        action='store_true')
+    parser.add_argument('-u', '--user_set', help='load the settings from this camera user set if it holds them, '
+                        'otherwise apply them and save them to it (the camera then also loads it on power up)',
+                        choices=['UserSet1', 'UserSet2'])
+    parser.add_argument('-s', '--solve', help='after applying the settings, find the highest frame rate every camera '
+                        'can sustain at its frame size and the longest exposure at that rate, write them to the '
+                        'cameras and print them as config lines', action='store_true')
+    parser.add_argument('-B', '--budget', help='after applying the settings, split the bandwidth of each USB3 host '
+                        'controller or network adapter between its cameras as DeviceLinkThroughputLimit',
+                        action='store_true')
+    parser.add_argument('-b', '--bandwidth', help='link bandwidth in MB/s shared by every camera for --solve (e.g. '
+                        'one USB3 host controller), or of every interface for --budget', type=float)
+    parser.add_argument('--dry_run', help='print the order settings would be written in, without touching the cameras',
+                        action='store_true')
     args = parser.parse_args()
     config_path = args.config_file
     log = logger.getLogger(__file__, args.verbosity, args.logType)
 
-    config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-    config.read(config_path)
-    if dict(config['default'].items()) == {}:
-        config_dict_primary, primary_id = parseConfigFile(config_path, 'primary')
+    if args.dry_run:
+        print_plan(config_path)
+        sys.exit(0)
 
-        log.VLOG(3, 'Primary camera ID set to %s' % primary_id)
+    if args.daemon is not None:
+        response = daemon_request('settings', args.daemon, config_file=os.path.abspath(config_path), diff=args.diff)
+        sys.exit(0 if response['ok'] else 1)
 
-        config_dict_secondary = parseConfigFile(config_path, 'secondary')
-        
-        if main(config_dict_secondary, config_dict_primary, primary_id):
-            sys.exit(0)
-        else:
-            sys.exit(1)
+    config_dict, config_dict_primary, primary_id = load_config(config_path)
+    if main(config_dict, config_dict_primary, primary_id, args.diff, args.force, args.user_set, args.solve,
+            args.bandwidth, args.budget):
+        sys.exit(0)
     else:
-        config_dict = parseConfigFile(config_path, 'default')
-        if main(config_dict):
-            sys.exit(0)
-        else:
-            sys.exit(1)
+        sys.exit(1)
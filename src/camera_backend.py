@@ -0,0 +1,444 @@
+"""Camera backends for the camera daemon, and the recorder which streams them to a raw capture.
+
+A backend owns a set of streaming cameras and exposes them through a small
+interface: serials, layouts ((pixel format, width, height) per camera),
+primary_id, open(), close(), apply_settings(), capture(), set_recording(),
+flush() and grab(). PySpinBackend drives real cameras through a CameraSession;
+FakeBackend generates synthetic frames so the daemon can be run without
+hardware.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from frame_ring import RING_SLOTS
+from raw_capture import RawCaptureWriter, STATUS_COMPLETE, STATUS_INCOMPLETE
+from rig_config import load_rig_config
+from timestamp_log import TimestampLog, log_path, read_timestamps
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+GRAB_TIMEOUT = 1000  # milliseconds to wait for a frame before the recorder checks for a stop request
+
+FAKE_CAMERAS = 4
+FAKE_FRAMERATE = 30
+FAKE_WIDTH = 640
+FAKE_HEIGHT = 480
+FAKE_BUFFERS = 10  # frames each fake camera buffers while recording, before the oldest is dropped
+
+
+def raw_capture_path(folder=None):
+	"""
+	Returns the base path captures and recordings are written to, as used by
+	MultiCamAcq's raw output.
+
+	:param folder: Folder name
+	:rtype: str
+	"""
+	return 'MultiCamAcqTest/MCAT' if folder is None else 'MultiCamAcqTest/{}/MCAT'.format(folder)
+
+
+class Recorder:
+	"""
+	Records every camera of a backend into one raw capture, with a grab
+	thread per camera, until num_frames frames per camera have been recorded
+	or stop() is called. Each camera's host timestamps are streamed to its
+	timestamp log next to the capture (see timestamp_log.py).
+
+	While recording, the backend buffers every frame in order rather than
+	only the newest one, so frames are only lost if a grab thread falls
+	behind the stream buffers. Those frames are counted as dropped from
+	gaps in the cameras' frame IDs.
+	"""
+
+	def __init__(self, backend, path, num_frames):
+		"""
+		:param backend: Streaming camera backend
+		:param path: Base path of the raw capture (without extension)
+		:param num_frames: Number of frames to record per camera
+		:type path: str
+		:type num_frames: int
+		"""
+		self.backend = backend
+		self.path = path
+		self.num_frames = num_frames
+
+		num_cams = len(backend.serials)
+		self.log_paths = [log_path(path, serial) for serial in backend.serials]
+		self.stats = {'frames': [0 for _ in range(num_cams)],
+		              'dropped': [0 for _ in range(num_cams)],
+		              'incomplete': [0 for _ in range(num_cams)],
+		              'errors': [0 for _ in range(num_cams)]}
+
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		self._writer = RawCaptureWriter(path, dict(zip(backend.serials, backend.layouts)), num_frames * num_cams)
+		self._logs = [TimestampLog(path) for path in self.log_paths]
+		self._stop = threading.Event()
+		self._threads = []
+		self._start = 0
+
+	def start(self):
+		"""
+		Switches the backend to recording, drops any frames buffered before the
+		recording and starts the grab threads.
+		"""
+		self.backend.set_recording(True)
+		self.backend.flush()
+		self._start = time.perf_counter()
+		self._threads = [threading.Thread(target=self._record, name='record-{}'.format(i), args=(i,))
+		                 for i in range(len(self.backend.serials))]
+		for thread in self._threads:
+			thread.start()
+
+	def _record(self, i):
+		"""
+		Grab thread for a single camera.
+
+		:param i: Camera index
+		"""
+		serial = self.backend.serials[i]
+		timestamps = self._logs[i]
+		last_id = [None]
+
+		def store(data, status, frame_id):
+			frame_time = time.perf_counter() - self._start
+			if last_id[0] is not None and frame_id > last_id[0] + 1:
+				self.stats['dropped'][i] += frame_id - last_id[0] - 1
+			last_id[0] = frame_id
+
+			if self._writer.append(serial, len(timestamps), frame_time, data, status) is None:
+				return False
+			timestamps.append(len(timestamps), frame_time)
+			self.stats['frames'][i] += 1
+			if status == STATUS_INCOMPLETE:
+				self.stats['incomplete'][i] += 1
+			return True
+
+		while not self._stop.is_set() and len(timestamps) < self.num_frames:
+			if not self.backend.grab(i, store):
+				self.stats['errors'][i] += 1
+
+	def done(self):
+		"""
+		:return: True once every camera has recorded num_frames frames (or been stopped)
+		:rtype: bool
+		"""
+		return not any(thread.is_alive() for thread in self._threads)
+
+	def wait(self, timeout=None):
+		"""
+		Waits for every camera to record num_frames frames.
+
+		:param timeout: Seconds to wait (None waits until done)
+		:return: True if the recording is done
+		:rtype: bool
+		"""
+		deadline = None if timeout is None else time.perf_counter() + timeout
+		for thread in self._threads:
+			thread.join(None if deadline is None else max(0, deadline - time.perf_counter()))
+		return self.done()
+
+	def stop(self):
+		"""
+		Stops the grab threads, closes the raw capture and timestamp logs and
+		switches the backend back from recording.
+
+		:return: Per-camera host timestamps (seconds since the start of the recording), memory-mapped from the logs
+		:rtype: list
+		"""
+		self._stop.set()
+		for thread in self._threads:
+			thread.join()
+		self._writer.close()
+		for timestamp_log in self._logs:
+			timestamp_log.close()
+		self.backend.set_recording(False)
+
+		elapsed = time.perf_counter() - self._start
+		for i, serial in enumerate(self.backend.serials):
+			log.VLOG(1, 'Camera {0} ({1}): {2} frames recorded ({3:.2f} fps), {4} dropped, {5} incomplete, {6} grab '
+			            'errors'.format(i, serial, self.stats['frames'][i],
+			                            self.stats['frames'][i] / elapsed if elapsed else 0, self.stats['dropped'][i],
+			                            self.stats['incomplete'][i], self.stats['errors'][i]))
+			if self.stats['dropped'][i]:
+				log.warning('Camera {0} ({1}) dropped {2} frames during the recording'.format(
+					i, serial, self.stats['dropped'][i]))
+
+		return read_timestamps(self.log_paths)
+
+
+class PySpinBackend:
+	"""
+	Real cameras, kept initialized and streaming by a CameraSession.
+	"""
+
+	name = 'pyspin'
+
+	def __init__(self, writers=0, ring_slots=RING_SLOTS, overwrite=False):
+		"""
+		:param writers: Number of image writer processes (0 saves inline)
+		:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+		:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+		"""
+		self.writers = writers
+		self.ring_slots = ring_slots
+		self.overwrite = overwrite
+
+		self.session = None
+		self.cams = []
+		self.serials = []
+		self.layouts = []
+		self.primary_id = None
+
+	def open(self):
+		"""
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		from camera_session import CameraSession
+
+		self.session = CameraSession(writers=self.writers, ring_slots=self.ring_slots, overwrite=self.overwrite)
+		if not self.session.open():
+			return False
+		self.cams = [cam for cam in self.session.cam_list]
+		self._read_layouts()
+		return True
+
+	def _read_layouts(self):
+		from MultiCamAcq import camera_layout
+
+		self.serials = [str(device_num) if device_num else str(i)
+		                for i, device_num in enumerate(self.session.device_nums)]
+		self.layouts = [camera_layout(cam) for cam in self.cams]
+
+	def close(self):
+		"""
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		self.cams = []
+		return self.session.close() if self.session is not None else True
+
+	def apply_settings(self, config_path, diff=False):
+		"""
+		:param config_path: Path to a settings config file
+		:param diff: Only write settings which differ from the cameras' current values
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		result = self.session.apply_settings(config_path, diff)
+		self.primary_id = self.session.primary_id
+		self._read_layouts()
+		return result
+
+	def write_settings(self, config_dict, config_dict_primary, primary_id):
+		"""
+		Writes parsed settings (as returned by SetSettings.load_config) to every camera.
+
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		result = self.session.write_settings(config_dict, config_dict_primary, primary_id)
+		self.primary_id = self.session.primary_id
+		self._read_layouts()
+		return result
+
+	def capture(self, num_frames, folder=None, output='jpg'):
+		"""
+		Grabs and saves n=num_frames new images from each camera, like MultiCamAcq.
+
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		self.session.output = output
+		return self.session.capture(num_frames, folder)
+
+	def set_recording(self, recording):
+		"""
+		Switches every camera to OldestFirst buffering for a recording, or back
+		to NewestOnly. Streaming is restarted around the switch, which also
+		drops every buffered frame. The primary camera is stopped first and
+		started last, so it only triggers the other cameras once they stream.
+
+		:param recording: True before a recording, False after it
+		:type recording: bool
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		import PySpin
+		from camera_session import set_buffer_handling
+
+		order = list(range(len(self.cams)))
+		if self.primary_id is not None and str(self.primary_id) in self.serials:
+			primary = self.serials.index(str(self.primary_id))
+			order = [primary] + [i for i in order if i != primary]
+
+		result = True
+		streaming = []
+		for i in order:
+			try:
+				if self.cams[i].IsStreaming():
+					self.cams[i].EndAcquisition()
+					streaming += [i]
+				result &= set_buffer_handling(i, self.cams[i], 'OldestFirst' if recording else 'NewestOnly')
+			except PySpin.SpinnakerException as ex:
+				log.error('Error: %s' % ex)
+				result = False
+
+		for i in reversed([i for i in order if i in streaming]):
+			try:
+				self.cams[i].BeginAcquisition()
+			except PySpin.SpinnakerException as ex:
+				log.error('Error: %s' % ex)
+				result = False
+		return result
+
+	def flush(self):
+		"""
+		Drops the frame each camera is holding.
+		"""
+		from camera_session import discard_buffered_image
+
+		for cam in self.cams:
+			discard_buffered_image(cam)
+
+	def grab(self, i, store):
+		"""
+		Grabs camera i's next frame and hands its buffer to store(data,
+		status, frame ID) before releasing it.
+
+		:return: False if no frame was grabbed or store() failed
+		:rtype: bool
+		"""
+		import PySpin
+
+		try:
+			image = self.cams[i].GetNextImage(GRAB_TIMEOUT)
+		except PySpin.SpinnakerException as ex:
+			log.error('Error: %s' % ex)
+			return False
+
+		try:
+			return store(image.GetData(), STATUS_INCOMPLETE if image.IsIncomplete() else STATUS_COMPLETE,
+			             image.GetFrameID())
+		finally:
+			image.Release()
+
+
+class FakeBackend:
+	"""
+	Synthetic Mono8 cameras streaming at a fixed frame rate. Each frame is
+	filled with a value derived from its camera and frame number. Like the
+	real cameras, only the newest frame is kept, so a slow reader skips frames,
+	except while recording, when up to FAKE_BUFFERS frames are kept in order.
+	"""
+
+	name = 'fake'
+
+	def __init__(self, num_cameras=FAKE_CAMERAS, framerate=FAKE_FRAMERATE, width=FAKE_WIDTH, height=FAKE_HEIGHT):
+		"""
+		:param num_cameras: Number of cameras
+		:param framerate: Frames per second
+		:param width: Frame width
+		:param height: Frame height
+		"""
+		self.framerate = framerate
+		self.serials = ['FAKE{}'.format(i) for i in range(num_cameras)]
+		self.layouts = [('Mono8', width, height) for _ in range(num_cameras)]
+		self.primary_id = None
+		self._start = 0
+		self._next = [0 for _ in range(num_cameras)]
+		self._buffers = 1
+
+	def open(self):
+		self._start = time.perf_counter()
+		log.VLOG(1, 'Fake backend streaming {} cameras at {} fps'.format(len(self.serials), self.framerate))
+		return True
+
+	def close(self):
+		return True
+
+	def apply_settings(self, config_path, diff=False):
+		"""
+		Takes the frame rate and frame size from a settings config file.
+
+		:param config_path: Path to a settings config file
+		:param diff: Unused (there are no camera nodes to compare)
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		try:
+			config = load_rig_config(config_path)
+		except (OSError, ValueError) as ex:
+			log.error('Unable to read config file {0}: {1}'.format(config_path, ex))
+			return False
+
+		for p_config in config.camera_sections().values():
+			self.framerate = p_config.get('AcquisitionFrameRate', self.framerate)
+			self.layouts = [('Mono8', p_config.get('Width', width), p_config.get('Height', height))
+			                for _, width, height in self.layouts]
+		self.primary_id = config.primary_id
+
+		self.open()
+		return True
+
+	def capture(self, num_frames, folder=None, output='raw'):
+		"""
+		Records n=num_frames new frames from each camera. There is no image
+		encoder without PySpin, so frames are always written as a raw capture.
+
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		if output != 'raw':
+			log.warning('The fake backend only writes raw captures')
+		recorder = Recorder(self, raw_capture_path(folder), num_frames)
+		recorder.start()
+		recorder.wait()
+		recorder.stop()
+		return not any(recorder.stats['errors'])
+
+	def set_recording(self, recording):
+		"""
+		:param recording: True to keep up to FAKE_BUFFERS frames in order, False to keep only the newest
+		:type recording: bool
+		:return: True
+		:rtype: bool
+		"""
+		self._buffers = FAKE_BUFFERS if recording else 1
+		return True
+
+	def flush(self):
+		"""
+		Skips every camera to its next frame.
+		"""
+		tick = int((time.perf_counter() - self._start) * self.framerate) + 1
+		self._next = [max(n, tick) for n in self._next]
+
+	def grab(self, i, store):
+		"""
+		Waits for camera i's next frame and hands it to store(data, status,
+		frame ID).
+
+		:return: False if store() failed
+		:rtype: bool
+		"""
+		tick = max(self._next[i], int((time.perf_counter() - self._start) * self.framerate) - self._buffers + 1)
+		delay = self._start + tick / self.framerate - time.perf_counter()
+		if delay > 0:
+			time.sleep(delay)
+		self._next[i] = tick + 1
+
+		_, width, height = self.layouts[i]
+		return store(np.full((height, width), (tick + 64 * i) % 256, dtype=np.uint8), STATUS_COMPLETE, tick)
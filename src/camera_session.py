@@ -0,0 +1,285 @@
+"""Persistent camera session: initialize once, keep streaming, capture on demand."""
+
+import os
+import sys
+import time
+
+import PySpin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from frame_ring import RING_SLOTS
+from MultiCamAcq import start_acquisition, create_writer, capture_images
+from SetSettings import load_config, set_settings, node_cache, drop_node_cache
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+DISCARD_TIMEOUT = 10  # milliseconds to wait for a stale buffered frame before a capture
+
+
+def set_buffer_handling(i, cam, mode='NewestOnly'):
+	"""
+	Sets how a camera's stream buffers frames: NewestOnly keeps only the
+	newest frame, so frames streamed between captures don't pile up;
+	OldestFirst hands out every frame in order, for recordings.
+
+	:param i: Camera index
+	:param cam: Camera
+	:param mode: StreamBufferHandlingMode entry
+	:type cam: CameraPtr
+	:type mode: str
+	:return: True if successful, False otherwise.
+	:rtype: bool
+	"""
+	node_buffer_handling = PySpin.CEnumerationPtr(cam.GetTLStreamNodeMap().GetNode('StreamBufferHandlingMode'))
+	if not PySpin.IsAvailable(node_buffer_handling) or not PySpin.IsWritable(node_buffer_handling):
+		log.warning('Unable to set stream buffer handling mode (node retrieval; camera %d).' % i)
+		return False
+
+	node_mode = node_buffer_handling.GetEntryByName(mode)
+	if not PySpin.IsAvailable(node_mode) or not PySpin.IsReadable(node_mode):
+		log.warning('Unable to set stream buffer handling mode (entry \'%s\' retrieval; camera %d).' % (mode, i))
+		return False
+
+	node_buffer_handling.SetIntValue(node_mode.GetValue())
+	return True
+
+
+def discard_buffered_image(cam):
+	"""
+	Drops the frame a streaming camera is holding, so the next grab is of a
+	frame taken after this call.
+
+	:param cam: Camera
+	:type cam: CameraPtr
+	"""
+	try:
+		cam.GetNextImage(DISCARD_TIMEOUT).Release()
+	except PySpin.SpinnakerException:
+		pass
+
+
+class CameraSession:
+	"""
+	Owns the Spinnaker system and all cameras for as long as it is open. The
+	cameras are initialized and start streaming once; capture() then only
+	pays for the frames themselves.
+
+	Usage::
+
+		with CameraSession() as session:
+			session.capture(1, 'position-0')
+	"""
+
+	def __init__(self, serial=False, writers=0, ring_slots=RING_SLOTS, overwrite=False, output='jpg'):
+		"""
+		:param serial: Grab and save on a single thread instead of per-camera threads
+		:param writers: Number of image writer processes (0 saves inline)
+		:param ring_slots: Number of shared-memory frame slots between the grab side and the writers (0 pickles frames)
+		:param overwrite: Overwrite the oldest unsaved frame instead of dropping new frames when the frame ring is full
+		:param output: Output type: jpg (one file per frame) or raw (one unconverted raw capture per capture)
+		"""
+		self.serial = serial
+		self.writers = writers if output != 'raw' else 0
+		self.ring_slots = ring_slots
+		self.overwrite = overwrite
+		self.output = output
+
+		self.system = None
+		self.cam_list = None
+		self.device_nums = []
+		self.primary_id = None
+		self.writer = None
+
+	def open(self):
+		"""
+		Initializes every camera and starts streaming.
+
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		# Since this application saves images in the current folder
+		# we must ensure that we have permission to write to this folder.
+		# If we do not have permission, fail right away.
+		try:
+			test_file = open('test.txt', 'w+')
+		except IOError:
+			log.error('Unable to write to current directory. Please check permissions.')
+			return False
+
+		test_file.close()
+		os.remove(test_file.name)
+
+		start = time.perf_counter()
+
+		# Retrieve singleton reference to system object
+		self.system = PySpin.System.GetInstance()
+
+		version = self.system.GetLibraryVersion()
+		log.VLOG(3, 'Library version: %d.%d.%d.%d' % (version.major, version.minor, version.type, version.build))
+
+		# Retrieve list of cameras from the system
+		self.cam_list = self.system.GetCameras()
+		num_cameras = self.cam_list.GetSize()
+		log.VLOG(1, 'Number of cameras detected: %d' % num_cameras)
+
+		if num_cameras == 0:
+			log.warning('Not enough cameras!')
+			self.close()
+			return False
+
+		try:
+			result = True
+			for i, cam in enumerate(self.cam_list):
+				cam.Init()
+				result &= set_buffer_handling(i, cam)
+
+			started, self.device_nums = start_acquisition(self.cam_list, self.system)
+			result &= started
+
+			self.writer = create_writer(self.cam_list, self.writers, self.ring_slots, self.overwrite)
+
+		except PySpin.SpinnakerException as ex:
+			log.error('Error: %s' % ex)
+			self.close()
+			return False
+
+		log.VLOG(1, 'Camera session ready in {:.3f} s'.format(time.perf_counter() - start))
+		return result
+
+	def capture(self, num_frames=1, folder=None):
+		"""
+		Grabs and saves n=num_frames new images from each camera.
+
+		:param num_frames: Number of frames to capture
+		:param folder: Folder name
+		:type num_frames: int
+		:type folder: str
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		for cam in self.cam_list:
+			discard_buffered_image(cam)
+
+		try:
+			return capture_images(self.cam_list, self.device_nums, num_frames, folder, self.serial, self.writer,
+			                      self.output)
+		except PySpin.SpinnakerException as ex:
+			log.error('Error: %s' % ex)
+			return False
+
+	def apply_settings(self, config_path, diff=False):
+		"""
+		Stops streaming, applies a settings config file to every camera and
+		starts streaming again. The writer stage is restarted, since the frame
+		size may have changed.
+
+		:param config_path: Relative path to config file
+		:param diff: Only write settings which differ from the cameras' current values
+		:type config_path: str
+		:type diff: bool
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		# An invalid config file fails before streaming stops
+		config_dict, config_dict_primary, primary_id = load_config(config_path)
+		return self.write_settings(config_dict, config_dict_primary, primary_id, diff)
+
+	def write_settings(self, config_dict, config_dict_primary, primary_id, diff=False):
+		"""
+		Stops streaming, writes parsed settings (as returned by load_config) to
+		every camera and starts streaming again, like apply_settings().
+
+		:param config_dict: Default or secondary settings
+		:param config_dict_primary: Primary settings (or None)
+		:param primary_id: Serial number of the primary camera (or None)
+		:param diff: Only write settings which differ from the cameras' current values
+		:type config_dict: dict
+		:type config_dict_primary: dict
+		:type diff: bool
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		result = True
+
+		if self.writer is not None:
+			result &= self.writer.close()
+			self.writer = None
+
+		try:
+			for cam in self.cam_list:
+				if cam.IsStreaming():
+					cam.EndAcquisition()
+				# Node writability differs while streaming
+				node_cache(cam).invalidate()
+
+			self.primary_id = primary_id
+			result &= set_settings(self.cam_list, config_dict, config_dict_primary, self.primary_id, diff)
+
+			started, self.device_nums = start_acquisition(self.cam_list, self.system)
+			result &= started
+			for cam in self.cam_list:
+				node_cache(cam).invalidate()
+
+			self.writer = create_writer(self.cam_list, self.writers, self.ring_slots, self.overwrite)
+
+		except PySpin.SpinnakerException as ex:
+			log.error('Error: %s' % ex)
+			result = False
+
+		return result
+
+	def close(self):
+		"""
+		Stops streaming, deinitializes every camera and releases the system.
+
+		:return: True if successful, False otherwise.
+		:rtype: bool
+		"""
+		result = True
+
+		if self.writer is not None:
+			result &= self.writer.close()
+			self.writer = None
+
+		if self.cam_list is not None and self.cam_list.GetSize() > 0:
+			for cam in self.cam_list:
+				try:
+					if cam.IsStreaming():
+						cam.EndAcquisition()
+					drop_node_cache(cam)
+					if cam.IsInitialized():
+						cam.DeInit()
+				except PySpin.SpinnakerException as ex:
+					log.error('Error: %s' % ex)
+					result = False
+
+			# Release reference to camera
+			# NOTE: Unlike the C++ examples, we cannot rely on pointer objects being automatically
+			# cleaned up when going out of scope.
+			del cam
+
+		if self.cam_list is not None:
+			# Clear camera list before releasing system
+			self.cam_list.Clear()
+			self.cam_list = None
+
+		if self.system is not None:
+			# Release system instance
+			self.system.ReleaseInstance()
+			self.system = None
+
+		return result
+
+	def __enter__(self):
+		if not self.open():
+			raise RuntimeError('Unable to open camera session')
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.close()
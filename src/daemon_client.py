@@ -0,0 +1,63 @@
+"""Client side of the camera daemon's control socket (see CameraDaemon.py).
+
+Requests and responses are single lines of JSON. Every request names a
+command and carries the client's working directory, so captures and
+timestamps land where they would if the script had run the cameras itself.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'spinnaker-python.sock')
+
+
+def daemon_request(command, socket_path=DEFAULT_SOCKET, timeout=None, **params):
+	"""
+	Sends one command to the camera daemon and waits for its response.
+
+	:param command: Command name (ping, settings, capture, start, stop, stats, shutdown)
+	:param socket_path: Path of the daemon's Unix socket
+	:param timeout: Seconds to wait for the response (None waits forever)
+	:param params: Command parameters
+	:type command: str
+	:type socket_path: str
+	:return: Response, with 'ok' set to False (and an 'error') if the command failed
+	:rtype: dict
+	"""
+	message = dict(params, command=command, cwd=os.getcwd())
+
+	start = time.perf_counter()
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.settimeout(timeout)
+			sock.connect(socket_path)
+			sock.sendall((json.dumps(message) + '\n').encode())
+			with sock.makefile('r') as response_file:
+				response = response_file.readline()
+	except OSError as ex:
+		log.error('Unable to reach the camera daemon at {}: {}'.format(socket_path, ex))
+		return {'ok': False, 'error': str(ex)}
+
+	if not response:
+		log.error('The camera daemon closed the connection without responding to {}'.format(command))
+		return {'ok': False, 'error': 'no response'}
+
+	response = json.loads(response)
+	if response['ok']:
+		log.VLOG(2, 'Daemon {} finished in {:.3f} s'.format(command, time.perf_counter() - start))
+	else:
+		log.error('Daemon {} failed: {}'.format(command, response.get('error')))
+	return response
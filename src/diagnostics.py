@@ -4,7 +4,6 @@ import os
 from multiprocess_logging import install_mp_handler
 from multiprocessing import Pool
 import argparse
-import configparser
 import random
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
@@ -14,12 +13,21 @@ import os
 import numpy as np
 from scipy import stats
 
+from daemon_client import DEFAULT_SOCKET
+from quantile_sketch import SKETCH_SIZE, QuantileSketch
+from raw_capture import RawCaptureReader
+from rig_config import load_rig_config
+from timestamp_file import BLOCK_FRAMES, aligned_blocks, timestamp_table, timestamps_path
+
 if not __name__ == "__main__":
 	import traceback
 
 	filename = traceback.format_stack()[0]
 	log = logger.getLogger(filename.split('"')[1])
 
+WORST_FRAMES = 20  # frames furthest from the average fps listed by the chunked report
+LAG_FRAMES = 6  # lagged frames the lag check looks at
+
 
 def square(num):
 	"""
@@ -51,12 +59,191 @@ def main():
 	return result
 
 
-def interpret_file(sync, summary=False, framerate=-1, frame_total=0):
+def window_stats(all_times):
+	"""
+	Computes the per-frame statistics of a (frames x cameras) timestamp
+	table as whole-array operations, over windows of about a tenth of the
+	frames (frames past the last whole window are left out).
+
+	:param all_times: Timestamps (s)
+	:type all_times: numpy.ndarray
+	:return: window size, mean timestamp of every frame, (windows x window size) fps between frames and
+		(windows x cameras x window size) distances from the first camera to capture each frame
+	:rtype: tuple
+	"""
+	frames, num_cams = all_times.shape
+	mult = int(10 ** (np.log10(frames) - 1))
+	windows = int(frames / mult)
+	times = np.ascontiguousarray(all_times[:windows * mult])
+
+	avg_time = times.sum(axis=1) / num_cams
+	steps = np.diff(avg_time, prepend=0)
+	fps = np.divide(1, steps, out=np.zeros_like(steps), where=steps != 0)
+
+	distances = times - times.min(axis=1, keepdims=True)
+	distances = np.ascontiguousarray(distances.reshape(windows, mult, num_cams).transpose(0, 2, 1))
+	return mult, avg_time, fps.reshape(windows, mult), distances
+
+
+def first_lag(lagged_frames):
+	"""
+	:param lagged_frames: (frame, fps) of the frames (past the first few) below 90% of the frame rate, in order
+	:return: The first of the first few lagged frames which lag in a row, or () if no frame lagged
+	:rtype: tuple
+	"""
+	lag_check = lagged_frames[:min(5, len(lagged_frames))]
+	i = 1
+	while len(lagged_frames) > 0 and lag_check[-1][0] - lag_check[0][0] > len(lag_check) - 1:
+		lag_check = lagged_frames[i:min(LAG_FRAMES, len(lagged_frames))]
+		i += 1
+	return () if len(lagged_frames) == 0 else lag_check[0]
+
+
+def keep_extremes(frames, fps, block_frames, block_fps, count):
+	"""
+	:return: (frame, fps) of the count slowest and count fastest frames of two sets of frames
+	:rtype: tuple
+	"""
+	frames = np.concatenate([frames, block_frames])
+	fps = np.concatenate([fps, block_fps])
+	if len(fps) > 2 * count:
+		order = np.argsort(fps, kind='stable')
+		keep = np.concatenate([order[:count], order[-count:]])
+		frames, fps = frames[keep], fps[keep]
+	return frames, fps
+
+
+def interpret_chunked(path, summary=False, framerate=-1, frame_total=0, block_frames=BLOCK_FRAMES,
+                      sketch_size=SKETCH_SIZE, worst_frames=WORST_FRAMES):
+	"""
+	Prints the same report as interpret_file() for a timestamp file, reading
+	it in blocks of block_frames frames (see timestamp_file.aligned_blocks())
+	and keeping running statistics. Trimmed means and the number of frames
+	off the average fps come from quantile sketches, so they are approximate
+	once a sketch holds more than sketch_size values, and only the
+	worst_frames frames furthest from the average fps are listed. Memory is
+	bounded by block_frames, sketch_size and the number of cameras, whatever
+	the length of the recording.
+
+	:param path: Path of a timestamp file
+	:param block_frames: Frames read at once
+	:param sketch_size: Items kept per level of each quantile sketch
+	:param worst_frames: Number of slowest and of fastest frames kept
+	:return: (frames, first lagged frame) if framerate is set
+	:rtype: tuple
+	"""
+	# first pass: count the frames every camera has, to lay out the windows
+	frames, total = 0, 0
+	for block in aligned_blocks(path, block_frames):
+		total += len(block)
+		frames += int(np.count_nonzero(~np.isnan(block).any(axis=1)))
+	if frames < total:
+		log.warning('{0} of {1} frames are missing on at least one camera and are skipped'.format(
+			total - frames, total))
+
+	mult = int(10 ** (np.log10(frames) - 1))
+	windows = int(frames / mult)
+	used = windows * mult
+
+	fps_sketch = QuantileSketch(sketch_size)
+	distance_sketch = QuantileSketch(sketch_size)
+	window_fps = np.zeros(windows)
+	window_distances = []
+	avgTime = []
+	extremes = (np.zeros(0, dtype=np.int64), np.zeros(0))
+	lagged_frames = []
+	lag_start = min(int(frame_total/2), 50)
+
+	# second pass: the statistics of window_stats(), block by block
+	done, prev_time = 0, 0
+	for block in aligned_blocks(path, block_frames):
+		times = block[~np.isnan(block).any(axis=1)][:used - done]
+		if not len(times):
+			continue
+		num_cams = times.shape[1]
+		index = done + np.arange(len(times))
+		window = index // mult
+
+		avg_time = times.sum(axis=1) / num_cams
+		steps = np.diff(avg_time, prepend=prev_time)
+		fps = np.divide(1, steps, out=np.zeros_like(steps), where=steps != 0)
+		prev_time = avg_time[-1]
+		distances = times - times.min(axis=1, keepdims=True)
+
+		fps_sketch.update(fps)
+		distance_sketch.update(distances)
+		window_fps += np.bincount(window, fps, minlength=windows)
+		extremes = keep_extremes(*extremes, index, fps, worst_frames)
+		if framerate >= 0 and len(lagged_frames) < LAG_FRAMES:
+			late = np.flatnonzero((index >= lag_start) & (fps < framerate * 0.9))[:LAG_FRAMES - len(lagged_frames)]
+			lagged_frames += [(int(index[k]), fps[k]) for k in late]
+
+		if not summary:
+			for w in np.unique(window):
+				if w == len(window_distances):
+					window_distances += [[QuantileSketch(sketch_size) for _ in range(num_cams)]]
+				for c in range(num_cams):
+					window_distances[w][c].update(distances[window == w, c])
+			if mult == 1:
+				avgTime += list(avg_time)
+
+		done += len(times)
+		if done == used:
+			break
+
+	if not summary:
+		for i in range(windows):
+			message = 'FRAMES {}-{}'.format(i * mult, (i+1) * mult - 1) if mult > 1 else 'FRAME {}'.format(i)
+			print("----------- {} -----------".format(message))
+			if mult == 1:
+				print("average capture time (s): {0}".format(avgTime[i:i + 1]))
+			print("               distances: {0}".format(
+				[np.round(sketch.trimmed_mean(0.1), decimals=5) for sketch in window_distances[i]]))
+			print("                     fps: {0}".format(window_fps[i] / mult))
+
+	avgFPS = fps_sketch.trimmed_mean(0.1)
+	print()
+	if not summary:
+		print('-------------------------------------------')
+	print('                 AVERAGE FPS: {}'.format(np.round(avgFPS, decimals=5)))
+	print('            AVERAGE DISTANCE: {}'.format(np.round(distance_sketch.trimmed_mean(0.1), decimals=7)))
+	print('             FRAMES CAPTURED: {}'.format(frames))
+	if not summary:
+		off = fps_sketch.rank(avgFPS * 0.95) + len(fps_sketch) - fps_sketch.rank(avgFPS * 1.05, side='right')
+		extreme_frames, extreme_fps = extremes
+		deviation = np.abs(extreme_fps - avgFPS) / avgFPS
+		worst = np.argsort(-deviation, kind='stable')[:worst_frames]
+		worst = worst[deviation[worst] > 0.05]
+		worst = worst[np.argsort(extreme_frames[worst], kind='stable')]
+		print("FRAMES NOT WITHIN 5% AVG FPS: {0:.0f} (worst: {1})".format(
+			off, [(int(extreme_frames[k]), extreme_fps[k]) for k in worst]))
+
+	if framerate >= 0:
+		return frames, first_lag(lagged_frames)
+
+
+def interpret_file(sync, summary=False, framerate=-1, frame_total=0, chunked=None, sketch_size=SKETCH_SIZE):
+	"""
+	Prints the frame rate and synchronization report of a recording.
+
+	:param chunked: Frames to read at once, to stream a timestamp file (see interpret_chunked()); None loads it whole
+	:param sketch_size: Items kept per level of the quantile sketches of the chunked mode
+	"""
 	if sync:
-		if summary:
-			all_times = np.loadtxt('Timestamps/MCAT-timestamps-{}.csv'.format(frame_total), delimiter=',')
+		capture_num = int(frame_total) if summary else -1
+		if os.path.exists(timestamps_path(capture_num)) and chunked:
+			return interpret_chunked(timestamps_path(capture_num), summary, framerate, frame_total, chunked, sketch_size)
+		if chunked:
+			log.warning('Only timestamp files can be read in chunks; loading the whole recording')
+		if os.path.exists(timestamps_path(capture_num)):
+			# Timestamp file: the columns are memory-mapped, nothing is parsed
+			all_times = timestamp_table(timestamps_path(capture_num))
 		else:
-			all_times = np.loadtxt('MCAT-timestamps.csv', delimiter=',')
+			all_times = np.loadtxt(timestamps_path(capture_num, 'csv'), delimiter=',', ndmin=2)
+		frames = all_times.shape[0]
+	elif os.path.exists(os.path.join('MultiCamAcqTest', 'MCAT.idx')):
+		# Raw capture: host timestamps come straight from the memory-mapped index
+		all_times = RawCaptureReader(os.path.join('MultiCamAcqTest', 'MCAT')).timestamps()
 		frames = all_times.shape[0]
 	else:
 		lines = sorted(glob.glob(os.path.join('MultiCamAcqTest', '*')))
@@ -71,32 +258,25 @@ def interpret_file(sync, summary=False, framerate=-1, frame_total=0):
 			all_times += [[lines[i + (j * frames)][2] for j in range(len(lines) // frames)]]
 		all_times = np.array(all_times)
 
-	prev_time = [0]
-	mult = int(10 ** (np.log10(frames) - 1))
-	fps_list = np.zeros((int(frames / mult), mult))
-	distance_list = np.zeros((int(frames / mult), all_times.shape[1], mult))
-	for i in range(int(frames / mult)):
-		times = all_times[mult*i:,:] if mult * (i + 1) > frames else all_times[mult * i  : mult * (i + 1),:]
-		avgTime = [np.sum(time) / time.size for time in times]
-
-		fps = [0 if avgTime[0] == prev_time[-1] else (1 / (avgTime[0] - prev_time[-1]))]
-		fps += [0 if avgTime[i] == avgTime[i+1] else (1 / (avgTime[i+1] - avgTime[i])) for i in range(mult - 1)]
-		fps = np.array(fps)
+	# frames some camera has no match for (see frame_alignment.py) are left out
+	gaps = np.isnan(all_times).any(axis=1)
+	if gaps.any():
+		log.warning('{0} of {1} frames are missing on at least one camera and are skipped'.format(
+			np.count_nonzero(gaps), len(gaps)))
+		all_times = all_times[~gaps]
+		frames = all_times.shape[0]
 
-		distances = np.transpose(np.array([[item - np.min(time) for item in time] for time in times]))
-		display_distances = [np.round(stats.trim_mean(distance, 0.1), decimals=5) for distance in distances]
+	mult, avgTime, fps_list, distance_list = window_stats(all_times)
 
-		if not summary:
+	if not summary:
+		display_distances = np.round(stats.trim_mean(distance_list, 0.1, axis=2), decimals=5)
+		for i in range(len(fps_list)):
 			message = 'FRAMES {}-{}'.format(i * mult, (i+1) * mult - 1) if mult > 1 else 'FRAME {}'.format(i)
 			print("----------- {} -----------".format(message))
 			if mult == 1:
-				print("average capture time (s): {0}".format(avgTime))
-			print("               distances: {0}".format(display_distances))
-			print("                     fps: {0}".format(np.mean(fps)))
-
-		fps_list[i,:] = fps
-		distance_list[i, :, :] = distances
-		prev_time = avgTime
+				print("average capture time (s): {0}".format(list(avgTime[i:i + 1])))
+			print("               distances: {0}".format(list(display_distances[i])))
+			print("                     fps: {0}".format(np.mean(fps_list[i])))
 
 	fps_list = np.reshape(fps_list, -1)
 	distance_list = np.reshape(distance_list, -1)
@@ -109,16 +289,13 @@ def interpret_file(sync, summary=False, framerate=-1, frame_total=0):
 	print('            AVERAGE DISTANCE: {}'.format(np.round(stats.trim_mean(distance_list, 0.1), decimals=7)))
 	print('             FRAMES CAPTURED: {}'.format(frames))
 	if not summary:
-		print("FRAMES NOT WITHIN 5% AVG FPS: {}".format(list(filter(lambda x: np.abs(x[1] - avgFPS) / avgFPS > 0.05, enumerate(fps_list)))))
+		off_frames = np.flatnonzero(np.abs(fps_list - avgFPS) / avgFPS > 0.05)
+		print("FRAMES NOT WITHIN 5% AVG FPS: {}".format([(i, fps_list[i]) for i in off_frames.tolist()]))
 	
 	if framerate >= 0:
-		lagged_frames = list(filter(lambda x: x[1] < framerate * 0.9, list(enumerate(fps_list))[min(int(frame_total/2), 50):]))
-		lag_check = lagged_frames[:min(5, len(lagged_frames))]
-		i = 1
-		while len(lagged_frames) > 0 and lag_check[-1][0] - lag_check[0][0] > len(lag_check) - 1:
-			lag_check = lagged_frames[i:min(5+1, len(lagged_frames))]
-			i += 1
-		return frames, () if len(lagged_frames) == 0 else lag_check[0]
+		start = min(int(frame_total/2), 50)
+		lagged_frames = [(i, fps_list[i]) for i in (start + np.flatnonzero(fps_list[start:] < framerate * 0.9)).tolist()]
+		return frames, first_lag(lagged_frames)
 
 
 def parseConfigFile(config_path, section):
@@ -129,23 +306,20 @@ def parseConfigFile(config_path, section):
 	# Outputs:
 	# config_dict - dictionary with new configurations
 
-	# create config parser and read config file
-	config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-	config.read(config_path)
-	p = {}
-	p_config = config[section]
+	# read the compiled config file
+	config = load_rig_config(config_path)
+	p_config = getattr(config, section)
 	result = []
 
 	if section != 'secondary':
-		test_config = config['aggregation']
-		result += [test_config.getint('RangeMin')]
-		result += [test_config.getint('RangeMax')]
-		result += [test_config.getint('NumReps')]
+		result += [config.aggregation.range_min]
+		result += [config.aggregation.range_max]
+		result += [config.aggregation.num_reps]
 
-	result += [p_config.getint('AcquisitionFrameRate')]
+	result += [int(p_config['AcquisitionFrameRate'])]
 	if section == 'primary':
-		if p_config.getboolean('V3_3Enable') is not None:
-			result += [p_config.get('PrimaryID')]
+		if 'V3_3Enable' in p_config:
+			result += [config.primary_id]
 		else:
 			result += [-1]
 
@@ -155,12 +329,19 @@ def parseConfigFile(config_path, section):
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-s', '--sync', help='true if multiprocessing acquisition was used', type=bool, default=False)
-	parser.add_argument('-a', '--aggregate', help='true if multiple runs over a range of values', type=bool, default=False)
+	parser.add_argument('-a', '--aggregate', help='true if multiple runs over a range of values (each run is recorded as '
+	                    'a raw capture, not as AVI videos)', type=bool, default=False)
 	parser.add_argument('-c', '--config_file', help='relative path to config file', type=str)
 	parser.add_argument('-v', '--verbosity', help='verbosity level for file prints (1 through 4 or DEBUG, INFO, etc.)',
 	                    type=str, default="1")
 	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
 	                    default="cpp")
+	parser.add_argument('-d', '--daemon', help='record the aggregate runs through a running camera daemon (optionally '
+	                    'the path of its socket)', nargs='?', const=DEFAULT_SOCKET, type=str)
+	parser.add_argument('-k', '--chunked', help='stream the timestamp file in blocks of this many frames (default '
+	                    '{}) instead of loading it whole'.format(BLOCK_FRAMES), nargs='?', const=BLOCK_FRAMES, type=int)
+	parser.add_argument('--sketch_size', help='items kept per level of the quantile sketches of the chunked mode',
+	                    type=int, default=SKETCH_SIZE)
 	args = parser.parse_args()
 	config_path = args.config_file
 	log = logger.getLogger(__file__, args.verbosity, args.logType)
@@ -168,20 +349,23 @@ if __name__ == '__main__':
 	import MultiCamAcqSync
 
 	if args.aggregate:
-		config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
-		config.read(config_path)
-		if dict(config['default'].items()) == {}:
+		if load_rig_config(config_path).synced:
 			try:
 				range_min, range_max, num_reps, framerate1, primary_id = parseConfigFile(config_path, 'primary')
 				framerate2 = parseConfigFile(config_path, 'secondary')[0]
+				_, exposure1, binsize1, _ = MultiCamAcqSync.parseConfigFile(config_path, 'primary')
 				assert framerate1 == framerate2, "Primary and secondary camera frame rates are unequal! P: {}, S: {}".format(framerate1, framerate2)
 				for stop_frame in np.linspace(range_min, range_max, num=num_reps):
 					stop_frame = int(stop_frame)
 					print('-------------------------------------------')
 					print('                  Num Frames: {}'.format(stop_frame))
-					MultiCamAcqSync.main(framerate1, primary_id, capture_num=stop_frame)
+					if args.daemon is not None:
+						MultiCamAcqSync.record_with_daemon(args.daemon, capture_num=stop_frame)
+					else:
+						MultiCamAcqSync.record_frames(framerate1, exposure1, binsize1, primary_id, stop_frame)
 					stopDict = {}
-					stopDict[stop_frame] = interpret_file(args.sync, summary=True, framerate=framerate1, frame_total=stop_frame)
+					stopDict[stop_frame] = interpret_file(args.sync, summary=True, framerate=framerate1, frame_total=stop_frame,
+					                                          chunked=args.chunked, sketch_size=args.sketch_size)
 					print('           Frame Stop w/ FPS: {}'.format(stopDict[stop_frame]))
 					print()
 				print('-------------------------------------------')
@@ -194,11 +378,16 @@ if __name__ == '__main__':
 				print(stopDict)
 		else:
 			range_min, range_max, num_reps, framerate = parseConfigFile(config_path, 'default')
+			_, exposure, binsize = MultiCamAcqSync.parseConfigFile(config_path, 'default')
 			for stop_frame in np.linspace(range_min, range_max, num=num_reps):
-				MultiCamAcqSync.main(framerate, -1)
-				interpret_file(args.sync, summary=True, framerate=framerate, frame_total=stop_frame)
+				if args.daemon is not None:
+					MultiCamAcqSync.record_with_daemon(args.daemon, capture_num=int(stop_frame))
+				else:
+					MultiCamAcqSync.record_frames(framerate, exposure, binsize, -1, int(stop_frame))
+				interpret_file(args.sync, summary=True, framerate=framerate, frame_total=stop_frame, chunked=args.chunked,
+				               sketch_size=args.sketch_size)
 	else:
-		interpret_file(args.sync)
+		interpret_file(args.sync, chunked=args.chunked, sketch_size=args.sketch_size)
 
 	# if main():
 	# 	sys.exit(0)
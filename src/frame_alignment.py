@@ -0,0 +1,124 @@
+"""Timestamp matching of every camera's frames to the primary camera's.
+
+Cropping every camera to the one with the fewest frames misaligns every
+frame after the first dropped one. align_frames() instead matches each
+frame of the reference (primary) camera to the nearest frame of every other
+camera, with np.searchsorted over whole columns, and only within a
+tolerance. The result is a frame index table, one row per reference frame
+and one column per camera, where GAP marks a reference frame a camera has
+no frame for. Each camera frame is matched at most once.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+GAP = -1  # frame index of a reference frame a camera has no frame for
+TOLERANCE = 0.5  # default tolerance, in reference frame periods
+
+
+def frame_period(times):
+	"""
+	:param times: Timestamps of one camera
+	:return: Median time between its frames (0 if it has fewer than 2 frames)
+	:rtype: float
+	"""
+	return float(np.median(np.diff(times))) if len(times) > 1 else 0.0
+
+
+def match_nearest(times, reference, tolerance):
+	"""
+	Matches every reference timestamp to the nearest timestamp of one
+	camera. Both must be sorted.
+
+	:param times: Timestamps of the camera
+	:param reference: Timestamps of the reference camera
+	:param tolerance: Largest time difference of a match
+	:type times: numpy.ndarray
+	:type reference: numpy.ndarray
+	:type tolerance: float
+	:return: Frame index of the camera per reference frame (GAP if unmatched)
+	:rtype: numpy.ndarray
+	"""
+	if len(times) == 0:
+		return np.full(len(reference), GAP, dtype=np.int64)
+
+	after = np.clip(np.searchsorted(times, reference), 0, len(times) - 1)
+	before = np.maximum(after - 1, 0)
+	nearest = np.where(np.abs(times[before] - reference) <= np.abs(times[after] - reference), before, after)
+	distance = np.abs(times[nearest] - reference)
+	match = np.where(distance <= tolerance, nearest, GAP).astype(np.int64)
+
+	# a camera frame matched by several reference frames only stays with the closest one (the nearest frames of
+	# sorted reference timestamps are sorted too, so such reference frames are neighbours)
+	matched = np.flatnonzero(match != GAP)
+	values = match[matched]
+	starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+	if len(starts) < len(matched):
+		closest = np.minimum.reduceat(distance[matched], starts)
+		keep = distance[matched] == np.repeat(closest, np.diff(np.r_[starts, len(matched)]))
+		kept = matched[keep]
+		match[matched[~keep]] = GAP
+		match[kept[1:][match[kept[1:]] == match[kept[:-1]]]] = GAP
+	return match
+
+
+def align_frames(columns, reference=0, tolerance=None, relative=False):
+	"""
+	Builds the frame index table of a recording.
+
+	:param columns: Per-camera timestamps, each sorted
+	:param reference: Index of the reference (primary) camera
+	:param tolerance: Largest time difference of a match (defaults to TOLERANCE reference frame periods)
+	:param relative: Compare timestamps relative to each camera's first frame, for camera clocks which aren't
+		synchronized with each other
+	:type columns: list
+	:type reference: int
+	:type relative: bool
+	:return: (frames of the reference camera x cameras) frame indices, GAP where a camera has no frame
+	:rtype: numpy.ndarray
+	"""
+	columns = [np.asarray(times, dtype=np.float64) for times in columns]
+	if relative:
+		columns = [times - times[0] if len(times) else times for times in columns]
+	reference_times = columns[reference]
+	if tolerance is None:
+		tolerance = TOLERANCE * frame_period(reference_times)
+
+	table = np.empty((len(reference_times), len(columns)), dtype=np.int64)
+	for j, times in enumerate(columns):
+		if j == reference:
+			table[:, j] = np.arange(len(times))
+			continue
+		table[:, j] = match_nearest(times, reference_times, tolerance)
+
+		gaps = int(np.count_nonzero(table[:, j] == GAP))
+		unmatched = len(times) - (len(reference_times) - gaps)
+		if gaps or unmatched:
+			log.warning('Camera {0}: {1} of {2} reference frames have no matching frame, {3} frames match no reference '
+			            'frame'.format(j, gaps, len(reference_times), unmatched))
+	return table
+
+
+def aligned_timestamps(columns, table):
+	"""
+	:param columns: Per-camera timestamps
+	:param table: Frame index table from align_frames()
+	:return: (frames x cameras) timestamps of the matched frames, NaN in gaps
+	:rtype: numpy.ndarray
+	"""
+	aligned = np.full(table.shape, np.nan)
+	for j, times in enumerate(columns):
+		present = table[:, j] != GAP
+		aligned[present, j] = np.asarray(times)[table[present, j]]
+	return aligned
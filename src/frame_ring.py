@@ -0,0 +1,155 @@
+"""Shared-memory frame ring passed between the grab side and the image writer processes."""
+
+import collections
+import os
+import sys
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+RING_SLOTS = 32  # number of frames preallocated in the ring
+
+
+class FrameRing:
+	"""
+	Fixed number of preallocated frame slots in one shared memory block.
+
+	The owning (grab) side hands out slots with acquire() and gets them back
+	with release() once a writer is done with them; writers attach to the
+	block by name and only ever see slot indices. Every slot carries a
+	sequence number in the shared header so a reader can tell if its slot was
+	overwritten while it was reading.
+
+	When every slot is in flight, acquire() either drops the new frame or,
+	with overwrite=True, reclaims the oldest in-flight slot. Both are counted.
+	"""
+
+	def __init__(self, slot_bytes, num_slots=RING_SLOTS, overwrite=False, name=None):
+		"""
+		:param slot_bytes: Size of one slot (Width * Height * bytes per pixel)
+		:param num_slots: Number of slots
+		:param overwrite: Reclaim the oldest in-flight slot instead of dropping frames when full
+		:param name: Name of an existing ring to attach to (creates a new ring if None)
+		:type slot_bytes: int
+		:type num_slots: int
+		:type overwrite: bool
+		:type name: str
+		"""
+		self.slot_bytes = slot_bytes
+		self.num_slots = num_slots
+		self.overwrite = overwrite
+		self.owner = name is None
+
+		header_bytes = num_slots * np.dtype(np.int64).itemsize
+		if self.owner:
+			self._shm = shared_memory.SharedMemory(create=True, size=header_bytes + slot_bytes * num_slots)
+		else:
+			# Writer processes are spawned by the owner and share its resource
+			# tracker, so the block is still only unlinked once
+			self._shm = shared_memory.SharedMemory(name=name)
+
+		self.sequence = np.ndarray((num_slots,), dtype=np.int64, buffer=self._shm.buf)
+		self._slots = np.ndarray((num_slots, slot_bytes), dtype=np.uint8, buffer=self._shm.buf, offset=header_bytes)
+
+		if self.owner:
+			self.sequence[:] = -1
+			self._cond = threading.Condition()
+			self._free = collections.deque(range(num_slots))
+			self._in_flight = collections.OrderedDict()  # slot -> sequence number, oldest first
+			self._next = 0
+			self.stats = {'written': 0, 'reused': 0, 'overwritten': 0, 'dropped': 0}
+
+	@property
+	def name(self):
+		return self._shm.name
+
+	@classmethod
+	def attach(cls, name, slot_bytes, num_slots):
+		"""
+		Attaches to a ring created in another process.
+
+		:return: Reader side of the ring
+		:rtype: FrameRing
+		"""
+		return cls(slot_bytes, num_slots, name=name)
+
+	def view(self, slot, shape, dtype=np.uint8):
+		"""
+		Returns a view of a slot. No data is copied.
+
+		:param slot: Slot index
+		:param shape: Frame shape
+		:param dtype: Frame data type
+		:rtype: numpy.ndarray
+		"""
+		dtype = np.dtype(dtype)
+		nbytes = int(np.prod(shape)) * dtype.itemsize
+		return self._slots[slot, :nbytes].view(dtype).reshape(shape)
+
+	def acquire(self, timeout=None):
+		"""
+		Takes a free slot for writing. Blocks for up to timeout seconds when every
+		slot is in flight, then drops the frame or overwrites the oldest slot.
+
+		:param timeout: Seconds to wait for a free slot (None waits forever)
+		:return: (slot, sequence number), or None if the frame was dropped
+		:rtype: tuple
+		"""
+		with self._cond:
+			if not self._free and not self.overwrite:
+				self._cond.wait_for(lambda: self._free, timeout)
+
+			if self._free:
+				slot = self._free.popleft()
+			elif self.overwrite:
+				slot, _ = self._in_flight.popitem(last=False)
+				self.stats['overwritten'] += 1
+			else:
+				self.stats['dropped'] += 1
+				return None
+
+			if self.sequence[slot] >= 0:
+				self.stats['reused'] += 1
+			seq = self._next
+			self._next += 1
+			self.sequence[slot] = seq
+			self._in_flight[slot] = seq
+			self.stats['written'] += 1
+
+		return slot, seq
+
+	def release(self, slot, seq):
+		"""
+		Returns a slot to the free list. Stale releases (for a slot which has
+		since been overwritten) are ignored.
+
+		:param slot: Slot index
+		:param seq: Sequence number returned by acquire()
+		"""
+		with self._cond:
+			if self._in_flight.get(slot) == seq:
+				del self._in_flight[slot]
+				self._free.append(slot)
+				self._cond.notify()
+
+	def close(self):
+		"""
+		Detaches from the ring, and frees it if this is the owning side.
+		"""
+		self.sequence = None
+		self._slots = None
+		self._shm.close()
+		if self.owner:
+			self._shm.unlink()
+			log.VLOG(2, 'Frame ring: {written} frames written, {reused} slot reuses, {overwritten} overwritten, '
+			            '{dropped} dropped'.format(**self.stats))
@@ -0,0 +1,194 @@
+"""Process-pool image writer used to take JPEG/PNG encoding off the acquisition threads."""
+
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import PySpin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from frame_ring import FrameRing
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+PENDING_PER_WORKER = 4  # frames allowed in flight per worker before submit() blocks (without a frame ring)
+RING_TIMEOUT = 1  # seconds to wait for a free frame ring slot before dropping a frame
+
+_ring = None  # reader side of the frame ring, attached once per worker process
+
+
+def write_image(frame, image_file):
+	"""
+	Worker function which encodes a frame and writes it to disk. The file
+	format (jpg, png, tiff, ...) is chosen from the file extension.
+
+	:param frame: Mono8 (height x width) or RGB8 (height x width x 3) frame
+	:param image_file: Path to save the image to
+	:type frame: numpy.ndarray
+	:type image_file: str
+	:return: True if the frame was written
+	:rtype: bool
+	"""
+	height, width = frame.shape[:2]
+	pixel_format = PySpin.PixelFormat_Mono8 if frame.ndim == 2 else PySpin.PixelFormat_RGB8
+	image = PySpin.Image.Create(width, height, 0, 0, pixel_format, frame)
+	image.Save(image_file)
+	return True
+
+
+def attach_ring(name, slot_bytes, num_slots):
+	"""
+	Worker initializer which attaches the process to the frame ring.
+	"""
+	global _ring
+	_ring = FrameRing.attach(name, slot_bytes, num_slots)
+
+
+def write_slot(slot, seq, shape, image_file):
+	"""
+	Worker function which encodes a frame straight out of a frame ring slot.
+
+	:param slot: Slot index
+	:param seq: Sequence number the slot was written with
+	:param shape: Frame shape
+	:param image_file: Path to save the image to
+	:return: True if the frame was written, False if the slot was overwritten while encoding (the corrupted image is
+		deleted)
+	:rtype: bool
+	"""
+	write_image(_ring.view(slot, shape), image_file)
+	if _ring.sequence[slot] != seq:
+		os.remove(image_file)
+		return False
+	return True
+
+
+class ImageWriter:
+	"""
+	Writer stage backed by a process pool. Frames are submitted as NumPy arrays
+	and encoded in parallel; close() is an ordered-completion barrier which
+	waits for every submitted frame in submission order.
+
+	With ring_slots > 0, submitted frames are copied once into a shared-memory
+	frame ring and the workers read them by slot index, instead of each frame
+	being pickled through the pool's queues.
+	"""
+
+	def __init__(self, num_workers=None, slot_bytes=0, ring_slots=0, overwrite=False):
+		"""
+		:param num_workers: Number of writer processes (defaults to the number of cores)
+		:param slot_bytes: Size of the largest frame, in bytes (needed with ring_slots)
+		:param ring_slots: Number of frame ring slots (0 pickles frames instead)
+		:param overwrite: Overwrite the oldest in-flight frame instead of dropping new frames when the ring is full
+		:type num_workers: int
+		:type slot_bytes: int
+		:type ring_slots: int
+		:type overwrite: bool
+		"""
+		self.num_workers = num_workers if num_workers else os.cpu_count()
+		self.ring = FrameRing(slot_bytes, ring_slots, overwrite) if ring_slots > 0 else None
+		self._slots = threading.BoundedSemaphore(self.num_workers * PENDING_PER_WORKER)
+		self._lock = threading.Lock()
+		self._pending = []
+
+		# Spawn (rather than fork) the writers so they don't inherit the
+		# acquiring process's Spinnaker state
+		context = multiprocessing.get_context('spawn')
+		if self.ring is None:
+			self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context)
+		else:
+			self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context,
+			                                 initializer=attach_ring, initargs=(self.ring.name, slot_bytes, ring_slots))
+
+		log.VLOG(2, 'Started image writer with {} processes'.format(self.num_workers))
+
+	def submit(self, frame, image_file):
+		"""
+		Queues a frame to be written. Blocks while too many frames are in flight.
+
+		:param frame: Frame to write (copied before submit() returns, so it may be
+			a view of a camera buffer)
+		:param image_file: Path to save the image to
+		:type frame: numpy.ndarray
+		:type image_file: str
+		:return: Future for the write, or None if the frame was dropped
+		:rtype: concurrent.futures.Future
+		"""
+		if self.ring is None:
+			self._slots.acquire()
+			# The frame is pickled after submit() returns, so it must not share
+			# the caller's buffer
+			future = self._pool.submit(write_image, np.array(frame), image_file)
+			future.add_done_callback(lambda _: self._slots.release())
+		else:
+			acquired = self.ring.acquire(RING_TIMEOUT)
+			if acquired is None:
+				log.warning('Frame ring full, dropping {}'.format(image_file))
+				return None
+
+			slot, seq = acquired
+			np.copyto(self.ring.view(slot, frame.shape, frame.dtype), frame)
+			future = self._pool.submit(write_slot, slot, seq, frame.shape, image_file)
+			future.add_done_callback(lambda _: self.ring.release(slot, seq))
+
+		with self._lock:
+			self._pending += [(image_file, future)]
+		return future
+
+	def wait(self):
+		"""
+		Waits for every frame submitted so far, in submission order. The pool
+		stays up for further frames.
+
+		:return: True if every frame was written, False otherwise.
+		:rtype: bool
+		"""
+		result = True
+		with self._lock:
+			pending, self._pending = self._pending, []
+
+		for image_file, future in pending:
+			try:
+				if future.result():
+					log.VLOG(2, '%%% Image saved at {}'.format(image_file))
+				else:
+					log.warning('Frame ring slot for {} was overwritten while it was being saved, image deleted'.format(
+						image_file))
+					result = False
+			except Exception as ex:
+				log.error('Unable to save {}: {}'.format(image_file, ex))
+				result = False
+
+		log.VLOG(2, 'Image writer finished {} images'.format(len(pending)))
+		return result
+
+	def close(self):
+		"""
+		Waits for every submitted frame, in submission order, then shuts the pool down.
+
+		:return: True if every frame was written, False otherwise.
+		:rtype: bool
+		"""
+		result = self.wait()
+		self._pool.shutdown()
+
+		if self.ring is not None:
+			result &= self.ring.stats['dropped'] == 0
+			self.ring.close()
+
+		return result
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.close()
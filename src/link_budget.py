@@ -0,0 +1,162 @@
+"""Link bandwidth budget of cameras sharing a host controller.
+
+Cameras on the same interface (a USB3 host controller or a network
+adapter) share its bandwidth. camera_groups() groups cameras by the
+interface the caller's Spinnaker system enumerates them on, camera_demand() computes the
+bytes/s a camera streams (Width x Height x bit depth x frame rate), and
+allocate_group() splits an interface's bandwidth between its cameras in
+proportion to their demand, leaving headroom. check_link_budget() warns
+before acquisition when an interface is oversubscribed.
+"""
+
+import os
+import sys
+
+import PySpin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from rig_solver import HEADROOM
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+DEFAULT_BANDWIDTH = 380e6  # bytes/s a USB3 host controller sustains in practice, if no camera reports its link speed
+
+
+def read_node(nodemap, title, node_func):
+	"""
+	:return: Value of a node, or None if it isn't readable
+	"""
+	node = node_func(nodemap.GetNode(title))
+	if not PySpin.IsAvailable(node) or not PySpin.IsReadable(node):
+		return None
+	if node_func is PySpin.CEnumerationPtr:
+		return node.GetCurrentEntry().GetSymbolic()
+	return node.GetValue()
+
+
+def camera_groups(system, cam_list):
+	"""
+	Groups cameras by the interface they are connected through.
+
+	:param system: The caller's Spinnaker system (not released here, since the caller's cameras still use it)
+	:param cam_list: List of cameras
+	:type system: SystemPtr
+	:type cam_list: CameraList
+	:return: Interface name -> indices of its cameras (a camera on an unknown interface gets its own group)
+	:rtype: dict
+	"""
+	interfaces = {}  # serial number -> interface name
+	try:
+		iface_list = system.GetInterfaces()
+		for n in range(iface_list.GetSize()):
+			iface = iface_list.GetByIndex(n)
+			name = read_node(iface.GetTLNodeMap(), 'InterfaceDisplayName', PySpin.CStringPtr) or \
+				read_node(iface.GetTLNodeMap(), 'InterfaceID', PySpin.CStringPtr) or 'interface {}'.format(n)
+			iface_cams = iface.GetCameras()
+			for iface_cam in iface_cams:
+				interfaces[read_node(iface_cam.GetTLDeviceNodeMap(), 'DeviceSerialNumber', PySpin.CStringPtr)] = name
+				# Release the reference before the list is cleared
+				del iface_cam
+			iface_cams.Clear()
+			del iface
+		iface_list.Clear()
+	except PySpin.SpinnakerException as ex:
+		log.warning('Unable to enumerate interfaces, every camera is budgeted on its own: %s' % ex)
+
+	groups = {}
+	for i, cam in enumerate(cam_list):
+		serial = read_node(cam.GetTLDeviceNodeMap(), 'DeviceSerialNumber', PySpin.CStringPtr)
+		groups.setdefault(interfaces.get(serial, 'camera {}'.format(i)), []).append(i)
+	return groups
+
+
+def streamed_frame_bytes(cam):
+	"""
+	:param cam: Initialized camera
+	:type cam: CameraPtr
+	:return: Bytes per frame at the camera's frame size and pixel format
+	:rtype: float
+	"""
+	nodemap = cam.GetNodeMap()
+	width = read_node(nodemap, 'Width', PySpin.CIntegerPtr) or 0
+	height = read_node(nodemap, 'Height', PySpin.CIntegerPtr) or 0
+	pixel_size = read_node(nodemap, 'PixelSize', PySpin.CEnumerationPtr) or 'Bpp8'
+	return width * height * int(pixel_size[len('Bpp'):]) / 8
+
+
+def camera_demand(cam):
+	"""
+	:param cam: Initialized camera
+	:type cam: CameraPtr
+	:return: Bytes/s the camera streams at its resulting frame rate
+	:rtype: float
+	"""
+	framerate = read_node(cam.GetNodeMap(), 'AcquisitionResultingFrameRate', PySpin.CFloatPtr) or 0
+	return streamed_frame_bytes(cam) * framerate
+
+
+def link_bandwidth(cam_list, indices, bandwidth=None):
+	"""
+	:param bandwidth: Bandwidth of every interface (bytes/s), overriding the link speed the cameras report
+	:return: Bandwidth of the interface of a group of cameras (bytes/s)
+	:rtype: float
+	"""
+	if bandwidth:
+		return bandwidth
+	speeds = [read_node(cam_list[i].GetNodeMap(), 'DeviceLinkSpeed', PySpin.CIntegerPtr) for i in indices]
+	speeds = [speed for speed in speeds if speed]
+	return min(speeds) if speeds else DEFAULT_BANDWIDTH
+
+
+def allocate_group(demands, bandwidth, headroom=HEADROOM):
+	"""
+	Splits an interface's bandwidth, less headroom, between its cameras in
+	proportion to their demand. If the interface isn't oversubscribed,
+	every camera gets at least its demand.
+
+	:param demands: Bytes/s each camera of the group streams
+	:param bandwidth: Bandwidth of the interface (bytes/s)
+	:param headroom: Fraction of the bandwidth left unused
+	:type demands: list
+	:return: (throughput limit per camera in bytes/s, True if the group is oversubscribed)
+	:rtype: tuple
+	"""
+	available = bandwidth * (1 - headroom)
+	total = sum(demands)
+	if total == 0:
+		return [available / len(demands) for _ in demands], False
+	return [available * demand / total for demand in demands], total > available
+
+
+def check_link_budget(system, cam_list, bandwidth=None, headroom=HEADROOM):
+	"""
+	Warns about every interface whose cameras stream more than its
+	bandwidth allows, before acquisition starts dropping frames.
+
+	:param system: The caller's Spinnaker system
+	:param cam_list: List of initialized cameras
+	:param bandwidth: Bandwidth of every interface (bytes/s), overriding the link speed the cameras report
+	:type system: SystemPtr
+	:type cam_list: CameraList
+	:return: True if no interface is oversubscribed
+	:rtype: bool
+	"""
+	cams = [cam for cam in cam_list]
+	result = True
+	for name, indices in camera_groups(system, cams).items():
+		demand = sum(camera_demand(cams[i]) for i in indices)
+		available = link_bandwidth(cams, indices, bandwidth) * (1 - headroom)
+		if demand > available:
+			log.warning('Cameras {0} on {1} stream {2:.0f} MB/s but only {3:.0f} MB/s is available; expect dropped '
+			            'frames (run SetSettings.py --budget)'.format(indices, name, demand / 1e6, available / 1e6))
+			result = False
+		else:
+			log.VLOG(2, 'Cameras {0} on {1} stream {2:.0f} of {3:.0f} MB/s'.format(
+				indices, name, demand / 1e6, available / 1e6))
+	return result
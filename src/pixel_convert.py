@@ -0,0 +1,139 @@
+"""Vectorized pixel format conversion of batches of raw frames.
+
+Every function works on a whole batch at once: frames are stacked along the
+first axis, as (frames x height x width) for unpacked formats or (frames x
+bytes) for packed ones.
+"""
+
+import re
+
+import numpy as np
+
+BAYER_PATTERNS = {'RG': 'RGGB', 'GR': 'GRBG', 'GB': 'GBRG', 'BG': 'BGGR'}
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def pixel_bits(pixel_format):
+	"""
+	Returns the number of significant bits per pixel (per channel) of a pixel format.
+
+	:param pixel_format: Pixel format name
+	:type pixel_format: str
+	:rtype: int
+	"""
+	match = re.search(r'(\d+)', pixel_format)
+	return int(match.group(1)) if match else 8
+
+
+def unpack12(frames, width, height, packed_format):
+	"""
+	Unpacks 12 bit packed frames (two pixels in three bytes) to 16 bit.
+
+	:param frames: (frames x bytes) packed data
+	:param width: Frame width
+	:param height: Frame height
+	:param packed_format: Mono12p / BayerXX12p (GenICam layout) or Mono12Packed / BayerXX12Packed (legacy layout)
+	:rtype: numpy.ndarray
+	"""
+	triplets = frames.reshape(len(frames), -1, 3).astype(np.uint16)
+	b0, b1, b2 = triplets[..., 0], triplets[..., 1], triplets[..., 2]
+	if packed_format.endswith('Packed'):
+		first = (b0 << 4) | (b1 & 0xF)
+		second = (b2 << 4) | (b1 >> 4)
+	else:
+		first = b0 | ((b1 & 0xF) << 8)
+		second = (b1 >> 4) | (b2 << 4)
+	return np.stack([first, second], axis=-1).reshape(len(frames), height, width)
+
+
+def to_intensity(frames, pixel_format, width, height):
+	"""
+	Brings unconverted frames to one 8 bit intensity per pixel, without
+	demosaicing (Bayer frames keep their mosaic).
+
+	:param frames: Stacked raw frames
+	:param pixel_format: Pixel format name
+	:param width: Frame width
+	:param height: Frame height
+	:return: (frames x height x width) uint8
+	:rtype: numpy.ndarray
+	"""
+	bits = pixel_bits(pixel_format[pixel_format.find('_') + 1:])
+	if pixel_format.endswith('Packed') or pixel_format.endswith('p'):
+		if bits != 12:
+			raise ValueError('Unsupported packed pixel format {}'.format(pixel_format))
+		frames = unpack12(frames, width, height, pixel_format)
+
+	frames = frames.reshape(len(frames), height, width)
+	if bits > 8:
+		frames = frames >> (bits - 8)
+	return frames.astype(np.uint8)
+
+
+def demosaic(mosaic, pattern):
+	"""
+	Bilinear demosaicing of a batch of Bayer frames.
+
+	:param mosaic: (frames x height x width) Bayer frames
+	:param pattern: Colour filter layout of the top-left 2x2 block (e.g. RGGB)
+	:return: (frames x height x width x 3) uint8
+	:rtype: numpy.ndarray
+	"""
+	n, height, width = mosaic.shape
+	masks = np.zeros((3, height, width), dtype=np.float32)
+	for k, colour in enumerate(pattern):
+		masks['RGB'.index(colour), k // 2::2, k % 2::2] = 1
+
+	padded_mosaic = np.pad(mosaic.astype(np.float32), ((0, 0), (1, 1), (1, 1)), mode='reflect')
+	padded_masks = np.pad(masks, ((0, 0), (1, 1), (1, 1)), mode='reflect')
+
+	# Weighted sums of each colour's samples over the 3x3 neighbourhood,
+	# normalised by the weights of the samples actually present
+	weights = np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32)
+	rgb = np.empty((n, height, width, 3), dtype=np.float32)
+	for c in range(3):
+		total = np.zeros((n, height, width), dtype=np.float32)
+		norm = np.zeros((height, width), dtype=np.float32)
+		for dy in range(3):
+			for dx in range(3):
+				mask = padded_masks[c, dy:dy + height, dx:dx + width] * weights[dy, dx]
+				total += padded_mosaic[:, dy:dy + height, dx:dx + width] * mask
+				norm += mask
+		rgb[..., c] = total / norm
+
+	return np.clip(np.rint(rgb), 0, 255).astype(np.uint8)
+
+
+def convert(frames, pixel_format, width, height, mode='mono8'):
+	"""
+	Converts a batch of unconverted frames to Mono8 or RGB8.
+
+	:param frames: Stacked raw frames, all in the same pixel format
+	:param pixel_format: Pixel format name
+	:param width: Frame width
+	:param height: Frame height
+	:param mode: mono8 or rgb8
+	:type frames: numpy.ndarray
+	:type pixel_format: str
+	:type mode: str
+	:return: (frames x height x width) or (frames x height x width x 3) uint8
+	:rtype: numpy.ndarray
+	"""
+	if re.match(r'(RGB|BGR)8', pixel_format):
+		rgb = frames.reshape(len(frames), height, width, 3)
+		if pixel_format.startswith('BGR'):
+			rgb = rgb[..., ::-1]
+		if mode == 'rgb8':
+			return np.ascontiguousarray(rgb)
+		return np.rint(rgb @ LUMA).astype(np.uint8)
+
+	intensity = to_intensity(frames, pixel_format, width, height)
+	if pixel_format.startswith('Bayer'):
+		rgb = demosaic(intensity, BAYER_PATTERNS[pixel_format[5:7]])
+		if mode == 'rgb8':
+			return rgb
+		return np.rint(rgb @ LUMA).astype(np.uint8)
+
+	if mode == 'rgb8':
+		return np.repeat(intensity[..., np.newaxis], 3, axis=-1)
+	return intensity
@@ -0,0 +1,143 @@
+"""Mergeable approximate quantile sketch, for statistics of recordings larger than memory.
+
+QuantileSketch is a KLL-style hierarchy of compactors: level h holds items
+standing for 2**h values each. When a level grows past the sketch size it
+is sorted and every other item (from a random offset) is promoted to the
+next level, so memory is O(size * log(n / size)) however many values are
+added. Sketches built over separate blocks merge into one, and while no
+level has been compacted (at most size values) every answer is exact.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+SKETCH_SIZE = 4096  # items kept per level; rank error shrinks roughly as 1 / SKETCH_SIZE
+
+
+class QuantileSketch:
+	"""
+	Approximate quantiles, ranks and trimmed means of a stream of values,
+	along with their exact count, sum, minimum and maximum.
+	"""
+
+	def __init__(self, size=SKETCH_SIZE, seed=0):
+		"""
+		:param size: Items kept per level before it is compacted
+		:param seed: Seed of the compaction offsets, so reports are reproducible
+		:type size: int
+		"""
+		self.size = size
+		self.levels = [np.zeros(0)]
+		self.count = 0
+		self.total = 0.0
+		self.min = np.inf
+		self.max = -np.inf
+		self._rng = np.random.default_rng(seed)
+
+	def __len__(self):
+		return self.count
+
+	def update(self, values):
+		"""
+		:param values: Values to add (any shape)
+		"""
+		values = np.asarray(values, dtype=np.float64).ravel()
+		if not len(values):
+			return
+		self.count += len(values)
+		self.total += float(values.sum())
+		self.min = min(self.min, float(values.min()))
+		self.max = max(self.max, float(values.max()))
+		self.levels[0] = np.concatenate([self.levels[0], values])
+		self._compact()
+
+	def merge(self, other):
+		"""
+		Adds every value of another sketch to this one.
+
+		:type other: QuantileSketch
+		"""
+		self.count += other.count
+		self.total += other.total
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+		for h, items in enumerate(other.levels):
+			if h == len(self.levels):
+				self.levels += [np.zeros(0)]
+			self.levels[h] = np.concatenate([self.levels[h], items])
+		self._compact()
+
+	def _compact(self):
+		h = 0
+		while h < len(self.levels):
+			if len(self.levels[h]) > self.size:
+				items = np.sort(self.levels[h])
+				# an odd item out stays at this level, so the total weight stays exact
+				self.levels[h] = items[len(items) - len(items) % 2:]
+				items = items[:len(items) - len(items) % 2]
+				if h + 1 == len(self.levels):
+					self.levels += [np.zeros(0)]
+				self.levels[h + 1] = np.concatenate([self.levels[h + 1], items[self._rng.integers(2)::2]])
+			h += 1
+
+	def _weighted(self):
+		"""
+		:return: (sorted items, weight of each)
+		:rtype: tuple
+		"""
+		items = np.concatenate(self.levels)
+		weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+		order = np.argsort(items, kind='stable')
+		return items[order], weights[order]
+
+	def mean(self):
+		return self.total / self.count if self.count else np.nan
+
+	def rank(self, value, side='left'):
+		"""
+		:param side: left counts the values below value, right the values up to and including it
+		:return: Approximate number of values below (or up to) value
+		:rtype: float
+		"""
+		items, weights = self._weighted()
+		return float(weights[:np.searchsorted(items, value, side=side)].sum())
+
+	def quantile(self, q):
+		"""
+		:param q: Quantile (0 to 1)
+		:return: Approximate value of the quantile
+		:rtype: float
+		"""
+		if not self.count:
+			return np.nan
+		items, weights = self._weighted()
+		index = np.searchsorted(np.cumsum(weights), q * self.count, side='left')
+		return float(items[min(index, len(items) - 1)])
+
+	def trimmed_mean(self, proportion):
+		"""
+		Mean of the values left after cutting int(proportion * count) values
+		off each end, like scipy.stats.trim_mean.
+
+		:param proportion: Fraction cut off each end
+		:rtype: float
+		"""
+		if not self.count:
+			return np.nan
+		cut = int(proportion * self.count)
+		items, weights = self._weighted()
+		# weight of every item which lies between the cuts
+		ends = np.cumsum(weights)
+		kept = np.clip(np.minimum(ends, self.count - cut) - np.maximum(ends - weights, cut), 0, None)
+		return float((items * kept).sum() / kept.sum())
@@ -0,0 +1,256 @@
+"""Single-file raw capture container for multi-camera acquisitions.
+
+A capture is two files sharing a base name:
+
+- ``<base>.raw`` holds the unconverted frame buffers of every camera back to
+  back, in fixed-size slots preallocated for the whole run.
+- ``<base>.idx`` holds a small JSON header (cameras, frame layout, capacity)
+  padded to HEADER_BYTES, followed by one fixed-size INDEX_DTYPE record per
+  slot, so the index can be memory-mapped directly.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from frame_alignment import align_frames, aligned_timestamps
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+MAGIC = b'MCATRAW1'
+HEADER_BYTES = 4096
+
+STATUS_EMPTY = 0
+STATUS_COMPLETE = 1
+STATUS_INCOMPLETE = 2
+
+INDEX_DTYPE = np.dtype([('serial', 'S16'),
+                        ('frame', '<u8'),
+                        ('timestamp', '<f8'),
+                        ('offset', '<u8'),
+                        ('status', '<u4')])
+
+
+def frame_layout(pixel_format, width, height):
+	"""
+	Returns the shape, data type and size of one frame in a given pixel format.
+	Packed formats are left as a flat array of bytes.
+
+	:param pixel_format: Pixel format name (e.g. Mono8, BayerRG16, Mono12p)
+	:param width: Frame width
+	:param height: Frame height
+	:type pixel_format: str
+	:type width: int
+	:type height: int
+	:return: (shape, dtype, nbytes)
+	:rtype: tuple
+	"""
+	channels = 3 if re.match(r'(RGB|BGR)', pixel_format) else 1
+	match = re.search(r'(\d+)', pixel_format[pixel_format.find('_') + 1:] if channels == 1 else pixel_format)
+	bits = int(match.group(1)) if match else 8
+
+	if 'Packed' in pixel_format or pixel_format.endswith('p'):
+		nbytes = width * height * channels * bits // 8
+		return (nbytes,), np.dtype(np.uint8), nbytes
+
+	# Unpacked 10/12/14 bit formats use 16 bit containers
+	dtype = np.dtype(np.uint8 if bits <= 8 else '<u2')
+	shape = (height, width, channels) if channels > 1 else (height, width)
+	return shape, dtype, width * height * channels * dtype.itemsize
+
+
+def read_header(path):
+	"""
+	Reads the JSON header of a capture's index file.
+
+	:param path: Base path of the capture (without extension)
+	:rtype: dict
+	"""
+	with open(path + '.idx', 'rb') as index_file:
+		header = index_file.read(HEADER_BYTES)
+	if not header.startswith(MAGIC):
+		raise ValueError('{}.idx is not a raw capture index'.format(path))
+	return json.loads(header[len(MAGIC):].rstrip(b'\0').decode())
+
+
+def write_header(path, header):
+	"""
+	Writes the JSON header of a capture's index file in place.
+
+	:param path: Base path of the capture (without extension)
+	:param header: Header contents
+	:type header: dict
+	"""
+	encoded = MAGIC + json.dumps(header).encode()
+	if len(encoded) > HEADER_BYTES:
+		raise ValueError('Raw capture header is larger than {} bytes'.format(HEADER_BYTES))
+	with open(path + '.idx', 'r+b') as index_file:
+		index_file.write(encoded.ljust(HEADER_BYTES, b'\0'))
+
+
+class RawCaptureWriter:
+	"""
+	Appends unconverted frames from any number of cameras (and threads) into
+	one preallocated container.
+	"""
+
+	def __init__(self, path, cameras, capacity):
+		"""
+		:param path: Base path of the capture (without extension)
+		:param cameras: Camera serial -> (pixel format, width, height), in camera order
+		:param capacity: Maximum number of frames across all cameras
+		:type path: str
+		:type cameras: dict
+		:type capacity: int
+		"""
+		self.path = path
+		self.capacity = capacity
+		self.frame_bytes = max(frame_layout(*camera)[2] for camera in cameras.values())
+		self.header = {'cameras': [{'serial': str(serial), 'pixel_format': pixel_format, 'width': width,
+		                            'height': height} for serial, (pixel_format, width, height) in cameras.items()],
+		               'frame_bytes': self.frame_bytes,
+		               'capacity': capacity,
+		               'count': 0}
+		self._lock = threading.Lock()
+		self._count = 0
+
+		# Preallocate both files for the whole run
+		with open(path + '.raw', 'wb') as data_file:
+			data_file.truncate(capacity * self.frame_bytes)
+			if hasattr(os, 'posix_fallocate') and capacity > 0:
+				os.posix_fallocate(data_file.fileno(), 0, capacity * self.frame_bytes)
+		with open(path + '.idx', 'wb') as index_file:
+			index_file.truncate(HEADER_BYTES + capacity * INDEX_DTYPE.itemsize)
+		write_header(path, self.header)
+
+		self._data = np.memmap(path + '.raw', dtype=np.uint8, mode='r+', shape=(capacity, self.frame_bytes))
+		self.index = np.memmap(path + '.idx', dtype=INDEX_DTYPE, mode='r+', offset=HEADER_BYTES, shape=(capacity,))
+
+		log.VLOG(2, 'Preallocated raw capture {} for {} frames of {} bytes'.format(path, capacity, self.frame_bytes))
+
+	def append(self, serial, frame, timestamp, data, status=STATUS_COMPLETE):
+		"""
+		Copies one frame into the next free slot and indexes it.
+
+		:param serial: Camera serial number
+		:param frame: Frame number
+		:param timestamp: Host timestamp (seconds since the start of acquisition)
+		:param data: Raw frame buffer
+		:param status: STATUS_COMPLETE or STATUS_INCOMPLETE
+		:type data: numpy.ndarray
+		:return: Index of the record, or None if the container is full
+		:rtype: int
+		"""
+		with self._lock:
+			if self._count >= self.capacity:
+				log.warning('Raw capture {} is full, dropping frame {} of camera {}'.format(self.path, frame, serial))
+				return None
+			record = self._count
+			self._count += 1
+
+		data = data.reshape(-1).view(np.uint8)
+		self._data[record, :data.size] = data
+		self.index[record] = (str(serial).encode(), frame, timestamp, record * self.frame_bytes, status)
+
+		return record
+
+	def close(self):
+		"""
+		Flushes the container and records the number of frames written.
+		"""
+		self._data.flush()
+		self.index.flush()
+		self._data = None
+		self.index = None
+
+		self.header['count'] = self._count
+		write_header(self.path, self.header)
+		log.VLOG(2, 'Wrote {} frames to raw capture {}'.format(self._count, self.path))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.close()
+
+
+class RawCaptureReader:
+	"""
+	Memory-maps a raw capture. Frames are returned as NumPy views into the
+	mapped data file, so nothing is copied until the caller does so.
+	"""
+
+	def __init__(self, path):
+		"""
+		:param path: Base path of the capture (without extension)
+		:type path: str
+		"""
+		self.path = path
+		self.header = read_header(path)
+		self.serials = [camera['serial'] for camera in self.header['cameras']]
+		self.layouts = {camera['serial']: frame_layout(camera['pixel_format'], camera['width'], camera['height'])
+		                for camera in self.header['cameras']}
+		self.pixel_formats = {camera['serial']: camera['pixel_format'] for camera in self.header['cameras']}
+
+		count = self.header['count']
+		if not count and self.header['capacity']:
+			# The writer wasn't closed; slots are filled in order, so count the written records
+			index = np.memmap(path + '.idx', dtype=INDEX_DTYPE, mode='r', offset=HEADER_BYTES,
+			                  shape=(self.header['capacity'],))
+			count = int(np.flatnonzero(index['status'] != STATUS_EMPTY)[-1]) + 1 if index['status'].any() else 0
+		self.index = np.memmap(path + '.idx', dtype=INDEX_DTYPE, mode='r', offset=HEADER_BYTES, shape=(count,)) \
+			if count else np.zeros(0, dtype=INDEX_DTYPE)
+		self._data = np.memmap(path + '.raw', dtype=np.uint8, mode='r',
+		                       shape=(self.header['capacity'], self.header['frame_bytes'])) \
+			if self.header['capacity'] else None
+
+	def __len__(self):
+		return len(self.index)
+
+	def frame(self, record):
+		"""
+		Returns one frame as a zero-copy view.
+
+		:param record: Index record number
+		:type record: int
+		:rtype: numpy.ndarray
+		"""
+		entry = self.index[record]
+		shape, dtype, nbytes = self.layouts[entry['serial'].decode()]
+		slot = int(entry['offset']) // self.header['frame_bytes']
+		return self._data[slot, :nbytes].view(dtype).reshape(shape)
+
+	def records(self, serial):
+		"""
+		Returns the record numbers of one camera's frames, in frame order.
+
+		:param serial: Camera serial number
+		:type serial: str
+		:rtype: numpy.ndarray
+		"""
+		records = np.flatnonzero(self.index['serial'] == str(serial).encode())
+		return records[np.argsort(self.index['frame'][records], kind='stable')]
+
+	def timestamps(self, tolerance=None):
+		"""
+		Returns the host timestamps as a (frames x cameras) table, in camera
+		order. Every camera's frames are matched to the first camera's by
+		timestamp (see frame_alignment.py).
+
+		:param tolerance: Largest time difference of a frame match (s, defaults to half a frame period)
+		:return: Timestamps, NaN where a camera has no frame
+		:rtype: numpy.ndarray
+		"""
+		columns = [self.index['timestamp'][self.records(serial)] for serial in self.serials]
+		return aligned_timestamps(columns, align_frames(columns, 0, tolerance))
@@ -0,0 +1,333 @@
+"""Compiled rig config: a config file parsed once into one immutable, validated object.
+
+Every entry point reads its config file through load_rig_config(), which
+parses the file, types every camera setting (see setting_types),
+checks the constraints between fields and sections, and caches the result
+by the file's modification time and the settings known so far. Scripts
+running in the same process (e.g. diagnostics driving MultiCamAcqSync)
+share one object, and a changed file (or a newly registered camera schema)
+is compiled again on the next load.
+"""
+
+import configparser
+import os
+import sys
+import threading
+import types
+from dataclasses import astuple, dataclass, field
+from enum import Enum
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from settings_schema import cached_schemas
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+CALIB_SUFFIX = 'calib-images'  # calibration sections, e.g. [ref-calib-images]
+
+_configs = {}  # absolute path -> RigConfig
+_lock = threading.Lock()
+
+
+class Types(Enum):
+	ENUM = Enum
+	FLOAT = float
+	BOOLEAN = bool
+	INTEGER = int
+
+
+full_settings = {'AcquisitionMode': Types.ENUM.value,
+                 'AcquisitionFrameCount': Types.INTEGER.value,
+                 'AcquisitionFrameRateEnable': Types.BOOLEAN.value,
+                 'AcquisitionFrameRate': Types.FLOAT.value,
+                 'ExposureMode': Types.ENUM.value,
+                 'ExposureAuto': Types.ENUM.value,
+                 'ExposureTime': Types.FLOAT.value,
+                 'BinningVertical': Types.INTEGER.value,
+                 'BinningHorizontal': Types.INTEGER.value,
+                 'Height': Types.INTEGER.value,
+                 'Width': Types.INTEGER.value,
+                 'AutoExposureExposureTimeLowerLimit': Types.FLOAT.value,
+                 'AutoExposureExposureTimeUpperLimit': Types.FLOAT.value,
+                 'GainAuto': Types.ENUM.value,
+                 'Gain': Types.FLOAT.value,
+                 'GammaEnable': Types.BOOLEAN.value,
+                 'Gamma': Types.FLOAT.value,
+                 'BlackLevelSelector': Types.ENUM.value,
+                 'BlackLevel': Types.FLOAT.value,
+                 'DeviceLinkThroughputLimit': Types.INTEGER.value,
+                 'TriggerMode': Types.ENUM.value,
+                 'LineSelector': Types.ENUM.value,
+                 'LineMode': Types.ENUM.value,
+                 'V3_3Enable': Types.BOOLEAN.value,
+                 'TriggerSource': Types.ENUM.value,
+                 'TriggerOverlap': Types.ENUM.value}
+
+# Setting type of each node interface type of a camera schema (see settings_schema.py)
+schema_types = {'enum': Types.ENUM.value,
+                'float': Types.FLOAT.value,
+                'int': Types.INTEGER.value,
+                'bool': Types.BOOLEAN.value}
+
+# Type of every known setting: full_settings, plus every node of the camera schemas seen so far
+setting_types = dict(full_settings)
+
+
+def register_schema(schema):
+	"""
+	Makes the nodes of a camera schema available as settings. Settings in
+	full_settings keep their declared type.
+
+	:param schema: Camera schema
+	:type schema: dict
+	"""
+	for title, info in schema.items():
+		setting_types.setdefault(title, schema_types[info['type']])
+
+
+def typed_settings(p_config, section):
+	# type the settings of one camera section of a configuration file
+	# Input:
+	# p_config - config parser section
+	# section - section name, for log messages
+	#
+	# Outputs:
+	# p - dictionary with new configurations
+
+	# settings outside full_settings are typed by the camera schemas registered so far (compile_config() registers
+	# the cached ones)
+	p = {}
+
+	# format settings (full_settings first, in their order)
+	for setting in list(full_settings) + [setting for setting in setting_types if setting not in full_settings]:
+		if setting in p_config:
+			if setting_types[setting] == Types.FLOAT.value:
+				get_func = p_config.getfloat
+			elif setting_types[setting] == Types.INTEGER.value:
+				get_func = p_config.getint
+			elif setting_types[setting] == Types.BOOLEAN.value:
+				get_func = p_config.getboolean
+			else:
+				get_func = p_config.get
+
+			p[setting] = get_func(setting)
+
+	# (the config parser lower-cases keys)
+	known = {setting.lower() for setting in setting_types} | {'primaryid'}
+	unknown = [key for key in p_config if key not in known]
+	if unknown:
+		log.warning('Ignoring unknown settings in [{0}]: {1} (run the cameras once so their schema is cached)'.format(
+			section, ', '.join(unknown)))
+
+	return p
+
+
+@dataclass(frozen=True)
+class AggregationConfig:
+	"""
+	[aggregation]: recordings of num_reps frame counts from range_min to range_max (diagnostics -a).
+	"""
+	range_min: int
+	range_max: int
+	num_reps: int
+
+
+@dataclass(frozen=True)
+class CalibConfig:
+	"""
+	A [*calib-images] section, in mm. Images are taken either every
+	step_dist or num_reps times over the z range.
+	"""
+	range_min: int = None
+	zc: int = None
+	step_dist: int = None
+	num_reps: int = None
+
+	@property
+	def range_max(self):
+		return self.zc + self.range_min
+
+	@property
+	def total_steps(self):
+		"""
+		Number of images over the z range (the first and last position included).
+		"""
+		if self.num_reps is not None:
+			return self.num_reps
+		return int(abs(self.zc / self.step_dist)) + 1
+
+
+@dataclass(frozen=True)
+class RigConfig:
+	"""
+	Camera settings are read-only mappings of setting name to typed value.
+	Either default is set (one section for every camera), or primary,
+	secondary and primary_id are; all are None in a config file without
+	camera settings.
+	"""
+	path: str
+	mtime: int
+	settings_version: int = 0  # number of known settings (see setting_types) the file was typed with
+	default: types.MappingProxyType = None
+	primary: types.MappingProxyType = None
+	secondary: types.MappingProxyType = None
+	primary_id: str = None
+	aggregation: AggregationConfig = None
+	calib: types.MappingProxyType = field(default_factory=lambda: types.MappingProxyType({}))
+
+	@property
+	def has_cameras(self):
+		return self.default is not None or self.primary is not None
+
+	@property
+	def synced(self):
+		"""
+		True if the cameras are split into a primary and secondaries.
+		"""
+		return self.default is None and self.primary is not None
+
+	def camera_sections(self):
+		"""
+		:return: Section name -> settings, for every camera section in use
+		:rtype: dict
+		"""
+		if self.synced:
+			return {'primary': self.primary, 'secondary': self.secondary}
+		return {'default': self.default} if self.default is not None else {}
+
+	def framerate(self, section=None):
+		"""
+		:param section: Camera section (defaults to the section of the secondary cameras)
+		:return: Configured frame rate, or None
+		:rtype: float
+		"""
+		if section is None:
+			section = 'secondary' if self.synced else 'default'
+		settings = getattr(self, section)
+		return None if settings is None else settings.get('AcquisitionFrameRate')
+
+
+def _section(config, name):
+	"""
+	:return: Section, or None if it is missing or empty
+	"""
+	if name not in config or dict(config[name].items()) == {}:
+		return None
+	return config[name]
+
+
+def _check(condition, path, message):
+	if not condition:
+		raise ValueError('{0}: {1}'.format(path, message))
+
+
+def compile_camera_section(path, section, p_config):
+	"""
+	Types every setting of a camera section.
+
+	:return: Read-only settings, in full_settings order
+	:rtype: types.MappingProxyType
+	"""
+	settings = typed_settings(p_config, section)
+	framerate = settings.get('AcquisitionFrameRate')
+	_check(framerate is None or framerate > 0, path, '[{}] AcquisitionFrameRate must be positive'.format(section))
+	exposure = settings.get('ExposureTime')
+	if framerate and exposure and str(settings.get('ExposureAuto', 'Off')).lower() == 'off' \
+			and exposure > 1e6 / framerate:
+		log.warning('{0}: [{1}] ExposureTime {2} us is longer than a frame at {3} fps'.format(
+			path, section, exposure, framerate))
+	return types.MappingProxyType(settings)
+
+
+def compile_calib_section(path, section, p_config):
+	calib = CalibConfig(**{key: p_config.getint(option) for key, option in
+	                       (('range_min', 'RangeMin'), ('zc', 'zC'), ('step_dist', 'StepDist'), ('num_reps', 'NumReps'))
+	                       if option in p_config})
+	_check(calib.range_min is not None and calib.zc is not None, path,
+	       '[{}] needs RangeMin and zC'.format(section))
+	_check(calib.step_dist is not None or calib.num_reps is not None, path,
+	       '[{}] needs StepDist or NumReps'.format(section))
+	_check(calib.step_dist is None or calib.num_reps is None, path,
+	       '[{}] StepDist and NumReps can\'t be combined'.format(section))
+	_check(calib.step_dist != 0, path, '[{}] StepDist must not be 0'.format(section))
+	_check(calib.num_reps is None or calib.num_reps > 0, path, '[{}] NumReps must be positive'.format(section))
+	return calib
+
+
+def compile_config(path, mtime):
+	"""
+	Parses and validates a config file.
+
+	:param path: Path to the config file
+	:param mtime: Modification time of the file (ns)
+	:rtype: RigConfig
+	"""
+	config = configparser.ConfigParser(interpolation=configparser.BasicInterpolation())
+	_check(config.read(path), path, 'unable to read config file')
+
+	default = _section(config, 'default')
+	primary = _section(config, 'primary')
+	secondary = _section(config, 'secondary')
+	compiled = {'path': path, 'mtime': mtime}
+
+	# read the cached camera schemas once for every camera section
+	if default is not None or primary is not None or secondary is not None:
+		for schema in cached_schemas():
+			register_schema(schema)
+
+	if default is not None:
+		compiled['default'] = compile_camera_section(path, 'default', default)
+		if primary is not None:
+			log.warning('{}: [primary] and [secondary] are ignored since [default] is set'.format(path))
+	elif primary is not None or secondary is not None:
+		_check(primary is not None and secondary is not None, path,
+		       '[primary] and [secondary] must be set together (or use [default])')
+		_check(primary.get('PrimaryID'), path, '[primary] needs a PrimaryID')
+		compiled['primary'] = compile_camera_section(path, 'primary', primary)
+		compiled['secondary'] = compile_camera_section(path, 'secondary', secondary)
+		compiled['primary_id'] = primary.get('PrimaryID')
+		framerates = (compiled['primary'].get('AcquisitionFrameRate'), compiled['secondary'].get('AcquisitionFrameRate'))
+		if framerates[0] != framerates[1]:
+			log.warning('{0}: primary and secondary frame rates are unequal ({1} and {2})'.format(path, *framerates))
+
+	aggregation = _section(config, 'aggregation')
+	if aggregation is not None:
+		compiled['aggregation'] = AggregationConfig(aggregation.getint('RangeMin'), aggregation.getint('RangeMax'),
+		                                            aggregation.getint('NumReps'))
+		for option, value in zip(('RangeMin', 'RangeMax', 'NumReps'), astuple(compiled['aggregation'])):
+			_check(value is not None, path, '[aggregation] needs {}'.format(option))
+		_check(compiled['aggregation'].range_min <= compiled['aggregation'].range_max, path,
+		       '[aggregation] RangeMin must not be greater than RangeMax')
+		_check(compiled['aggregation'].num_reps > 0, path, '[aggregation] NumReps must be positive')
+
+	compiled['calib'] = types.MappingProxyType({
+		section: compile_calib_section(path, section, config[section])
+		for section in config.sections() if section.endswith(CALIB_SUFFIX)})
+
+	compiled['settings_version'] = len(setting_types)
+	return RigConfig(**compiled)
+
+
+def load_rig_config(config_path):
+	"""
+	Returns the compiled form of a config file, compiling it only if it
+	changed since it was last loaded, or if camera schemas registered since
+	then may type settings it ignored.
+
+	:param config_path: Relative path to config file
+	:type config_path: str
+	:rtype: RigConfig
+	"""
+	path = os.path.abspath(config_path)
+	mtime = os.stat(path).st_mtime_ns
+	with _lock:
+		if path not in _configs or _configs[path].mtime != mtime or \
+				_configs[path].settings_version != len(setting_types):
+			_configs[path] = compile_config(path, mtime)
+			log.VLOG(3, 'Compiled config file {}'.format(path))
+		return _configs[path]
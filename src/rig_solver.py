@@ -0,0 +1,194 @@
+"""Frame rate, exposure and link bandwidth feasibility solver for synchronized rigs.
+
+Every camera of a synchronized rig has to run at the same frame rate, so
+the rig is only as fast as its slowest camera: whichever is limited most by
+its sensor readout at the configured frame size, or by its share of the
+link bandwidth. camera_limits() reads the limits a camera reports for its
+applied settings, and solve_rig() picks the highest common frame rate every
+camera can sustain, the longest exposure which fits in a frame at that rate,
+and a DeviceLinkThroughputLimit per camera which fits the shared bandwidth.
+"""
+
+import math
+import os
+import sys
+
+import PySpin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+HEADROOM = 0.1  # fraction of the link bandwidth left unused, for bursts and protocol overhead
+EXPOSURE_MARGIN = 5  # us between the end of an exposure and the next trigger when readout overlaps exposure
+FRAMERATE_STEP = 0.1  # proposed frame rates are rounded down to this many fps
+
+
+def read_float(nodes, title, node_func=PySpin.CFloatPtr):
+	"""
+	Reads the value and limits of a numeric node.
+
+	:param nodes: Node cache of the camera
+	:param title: Node name
+	:param node_func: CFloatPtr or CIntegerPtr
+	:type nodes: NodeCache
+	:return: (value, min, max, increment), or None if the node isn't readable
+	:rtype: tuple
+	"""
+	node = nodes.node(title, node_func)
+	if not nodes.readable(title):
+		return None
+	inc = node.GetInc() if node_func is PySpin.CIntegerPtr or node.HasInc() else None
+	return node.GetValue(), node.GetMin(), node.GetMax(), inc
+
+
+def camera_limits(nodes):
+	"""
+	Reads the limits of one camera under its applied settings (frame size,
+	binning and pixel format).
+
+	:param nodes: Node cache of the camera
+	:type nodes: NodeCache
+	:return: frame_bytes, framerate_max (sensor limit, fps), resulting_framerate, exposure (value, min, max, increment),
+		readout (us, or None) and throughput (value, min, max, increment in bytes/s, or None)
+	:rtype: dict
+	"""
+	payload = read_float(nodes, 'PayloadSize', PySpin.CIntegerPtr)
+	if payload is None:
+		width = read_float(nodes, 'Width', PySpin.CIntegerPtr)
+		height = read_float(nodes, 'Height', PySpin.CIntegerPtr)
+		payload = (width[0] * height[0],) if width and height else (0,)
+
+	framerate = read_float(nodes, 'AcquisitionFrameRate')
+	resulting = read_float(nodes, 'AcquisitionResultingFrameRate')
+	readout = read_float(nodes, 'SensorReadoutTime')
+	return {'frame_bytes': payload[0],
+	        'framerate_max': framerate[2] if framerate else None,
+	        'resulting_framerate': resulting[0] if resulting else None,
+	        'exposure': read_float(nodes, 'ExposureTime'),
+	        'readout': readout[0] if readout else None,
+	        'throughput': read_float(nodes, 'DeviceLinkThroughputLimit', PySpin.CIntegerPtr)}
+
+
+def fit_throughput(value, throughput):
+	"""
+	Rounds a link throughput limit up to the node's increment, within its range.
+
+	:param value: Throughput limit (bytes/s)
+	:param throughput: (value, min, max, increment) of the DeviceLinkThroughputLimit node
+	:rtype: int
+	"""
+	_, low, high, inc = throughput
+	return int(min(high, max(low, low + math.ceil((value - low) / inc) * inc)))
+
+
+def max_exposure(framerate, overlap=True, readout=None):
+	"""
+	Longest exposure which fits in one frame period.
+
+	:param framerate: Frame rate (fps)
+	:param overlap: True if readout overlaps the next exposure (TriggerOverlap ReadOut)
+	:param readout: Sensor readout time (us), needed without overlap
+	:return: Exposure time (us)
+	:rtype: float
+	"""
+	period = 1e6 / framerate
+	if overlap or readout is None:
+		return period - EXPOSURE_MARGIN
+	return period - readout - EXPOSURE_MARGIN
+
+
+def exposure_framerate(exposure, overlap=True, readout=None):
+	"""
+	Highest frame rate at which an exposure still fits in one frame period
+	(the inverse of max_exposure()).
+
+	:param exposure: Exposure time (us)
+	:param overlap: True if readout overlaps the next exposure (TriggerOverlap ReadOut)
+	:param readout: Sensor readout time (us), needed without overlap
+	:return: Frame rate (fps)
+	:rtype: float
+	"""
+	period = exposure + EXPOSURE_MARGIN
+	if not overlap and readout is not None:
+		period += readout
+	return 1e6 / period
+
+
+def sensor_framerate(limits):
+	"""
+	:return: Highest frame rate the camera's sensor can deliver at its frame size (fps)
+	:rtype: float
+	"""
+	rates = [limits['framerate_max']]
+	if limits['readout']:
+		rates += [1e6 / limits['readout']]
+	rates = [rate for rate in rates if rate]
+	return min(rates) if rates else math.inf
+
+
+def solve_rig(limits, settings, bandwidth=None, headroom=HEADROOM):
+	"""
+	Picks the fastest settings every camera can sustain without dropping frames.
+	The common exposure is at least every camera's minimum exposure, so if
+	that exposure doesn't fit in a frame at the fastest frame rate, the frame
+	rate is lowered until it does.
+
+	:param limits: Per-camera limits from camera_limits()
+	:param settings: Per-camera settings to apply (ExposureTime and TriggerOverlap are used if set)
+	:param bandwidth: Bandwidth shared by every camera (bytes/s), or None if each camera has its own link
+	:param headroom: Fraction of the link bandwidth left unused
+	:type limits: list
+	:type settings: list
+	:return: framerate, exposure (us), throughput (per camera, bytes/s, None if it can't be limited) and
+		limit (what bounds the frame rate)
+	:rtype: dict
+	:raises ValueError: If no frame rate limit can be read, or no frame rate fits the minimum exposure
+	"""
+	candidates = []
+	for i, camera in enumerate(limits):
+		candidates += [(sensor_framerate(camera), 'camera {} sensor readout'.format(i))]
+		if camera['throughput'] is not None and camera['frame_bytes']:
+			candidates += [(camera['throughput'][2] * (1 - headroom) / camera['frame_bytes'],
+			                'camera {} link throughput'.format(i))]
+	total_bytes = sum(camera['frame_bytes'] for camera in limits)
+	if bandwidth and total_bytes:
+		candidates += [(bandwidth * (1 - headroom) / total_bytes, 'shared link bandwidth')]
+
+	framerate, limit = min(candidates, default=(math.inf, 'nothing'))
+	if math.isinf(framerate):
+		raise ValueError('Unable to read any frame rate limit from the cameras')
+	framerate = round(math.floor(framerate / FRAMERATE_STEP) * FRAMERATE_STEP, 6)
+
+	# every camera must accept the common exposure, so it is at least the largest minimum exposure
+	overlaps = [str(camera_settings.get('TriggerOverlap', 'ReadOut')).lower() != 'off' for camera_settings in settings]
+	min_exposure = max((camera['exposure'][1] for camera in limits if camera['exposure'] is not None), default=0)
+	slowest = min(exposure_framerate(min_exposure, overlap, camera['readout'])
+	              for camera, overlap in zip(limits, overlaps))
+	if slowest < framerate:
+		framerate = round(math.floor(slowest / FRAMERATE_STEP) * FRAMERATE_STEP, 6)
+		limit = 'minimum exposure of {:.0f} us'.format(min_exposure)
+		if framerate <= 0:
+			raise ValueError('No frame rate fits the minimum exposure of {:.0f} us'.format(min_exposure))
+
+	exposures = []
+	for camera, camera_settings, overlap in zip(limits, settings, overlaps):
+		exposure = max_exposure(framerate, overlap, camera['readout'])
+		if 'ExposureTime' in camera_settings:
+			exposure = min(exposure, camera_settings['ExposureTime'])
+		exposures += [exposure]
+
+	throughput = []
+	for camera in limits:
+		if camera['throughput'] is None:
+			throughput += [None]
+			continue
+		throughput += [fit_throughput(camera['frame_bytes'] * framerate * (1 + headroom), camera['throughput'])]
+
+	return {'framerate': framerate, 'exposure': max(min(exposures), min_exposure), 'throughput': throughput,
+	        'limit': limit}
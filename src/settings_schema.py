@@ -0,0 +1,224 @@
+"""Settings schema of a camera model, introspected once from its nodemap and cached on disk.
+
+A schema maps every enumeration, float, integer and boolean node of a
+camera's nodemap to its interface type, access mode at introspection time
+(as the integer EAccessMode value),
+enumeration entries (every implemented one, since availability can depend
+on other settings) and min/max/increment. It is keyed by model and
+firmware version, so a camera model is walked once and every later run
+reads the cached file. Schemas type the config keys which aren't in
+full_settings (see rig_config.py, which reads them without PySpin), and
+SetSettings validates settings against them before writing.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+SCHEMA_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'spinnaker-python', 'schemas')
+
+_schemas = {}  # (model, firmware) -> schema
+_lock = threading.Lock()
+
+
+def device_model(cam):
+	"""
+	Reads a camera's model name and firmware version from the transport
+	layer, which doesn't need the camera to be initialized.
+
+	:param cam: Camera
+	:type cam: CameraPtr
+	:return: (model name, firmware version); empty strings if unreadable
+	:rtype: tuple
+	"""
+	import PySpin
+
+	nodemap_tldevice = cam.GetTLDeviceNodeMap()
+	identity = []
+	for title in ('DeviceModelName', 'DeviceVersion'):
+		node = PySpin.CStringPtr(nodemap_tldevice.GetNode(title))
+		identity += [node.GetValue() if PySpin.IsAvailable(node) and PySpin.IsReadable(node) else '']
+	return tuple(identity)
+
+
+def schema_path(model, firmware):
+	"""
+	:return: Path of the cached schema of a camera model and firmware version
+	:rtype: str
+	"""
+	name = re.sub(r'[^A-Za-z0-9._-]+', '_', '{}-{}'.format(model, firmware))
+	return os.path.join(SCHEMA_DIR, '{}.json'.format(name))
+
+
+def introspect_node(node):
+	"""
+	Describes one node of a nodemap.
+
+	:param node: Node
+	:type node: INode
+	:return: Node description, or None if it isn't an enumeration, float, integer or boolean
+	:rtype: dict
+	"""
+	import PySpin
+
+	interface = node.GetPrincipalInterfaceType()
+	readable = PySpin.IsAvailable(node) and PySpin.IsReadable(node)
+	info = {'access': int(node.GetAccessMode())}
+
+	if interface == PySpin.intfIEnumeration:
+		node_enum = PySpin.CEnumerationPtr(node)
+		info['type'] = 'enum'
+		info['entries'] = [PySpin.CEnumEntryPtr(entry).GetSymbolic() for entry in node_enum.GetEntries()
+		                   if PySpin.IsImplemented(entry)]
+	elif interface == PySpin.intfIFloat:
+		node_float = PySpin.CFloatPtr(node)
+		info['type'] = 'float'
+		if readable:
+			info['min'], info['max'] = node_float.GetMin(), node_float.GetMax()
+			if node_float.HasInc():
+				info['inc'] = node_float.GetInc()
+	elif interface == PySpin.intfIInteger:
+		node_int = PySpin.CIntegerPtr(node)
+		info['type'] = 'int'
+		if readable:
+			info['min'], info['max'], info['inc'] = node_int.GetMin(), node_int.GetMax(), node_int.GetInc()
+	elif interface == PySpin.intfIBoolean:
+		info['type'] = 'bool'
+	else:
+		return None
+
+	return info
+
+
+def introspect_nodemap(nodemap):
+	"""
+	Walks every node of an initialized camera's nodemap.
+
+	:param nodemap: GenICam nodemap
+	:type nodemap: INodeMap
+	:return: Node name -> node description
+	:rtype: dict
+	"""
+	schema = {}
+	for node in nodemap.GetNodes():
+		try:
+			info = introspect_node(node)
+		except Exception as ex:
+			# one odd node mustn't cost the whole schema
+			log.VLOG(3, 'Skipping node {0} ({1!r})'.format(node.GetName(), ex))
+			continue
+		if info is not None:
+			schema[node.GetName()] = info
+	return schema
+
+
+def load_schema(model, firmware):
+	"""
+	:return: Cached schema of a camera model and firmware version, or None
+	:rtype: dict
+	"""
+	try:
+		with open(schema_path(model, firmware)) as schema_file:
+			return json.load(schema_file)
+	except (OSError, ValueError):
+		return None
+
+
+def save_schema(model, firmware, schema):
+	path = schema_path(model, firmware)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp_file = '{}.{}'.format(path, os.getpid())
+	with open(temp_file, 'w') as schema_file:
+		json.dump(schema, schema_file, indent=1, sort_keys=True)
+	os.replace(temp_file, path)
+
+
+def camera_schema(cam):
+	"""
+	Returns the schema of an initialized camera's model, introspecting its
+	nodemap only if no other camera of the same model and firmware was
+	introspected before. If the schema can't be built, settings are only
+	checked against full_settings, rather than failing the camera.
+
+	:param cam: Initialized camera
+	:type cam: CameraPtr
+	:return: Node name -> node description, empty if the schema can't be built
+	:rtype: dict
+	"""
+	try:
+		key = device_model(cam)
+		with _lock:
+			if key not in _schemas:
+				schema = load_schema(*key)
+				if schema is None:
+					schema = introspect_nodemap(cam.GetNodeMap())
+					save_schema(key[0], key[1], schema)
+					log.VLOG(1, 'Introspected {0} nodes of {1} (firmware {2})'.format(len(schema), *key))
+				_schemas[key] = schema
+			return _schemas[key]
+	except Exception as ex:
+		log.error('Unable to build the settings schema of the camera, settings are not validated: {!r}'.format(ex))
+		return {}
+
+
+def cached_schemas():
+	"""
+	Loads every schema cached on disk, without touching the cameras.
+
+	:return: Schemas
+	:rtype: list
+	"""
+	try:
+		names = sorted(os.listdir(SCHEMA_DIR))
+	except OSError:
+		return []
+
+	schemas = []
+	for name in names:
+		if not name.endswith('.json'):
+			continue
+		try:
+			with open(os.path.join(SCHEMA_DIR, name)) as schema_file:
+				schemas += [json.load(schema_file)]
+		except (OSError, ValueError):
+			log.warning('Unable to read settings schema {}'.format(name))
+	return schemas
+
+
+def validate_setting(schema, title, value):
+	"""
+	Checks a setting against a camera model's schema. Limits are only
+	warned about, since they depend on other settings (e.g. the exposure
+	time limit on the frame rate).
+
+	:param schema: Camera schema
+	:param title: Setting name
+	:param value: Typed setting value
+	:type schema: dict
+	:return: Error message, or None if the setting is valid
+	:rtype: str
+	"""
+	info = schema.get(title)
+	if info is None:
+		return '{} is not a setting of this camera'.format(title)
+
+	if info['type'] == 'enum':
+		if value not in info['entries']:
+			return '{0} is not a {1} entry (one of {2})'.format(value, title, ', '.join(info['entries']))
+	elif info['type'] in ('float', 'int') and 'min' in info:
+		if not info['min'] <= value <= info['max']:
+			log.warning('{0} = {1} is outside {2} to {3} (as introspected)'.format(
+				title, value, info['min'], info['max']))
+
+	return None
@@ -0,0 +1,326 @@
+"""Binary timestamp file of a recording.
+
+A timestamp file holds a small JSON header (camera serials in recording
+order, index of the primary camera, number of frames per camera and whether
+the timestamps come from the host clock or from each camera's own clock)
+padded to HEADER_BYTES, followed by one column of int64 nanosecond
+timestamps per camera, in header order. Columns are contiguous, so the file
+is memory-mapped directly and nothing is parsed. Every camera keeps all its
+frames; readers match them to the primary camera's frames by timestamp (see
+frame_alignment.py) rather than cropping to the shortest camera.
+
+Run this file to export a timestamp file to the CSV layout used before
+(seconds, one row per frame, primary camera first), or with --benchmark to
+compare loading both formats.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+from frame_alignment import GAP, TOLERANCE, align_frames, aligned_timestamps, frame_period, match_nearest
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+MAGIC = b'MCATTS01'
+HEADER_BYTES = 4096
+BATCH_FRAMES = 1 << 16  # frames converted and written at once
+BLOCK_FRAMES = 1 << 20  # primary frames per block read by aligned_blocks()
+BENCHMARK_FRAMES = [10 ** 5, 10 ** 6, 10 ** 7]
+BENCHMARK_CAMERAS = 4
+
+
+def timestamps_path(capture_num=-1, extension='bin'):
+	"""
+	:param capture_num: Number of frames requested (-1 for an open-ended recording)
+	:param extension: bin, or csv for an exported table
+	:return: Path the timestamps of a recording are saved to
+	:rtype: str
+	"""
+	if capture_num > 0:
+		return 'Timestamps/MCAT-timestamps-{0}.{1}'.format(capture_num, extension)
+	return 'MCAT-timestamps.{}'.format(extension)
+
+
+def write_timestamp_file(path, timestamps, serials, primary_index, scale=1e9, clock='host'):
+	"""
+	Writes the timestamps of a recording. Columns are converted in batches,
+	so memory-mapped timestamps are never loaded whole.
+
+	:param path: Path of the timestamp file
+	:param timestamps: Per-camera timestamps
+	:param serials: Camera serial numbers, in the order of timestamps
+	:param primary_index: Index of the primary camera (-1 if there is none)
+	:param scale: Nanoseconds per unit of timestamps (1e9 for seconds, 1e6 for milliseconds)
+	:param clock: host if every camera's timestamps come from the same clock, camera if from each camera's own
+	:type timestamps: list
+	:type serials: list
+	:type primary_index: int
+	:type clock: str
+	:return: Number of frames written per camera
+	:rtype: list
+	"""
+	lengths = [len(times) for times in timestamps]
+	if max(lengths) != min(lengths):
+		log.VLOG(2, 'Timestamp lengths are not equal ({}); frames are matched by timestamp when read'.format(lengths))
+
+	header = MAGIC + json.dumps({'serials': [str(serial) for serial in serials], 'primary_index': primary_index,
+	                             'frames': lengths, 'clock': clock}).encode()
+	if len(header) > HEADER_BYTES:
+		raise ValueError('Timestamp file header is larger than {} bytes'.format(HEADER_BYTES))
+
+	if os.path.dirname(path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, 'wb') as output:
+		output.write(header.ljust(HEADER_BYTES, b'\0'))
+		for times in timestamps:
+			for start in range(0, len(times), BATCH_FRAMES):
+				column = np.asarray(times[start:start + BATCH_FRAMES], dtype=np.float64)
+				output.write(np.rint(column * scale).astype('<i8').tobytes())
+	return lengths
+
+
+def save_timestamps(timestamps, serials, primary_index, capture_num):
+	"""
+	Saves the host timestamps of a recording to the timestamp file of its
+	frame count. Every camera keeps all its frames, even if the cameras
+	recorded different numbers of them; readers match them by timestamp.
+
+	:param timestamps: Per-camera host timestamps in seconds
+	:param serials: Camera serial numbers
+	:param primary_index: Index of the primary camera (-1 if there is none)
+	:param capture_num: Number of frames requested (-1 for an open-ended recording)
+	:type timestamps: list
+	:type serials: list
+	:type primary_index: int
+	:type capture_num: int
+	:return: Path of the timestamps file
+	:rtype: str
+	"""
+	timestamps_file = timestamps_path(capture_num)
+	write_timestamp_file(timestamps_file, timestamps, serials, primary_index)
+	log.VLOG(2, 'Saving timestamps as %s' % timestamps_file)
+	return os.path.abspath(timestamps_file)
+
+
+def read_header(path):
+	"""
+	:param path: Path of a timestamp file
+	:return: Header (serials, primary_index, frames per camera and clock)
+	:rtype: dict
+	"""
+	with open(path, 'rb') as timestamp_file:
+		header = timestamp_file.read(HEADER_BYTES)
+	if not header.startswith(MAGIC):
+		raise ValueError('{} is not a timestamp file'.format(path))
+	return json.loads(header[len(MAGIC):].rstrip(b'\0').decode())
+
+
+def read_timestamp_file(path):
+	"""
+	Memory-maps a timestamp file.
+
+	:param path: Path of a timestamp file
+	:return: (header, per-camera int64 nanosecond timestamps in header order)
+	:rtype: tuple
+	"""
+	header = read_header(path)
+	columns = []
+	offset = HEADER_BYTES
+	for frames in header['frames']:
+		columns += [np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(frames,)) if frames
+		            else np.zeros(0, dtype='<i8')]
+		offset += frames * np.dtype('<i8').itemsize
+	return header, columns
+
+
+def column_order(header):
+	"""
+	:param header: Timestamp file header
+	:return: Column indices with the primary camera first, as in the CSV tables
+	:rtype: list
+	"""
+	order = list(range(len(header['serials'])))
+	if header['primary_index'] > 0:
+		order[0], order[header['primary_index']] = header['primary_index'], 0
+	return order
+
+
+def frame_table(path, tolerance=None):
+	"""
+	Matches every camera's frames to the primary camera's (or the first
+	camera's, if there is no primary).
+
+	:param path: Path of a timestamp file
+	:param tolerance: Largest time difference of a match (s, defaults to half a frame period)
+	:return: (header, per-camera timestamps, (primary frames x cameras) frame index table in header order, with GAP
+		where a camera has no frame)
+	:rtype: tuple
+	"""
+	header, columns = read_timestamp_file(path)
+	table = align_frames(columns, max(header['primary_index'], 0), None if tolerance is None else tolerance * 1e9,
+	                     relative=header.get('clock') == 'camera')
+	return header, columns, table
+
+
+def timestamp_table(path, tolerance=None):
+	"""
+	Loads a timestamp file in the layout of the CSV tables.
+
+	:param path: Path of a timestamp file
+	:param tolerance: Largest time difference of a frame match (s, defaults to half a frame period)
+	:return: (frames x cameras) timestamps in seconds, primary camera first, NaN where a camera has no frame
+	:rtype: numpy.ndarray
+	"""
+	header, columns, table = frame_table(path, tolerance)
+	order = column_order(header)
+	return aligned_timestamps([columns[j] for j in order], table[:, order]) / 1e9
+
+
+def aligned_blocks(path, block_frames=BLOCK_FRAMES, tolerance=None):
+	"""
+	Reads a timestamp file in blocks of primary frames, matching the other
+	cameras' frames like timestamp_table() does, without ever reading a
+	whole column. Each camera's frames for a block are found by binary
+	search in its memory-mapped column. Blocks are matched with one frame of
+	context on each side, so a camera frame near two primary frames of
+	neighbouring blocks is only matched once. The default tolerance is half
+	the median frame period of the first block rather than of the whole
+	recording.
+
+	:param path: Path of a timestamp file
+	:param block_frames: Primary frames per block
+	:param tolerance: Largest time difference of a frame match (s, defaults to half a frame period)
+	:return: Iterator over (block frames x cameras) timestamps in seconds, primary camera first, NaN where a camera
+		has no frame
+	:rtype: iterator
+	"""
+	header, columns = read_timestamp_file(path)
+	order = column_order(header)
+	reference = order[0]
+	relative = header.get('clock') == 'camera'
+	offsets = [int(times[0]) if relative and len(times) else 0 for times in columns]
+	reference_column = columns[reference]
+	if tolerance is None:
+		tolerance = TOLERANCE * frame_period(np.asarray(reference_column[:block_frames], dtype=np.float64))
+	else:
+		tolerance *= 1e9
+
+	gaps = [0 for _ in columns]
+	for start in range(0, len(reference_column), block_frames):
+		stop = min(start + block_frames, len(reference_column))
+		first, last = max(start - 1, 0), min(stop + 1, len(reference_column))
+		reference_times = np.asarray(reference_column[first:last], dtype=np.float64) - offsets[reference]
+		rows = slice(start - first, stop - first)
+
+		block = np.empty((stop - start, len(columns)))
+		for k, j in enumerate(order):
+			if j == reference:
+				block[:, k] = reference_column[start:stop]
+				continue
+			# only frames within the tolerance of the block can match
+			low = columns[j].searchsorted(np.int64(np.floor(reference_times[0] + offsets[j] - tolerance)), 'left')
+			high = columns[j].searchsorted(np.int64(np.ceil(reference_times[-1] + offsets[j] + tolerance)), 'right')
+			times = np.asarray(columns[j][low:high])
+			match = match_nearest(times.astype(np.float64) - offsets[j], reference_times, tolerance)[rows]
+			present = match != GAP
+			block[:, k] = np.nan
+			block[present, k] = times[match[present]]
+			gaps[j] += int(np.count_nonzero(~present))
+		yield block / 1e9
+
+	for j, count in enumerate(gaps):
+		if count:
+			log.VLOG(2, 'Camera {0}: {1} of {2} reference frames have no matching frame'.format(
+				j, count, len(reference_column)))
+
+
+def export_csv(path, csv_path=None):
+	"""
+	Exports a timestamp file as a CSV table (seconds, primary camera first,
+	nan where a camera has no frame), in batches of rows.
+
+	:param path: Path of a timestamp file
+	:param csv_path: Path of the CSV file (defaults to the timestamp file's, with a .csv extension)
+	:return: Path of the CSV file
+	:rtype: str
+	"""
+	if csv_path is None:
+		csv_path = os.path.splitext(path)[0] + '.csv'
+	header, columns, table = frame_table(path)
+	order = column_order(header)
+	columns = [columns[j] for j in order]
+	table = table[:, order]
+
+	with open(csv_path, 'wb') as output:
+		for start in range(0, len(table), BATCH_FRAMES):
+			np.savetxt(output, aligned_timestamps(columns, table[start:start + BATCH_FRAMES]) / 1e9, delimiter=',')
+	log.VLOG(1, 'Exported {0} frames of {1} cameras to {2}'.format(len(table), len(order), csv_path))
+	return csv_path
+
+
+def benchmark(frame_counts=BENCHMARK_FRAMES, num_cameras=BENCHMARK_CAMERAS):
+	"""
+	Times loading the same timestamps from a CSV table and from a timestamp
+	file.
+
+	:param frame_counts: Numbers of frames to compare at
+	:param num_cameras: Number of cameras
+	:return: Per frame count: (CSV load seconds, binary load seconds, file sizes in bytes)
+	:rtype: dict
+	"""
+	results = {}
+	with tempfile.TemporaryDirectory() as folder:
+		for frames in frame_counts:
+			# a few hours at 100 fps and beyond, with some jitter between cameras
+			timestamps = [np.arange(frames) / 100 + np.random.uniform(0, 1e-4, frames) for _ in range(num_cameras)]
+			bin_path = os.path.join(folder, 'timestamps.bin')
+			write_timestamp_file(bin_path, timestamps, list(range(num_cameras)), 0)
+			csv_path = export_csv(bin_path)
+			del timestamps
+
+			start = time.perf_counter()
+			np.loadtxt(csv_path, delimiter=',')
+			csv_time = time.perf_counter() - start
+
+			start = time.perf_counter()
+			timestamp_table(bin_path)
+			bin_time = time.perf_counter() - start
+
+			results[frames] = (csv_time, bin_time, os.path.getsize(csv_path), os.path.getsize(bin_path))
+			log.VLOG(1, '{0} frames x {1} cameras: CSV {2:.3f} s ({3:.1f} MB), binary {4:.3f} s ({5:.1f} MB), '
+			            '{6:.0f}x faster'.format(frames, num_cameras, csv_time, results[frames][2] / 1e6, bin_time,
+			                                     results[frames][3] / 1e6, csv_time / bin_time if bin_time else 0))
+	return results
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-i', '--input', help='timestamp file to export as CSV', type=str, default=timestamps_path())
+	parser.add_argument('-o', '--output', help='CSV file to write (defaults to the input\'s, with a .csv extension)',
+	                    type=str)
+	parser.add_argument('--benchmark', help='compare loading CSV and binary timestamps at these frame counts',
+	                    nargs='*', type=int)
+	parser.add_argument('-v', '--verbosity', help='verbosity level for file prints (1 through 4 or DEBUG, INFO, etc.)',
+	                    type=str, default="1")
+	parser.add_argument('-l', '--logType', help='style of log print messages (cpp (default), pretty)', type=str,
+	                    default="cpp")
+	args = parser.parse_args()
+	log = logger.getLogger(__file__, args.verbosity, args.logType)
+
+	if args.benchmark is not None:
+		benchmark(args.benchmark or BENCHMARK_FRAMES)
+	else:
+		export_csv(args.input, args.output)
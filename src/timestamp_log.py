@@ -0,0 +1,112 @@
+"""Per-camera binary timestamp logs, written while recording.
+
+Each camera of a recording appends one fixed-size RECORD_DTYPE record (frame
+number, host timestamp in seconds) per frame to its own log,
+``<base>-<serial>.ts``. Records are collected in a preallocated batch and
+written and flushed every FLUSH_RECORDS frames, so memory stays flat however
+long the recording is and a crash loses at most one batch per camera. The
+timestamp table of a recording is assembled from the logs once it is done.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+import logger
+
+if not __name__ == "__main__":
+	import traceback
+
+	filename = traceback.format_stack()[0]
+	log = logger.getLogger(filename.split('"')[1], False, False)
+
+RECORD_DTYPE = np.dtype([('frame', '<u8'),
+                         ('timestamp', '<f8')])
+FLUSH_RECORDS = 1024  # records written to disk at once
+
+
+def log_path(base, serial):
+	"""
+	:param base: Base path of the recording (without extension)
+	:param serial: Camera serial number
+	:return: Path of a camera's timestamp log
+	:rtype: str
+	"""
+	return '{0}-{1}.ts'.format(base, serial)
+
+
+class TimestampLog:
+	"""
+	Append-only timestamp log of one camera. Not thread-safe: each camera's
+	grab thread owns its log.
+	"""
+
+	def __init__(self, path, batch=FLUSH_RECORDS):
+		"""
+		:param path: Path of the log (truncated if it exists)
+		:param batch: Number of records collected before they are written and flushed
+		:type path: str
+		:type batch: int
+		"""
+		self.path = path
+		self._file = open(path, 'wb')
+		self._batch = np.zeros(batch, dtype=RECORD_DTYPE)
+		self._pending = 0
+		self._count = 0
+
+	def __len__(self):
+		return self._count
+
+	def append(self, frame, timestamp):
+		"""
+		:param frame: Frame number
+		:param timestamp: Host timestamp (seconds)
+		"""
+		self._batch[self._pending] = (frame, timestamp)
+		self._pending += 1
+		self._count += 1
+		if self._pending == len(self._batch):
+			self.flush()
+
+	def flush(self):
+		"""
+		Writes the pending records to disk.
+		"""
+		if self._pending:
+			self._file.write(self._batch[:self._pending].tobytes())
+			self._pending = 0
+		self._file.flush()
+
+	def close(self):
+		if self._file.closed:
+			return
+		self.flush()
+		self._file.close()
+
+
+def read_timestamp_log(path):
+	"""
+	Memory-maps a timestamp log. A partial record at the end (from a crash
+	mid-write) is ignored.
+
+	:param path: Path of the log
+	:type path: str
+	:return: Records of the log
+	:rtype: numpy.ndarray
+	"""
+	count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+	if count == 0:
+		return np.zeros(0, dtype=RECORD_DTYPE)
+	return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+
+def read_timestamps(paths):
+	"""
+	:param paths: Paths of the timestamp logs of a recording, one per camera
+	:type paths: list
+	:return: Per-camera host timestamps (memory-mapped, seconds)
+	:rtype: list
+	"""
+	return [read_timestamp_log(path)['timestamp'] for path in paths]
@@ -0,0 +1,98 @@
+"""Round trip of the camera daemon's commands over its socket, with the fake backend."""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'src/'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+
+import CameraDaemon
+from camera_backend import FakeBackend
+from daemon_client import daemon_request
+from timestamp_file import read_header
+
+CONFIG = """[default]
+AcquisitionFrameRate = 200
+Width = 64
+Height = 48
+"""
+NUM_CAMERAS = 2
+NUM_FRAMES = 20
+STARTUP_TIMEOUT = 10  # seconds to wait for the daemon's socket
+
+
+class FakeDaemonTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.folder = tempfile.TemporaryDirectory()
+		os.chdir(self.folder.name)
+		with open('config.cfg', 'w') as config_file:
+			config_file.write(CONFIG)
+
+		self.socket = os.path.join(self.folder.name, 'daemon.sock')
+		self.thread = threading.Thread(target=CameraDaemon.main, args=(self.socket, 'fake'),
+		                               kwargs={'num_cameras': NUM_CAMERAS})
+		self.thread.start()
+		deadline = time.perf_counter() + STARTUP_TIMEOUT
+		while not os.path.exists(self.socket) and time.perf_counter() < deadline:
+			time.sleep(0.01)
+
+	def tearDown(self):
+		if self.thread.is_alive():
+			daemon_request('shutdown', self.socket)
+		self.thread.join(STARTUP_TIMEOUT)
+		os.chdir(self.cwd)
+		self.folder.cleanup()
+
+	def test_round_trip(self):
+		self.assertTrue(daemon_request('ping', self.socket)['ok'])
+		self.assertTrue(daemon_request('settings', self.socket, config_file='config.cfg')['ok'])
+
+		stats = daemon_request('stats', self.socket)
+		self.assertEqual(stats['backend'], 'fake')
+		self.assertEqual(len(stats['serials']), NUM_CAMERAS)
+		self.assertEqual(stats['layouts'], [['Mono8', 64, 48] for _ in range(NUM_CAMERAS)])
+
+		self.assertTrue(daemon_request('start', self.socket, num_frames=NUM_FRAMES)['ok'])
+		self.assertFalse(daemon_request('start', self.socket, num_frames=NUM_FRAMES)['ok'])
+		response = daemon_request('stop', self.socket, wait=True)
+		self.assertTrue(response['ok'])
+		self.assertEqual(response['frames'], [NUM_FRAMES for _ in range(NUM_CAMERAS)])
+		self.assertEqual(response['dropped'], [0 for _ in range(NUM_CAMERAS)])
+		self.assertEqual(read_header(response['timestamps'])['frames'], [NUM_FRAMES for _ in range(NUM_CAMERAS)])
+
+		stats = daemon_request('stats', self.socket)
+		self.assertEqual(stats['counts'], {'settings': 1, 'captures': 0, 'recordings': 1, 'errors': 1})
+		self.assertIsNone(stats['recording'])
+		self.assertEqual(stats['last_recording']['frames'], response['frames'])
+
+		self.assertTrue(daemon_request('shutdown', self.socket)['ok'])
+		self.thread.join(STARTUP_TIMEOUT)
+		self.assertFalse(self.thread.is_alive())
+
+	def test_unexpected_errors(self):
+		def fail(*args, **kwargs):
+			raise KeyError('fail')
+
+		daemon = CameraDaemon.Daemon(FakeBackend(NUM_CAMERAS, width=64, height=48))
+		daemon.backend.open()
+		daemon.backend.apply_settings = fail
+		response = daemon.handle({'command': 'settings', 'config_file': 'config.cfg'})
+		self.assertFalse(response['ok'])
+		self.assertIn('KeyError', response['error'])
+
+		self.assertTrue(daemon.handle({'command': 'start', 'num_frames': NUM_FRAMES})['ok'])
+		daemon.recorder.stop()
+		daemon.recorder.stop = fail
+		self.assertFalse(daemon.handle({'command': 'stop'})['ok'])
+		self.assertIsNone(daemon.recorder)
+		self.assertEqual(daemon.counts['errors'], 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
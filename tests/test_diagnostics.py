@@ -0,0 +1,207 @@
+"""Golden output of the diagnostics report, as printed by the per-window loop interpret_file() used to run."""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'src/'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+
+import diagnostics
+from timestamp_file import timestamps_path, write_timestamp_file
+
+FRAMERATE = 30
+OFFSETS = [0, 1e-4, 3e-4, 2e-4]  # seconds each camera captures after the first
+LAG = 0.05  # seconds a lagging frame arrives late
+BLOCK_FRAMES = 32  # frames per block of the chunked report
+
+# Reports printed by the per-window loop for table(120, (80, 95, 96, 97)) and table(15, (4,))
+REPORT_120 = """----------- FRAMES 0-10 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00025)]
+                     fps: 633.3333664846554
+----------- FRAMES 11-21 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.997580812971975
+----------- FRAMES 22-32 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00027)]
+                     fps: 29.99758081297198
+----------- FRAMES 33-43 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 30.003719946677577
+----------- FRAMES 44-54 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.997580812971965
+----------- FRAMES 55-65 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00025)]
+                     fps: 30.00371994667756
+----------- FRAMES 66-76 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.997580812971957
+----------- FRAMES 77-87 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00027)]
+                     fps: 28.358119790442856
+----------- FRAMES 88-98 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 25.095651156237647
+----------- FRAMES 99-109 -----------
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.997580812971957
+
+-------------------------------------------
+                 AVERAGE FPS: 29.99681
+            AVERAGE DISTANCE: 0.0001788
+             FRAMES CAPTURED: 120
+FRAMES NOT WITHIN 5% AVG FPS: [(0, np.float64(6666.666666666667)), (80, np.float64(12.006483501090642)), (95, np.float64(12.006483501090642)), (96, np.float64(11.99568155464028)), (97, np.float64(11.995681554640408))]
+"""
+REPORT_15 = """----------- FRAME 0 -----------
+average capture time (s): [np.float64(0.00015)]
+               distances: [np.float64(0.0), np.float64(0.0001), np.float64(0.0003), np.float64(0.0002)]
+                     fps: 6666.666666666667
+----------- FRAME 1 -----------
+average capture time (s): [np.float64(0.03351333333333333)]
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.973024278149662
+----------- FRAME 2 -----------
+average capture time (s): [np.float64(0.06687666666666667)]
+               distances: [np.float64(0.0), np.float64(0.00014), np.float64(0.00038), np.float64(0.00032)]
+                     fps: 29.973024278149662
+----------- FRAME 3 -----------
+average capture time (s): [np.float64(0.100165)]
+               distances: [np.float64(0.0), np.float64(0.00011), np.float64(0.00032), np.float64(0.00023)]
+                     fps: 30.040554748911028
+----------- FRAME 4 -----------
+average capture time (s): [np.float64(0.18352833333333332)]
+               distances: [np.float64(0.0), np.float64(0.00013), np.float64(0.00036), np.float64(0.00029)]
+                     fps: 11.995681554640331
+----------- FRAME 5 -----------
+average capture time (s): [np.float64(0.21681666666666666)]
+               distances: [np.float64(0.0), np.float64(0.0001), np.float64(0.0003), np.float64(0.0002)]
+                     fps: 30.040554748911028
+----------- FRAME 6 -----------
+average capture time (s): [np.float64(0.25018)]
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.973024278149644
+----------- FRAME 7 -----------
+average capture time (s): [np.float64(0.2835433333333333)]
+               distances: [np.float64(0.0), np.float64(0.00014), np.float64(0.00038), np.float64(0.00032)]
+                     fps: 29.973024278149694
+----------- FRAME 8 -----------
+average capture time (s): [np.float64(0.3168316666666667)]
+               distances: [np.float64(0.0), np.float64(0.00011), np.float64(0.00032), np.float64(0.00023)]
+                     fps: 30.040554748911003
+----------- FRAME 9 -----------
+average capture time (s): [np.float64(0.350195)]
+               distances: [np.float64(0.0), np.float64(0.00013), np.float64(0.00036), np.float64(0.00029)]
+                     fps: 29.973024278149694
+----------- FRAME 10 -----------
+average capture time (s): [np.float64(0.3834833333333333)]
+               distances: [np.float64(0.0), np.float64(0.0001), np.float64(0.0003), np.float64(0.0002)]
+                     fps: 30.040554748911052
+----------- FRAME 11 -----------
+average capture time (s): [np.float64(0.41684666666666664)]
+               distances: [np.float64(0.0), np.float64(0.00012), np.float64(0.00034), np.float64(0.00026)]
+                     fps: 29.973024278149644
+----------- FRAME 12 -----------
+average capture time (s): [np.float64(0.45021)]
+               distances: [np.float64(0.0), np.float64(0.00014), np.float64(0.00038), np.float64(0.00032)]
+                     fps: 29.973024278149644
+----------- FRAME 13 -----------
+average capture time (s): [np.float64(0.4834983333333333)]
+               distances: [np.float64(0.0), np.float64(0.00011), np.float64(0.00032), np.float64(0.00023)]
+                     fps: 30.040554748911052
+----------- FRAME 14 -----------
+average capture time (s): [np.float64(0.5168616666666667)]
+               distances: [np.float64(0.0), np.float64(0.00013), np.float64(0.00036), np.float64(0.00029)]
+                     fps: 29.973024278149644
+
+-------------------------------------------
+                 AVERAGE FPS: 29.999
+            AVERAGE DISTANCE: 0.0001787
+             FRAMES CAPTURED: 15
+FRAMES NOT WITHIN 5% AVG FPS: [(0, np.float64(6666.666666666667)), (4, np.float64(11.995681554640331))]
+"""
+
+
+def table(frames, lags):
+	"""
+	:param frames: Number of frames
+	:param lags: Frames arriving LAG late (every later frame shifts with them)
+	:return: (frames x cameras) timestamps of a FRAMERATE fps recording with a little jitter
+	:rtype: numpy.ndarray
+	"""
+	times = (np.arange(frames) / FRAMERATE)[:, None] + np.array(OFFSETS)
+	times += ((np.arange(frames) * 7) % 5)[:, None] * 1e-5 * np.arange(len(OFFSETS))
+	for lag in lags:
+		times[lag:] += LAG
+	return times
+
+
+class InterpretFileTest(unittest.TestCase):
+
+	def setUp(self):
+		self.cwd = os.getcwd()
+		self.folder = tempfile.TemporaryDirectory()
+		os.chdir(self.folder.name)
+
+	def tearDown(self):
+		os.chdir(self.cwd)
+		self.folder.cleanup()
+
+	def interpret(self, times, chunked=None):
+		"""
+		Prints the report of times, saved as a CSV table unless a timestamp file was already written.
+		"""
+		if not os.path.exists(timestamps_path()):
+			np.savetxt('MCAT-timestamps.csv', times, delimiter=',')
+		output = io.StringIO()
+		with contextlib.redirect_stdout(output):
+			result = diagnostics.interpret_file(True, framerate=FRAMERATE, frame_total=len(times),
+			                                       chunked=chunked)
+		return output.getvalue(), result
+
+	def test_windows(self):
+		report, (frames, lag) = self.interpret(table(120, (80, 95, 96, 97)))
+		self.assertEqual(report, REPORT_120)
+		self.assertEqual(frames, 120)
+		# frame 80 lags alone, 95-97 lag in a row
+		self.assertEqual(lag, (95, np.float64(12.006483501090642)))
+
+	def test_single_frame_windows(self):
+		report, (frames, lag) = self.interpret(table(15, (4,)))
+		self.assertEqual(report, REPORT_15)
+		self.assertEqual(frames, 15)
+		# frame 4 lags before the lag check starts (half the frames)
+		self.assertEqual(lag, ())
+
+	def test_chunked(self):
+		# below the sketch size the sketches are exact, so the chunked report matches the whole-array one
+		times = table(120, (80, 95, 96, 97))
+		write_timestamp_file(timestamps_path(), list(times.T), list(range(times.shape[1])), 0)
+		report, result = self.interpret(times)
+		chunked, chunked_result = self.interpret(times, BLOCK_FRAMES)
+		self.assertEqual(chunked_result, result)
+
+		report, chunked = report.splitlines(), chunked.splitlines()
+		self.assertEqual(len(chunked), len(report))
+		for line, chunked_line in zip(report[:-1], chunked[:-1]):
+			if line.strip().startswith('fps:'):
+				# window fps are summed block by block rather than pairwise
+				self.assertAlmostEqual(float(chunked_line.split(':')[1]), float(line.split(':')[1]), places=9)
+			else:
+				self.assertEqual(chunked_line, line)
+		off = report[-1].split(': ', 1)[1]
+		self.assertEqual(chunked[-1], 'FRAMES NOT WITHIN 5% AVG FPS: 5 (worst: {})'.format(off))
+
+	def test_fewer_than_ten_frames(self):
+		# there is no window size below 10 frames, as with the per-window loop
+		with self.assertRaises(ZeroDivisionError):
+			self.interpret(table(9, ()))
+
+
+if __name__ == '__main__':
+	unittest.main()
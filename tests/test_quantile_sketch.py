@@ -0,0 +1,67 @@
+"""Quantile sketch answers against exact numpy/scipy statistics."""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy import stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'src/'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../', 'lib/'))
+
+from quantile_sketch import QuantileSketch
+
+SIZE = 1024
+NUM_VALUES = 100000
+NUM_BLOCKS = 37
+RANK_ERROR = 4 / SIZE  # allowed rank error, as a fraction of the count (rank error shrinks roughly as 1 / size)
+MEAN_ERROR = 0.01  # allowed relative error of the trimmed mean
+QUANTILES = [0.01, 0.1, 0.5, 0.9, 0.99]
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+	def setUp(self):
+		self.values = np.random.default_rng(1).lognormal(size=NUM_VALUES)
+
+	def check(self, sketch, values, rank_error, mean_error):
+		self.assertEqual(len(sketch), len(values))
+		self.assertEqual(sketch.min, values.min())
+		self.assertEqual(sketch.max, values.max())
+		self.assertAlmostEqual(sketch.mean(), values.mean())
+		ordered = np.sort(values)
+		for value in np.quantile(values, QUANTILES):
+			for side in ('left', 'right'):
+				self.assertLessEqual(abs(sketch.rank(value, side=side) - np.searchsorted(ordered, value, side=side)),
+				                     rank_error * len(values))
+		expected = stats.trim_mean(values, 0.1)
+		self.assertLessEqual(abs(sketch.trimmed_mean(0.1) - expected), mean_error * abs(expected))
+
+	def test_blocks(self):
+		sketch = QuantileSketch(SIZE)
+		for block in np.array_split(self.values, NUM_BLOCKS):
+			sketch.update(block)
+		self.check(sketch, self.values, RANK_ERROR, MEAN_ERROR)
+
+	def test_merge(self):
+		sketch, other = QuantileSketch(SIZE), QuantileSketch(SIZE)
+		sketch.update(self.values[:NUM_VALUES * 3 // 5])
+		other.update(self.values[NUM_VALUES * 3 // 5:])
+		sketch.merge(other)
+		self.check(sketch, self.values, RANK_ERROR, MEAN_ERROR)
+
+	def test_exact(self):
+		# no level is compacted while the sketch holds at most size values, so every answer is exact
+		values = np.random.default_rng(2).integers(0, 10, size=SIZE // 2).astype(float)
+		sketch, other = QuantileSketch(SIZE), QuantileSketch(SIZE)
+		sketch.update(values[:200])
+		other.update(values[200:])
+		sketch.merge(other)
+		self.check(sketch, values, 0, 1e-12)
+		self.assertEqual(sketch.rank(5), np.count_nonzero(values < 5))
+		self.assertEqual(sketch.rank(5, side='right'), np.count_nonzero(values <= 5))
+
+
+if __name__ == '__main__':
+	unittest.main()